@@ -1,23 +1,31 @@
 # app.py
 import streamlit as st
 from utils.util import (
-  upload_file_to_gemini,
-  poll_file_processing,
-  generate_metadata,
-  generate_transcription,
-  remove_markdown,
-  parse_bounding_boxes,
-  convert_normalized_to_pixel,
+  TRANSCRIPTION_PROMPT,
   draw_bounding_boxes
 )
-from utils.model import load_model
+from utils.model import configure, load_model
+from utils.image_prep import DETECTION_IMAGE_QUALITY, DETECTION_MAX_EDGE
+from utils.response_cache import get_response_cache, request_key
+from utils.video_detection import SCENE_CHANGE_THRESHOLD
+from utils.media import save_upload
+from utils.ensemble import build_members
+from utils.tiling import TILE_OVERLAP, TILE_SIZE, TiledImage, preview_image
+from utils.scheduler import get_scheduler
+from utils.tracing import get_tracer
+from utils.service import ServiceError, get_service
+from utils.prompts import VideoAnalysis
+from utils.jobs import get_job_queue
+from utils.file_manager import filter_files, get_file_inventory, INVENTORY_COLUMNS
 from PIL import Image
-from typing import TypedDict, Optional, List, Dict, Any
-from utils.util import upload_file_to_gemini
-import google.generativeai as genai
+import json
+import time
+import os
+import tempfile
 
 def main():
   st.set_page_config(page_title="LaciaVisionLLM", layout="wide")
+  configure()
   st.title("LaciaVisionLLM")
 
   # Tab selection using radio
@@ -32,16 +40,64 @@ def main():
   elif tab == "File API":
       file_api_tab()
 
-def video_tab():
+  with st.sidebar.expander("API scheduler"):
+      stats = get_scheduler().stats()
+      st.write(f"Queued: {stats['queue_depth']['interactive']} interactive, {stats['queue_depth']['batch']} batch")
+      st.write(f"In flight: {stats['in_flight']}")
+      st.write(f"Wait: {stats['wait_mean']:.2f}s mean, {stats['wait_p95']:.2f}s p95")
+      st.write(f"Retries: {stats['retries']} ({stats['throttled']} throttled), failed: {stats['failed']}")
+
+  if st.sidebar.checkbox("Show pipeline traces"):
+      tracer = get_tracer()
+      st.subheader("Pipeline traces")
+      summary = tracer.summary()
+      if summary:
+          st.dataframe(summary, use_container_width=True, hide_index=True)
+          st.dataframe(tracer.spans(limit=50), use_container_width=True, hide_index=True)
+          st.download_button("Download Prometheus metrics", tracer.prometheus(), file_name="metrics.prom")
+      else:
+          st.info("No spans recorded yet.")
+
+@st.fragment(run_every=2)
+def job_progress(job_id: str):
+  """Polls a running job; reruns the page once it has finished."""
+  job = get_job_queue().get(job_id)
+  if job is None or job.finished:
+      st.rerun()
+  st.progress(job.progress, text=f"{job.name}: {job.message}")
+  st.caption("The job keeps running if you leave this page; come back or upload the same file to see the result.")
+
+def show_job(job_id: str, render_result):
+  """Shows the progress of a background job, or its result or error once it has finished."""
+  job = get_job_queue().get(job_id)
+  if job is None:
+      st.warning("This job no longer exists.")
+  elif job.status == "failed":
+      st.error(f"{job.name}: {job.error}")
+  elif job.status == "done":
+      render_result(job.result)
+  else:
+      job_progress(job_id)
+
+def select_recent_job(task: str, state_key: str):
+  """Lets the user reopen one of the latest jobs of a task."""
+  jobs = get_job_queue().recent(task=task, limit=10)
+  if not jobs:
+      return
+  with st.expander("Recent jobs"):
+      labels = {
+          job.id: f"{job.name} · {job.status} · {time.strftime('%Y-%m-%d %H:%M', time.localtime(job.created_at))}"
+          for job in jobs
+      }
+
+      def reopen():
+          st.session_state[state_key] = st.session_state[f"{state_key}_recent"]
+
+      st.radio(
+          "Show job", list(labels), format_func=labels.get, index=None, key=f"{state_key}_recent", on_change=reopen
+      )
 
-  # Define the structure for Video Analysis metadata
-  class VideoAnalysis(TypedDict):
-      name: str
-      title: str
-      total_duration: float  # Duration in seconds
-      summary: str
-      small_summary: str
-      tags: Optional[List[str]]
+def video_tab():
 
   def display_metadata(metadata: VideoAnalysis):
       """Displays the generated metadata in a user-friendly format."""
@@ -56,8 +112,6 @@ def video_tab():
   st.header("📹 Video Metadata and Summary Generation")
   st.write("Upload a video to analyze its content and automatically generate metadata and summary.")
 
-  model = load_model(type="video", schemaType=VideoAnalysis)
-
   uploaded_file = st.file_uploader("Upload a video file", type=["mp4", "mov", "avi", "mkv"])
 
   if uploaded_file is not None:
@@ -65,71 +119,55 @@ def video_tab():
       with col2:
           st.video(uploaded_file)
       uploaded_file.seek(0)
+      bypass_cache = st.checkbox("Bypass response cache", key="video_bypass_cache")
+      windowed = st.checkbox("Windowed analysis (analyze time windows in parallel)")
+      if windowed:
+          window_cols = st.columns(2)
+          with window_cols[0]:
+              window_minutes = st.number_input("Window length (minutes)", min_value=1, max_value=60, value=5)
+          with window_cols[1]:
+              max_workers = st.number_input("Parallel windows", min_value=1, max_value=16, value=4)
       if st.button("Analyze Video"):
-          with st.spinner('Uploading video...'):
-              uploaded_genai_file = upload_file_to_gemini(uploaded_file)
-              if uploaded_genai_file:
-                  st.success("File Upload successful!")
-              if uploaded_genai_file is None:
-                  st.error("Failed to upload the video.")
-                  return
-
-          processed_file = poll_file_processing(uploaded_genai_file)
-          if processed_file is None:
-              st.error("Video processing failed.")
-              return
-
-          with st.spinner('Generating metadata...'):
-              metadata = generate_metadata(model, processed_file)
-              if metadata:
-                  st.success("Metadata generation successful!")
-                  display_metadata(metadata)
+          params = {'windowed': windowed, 'use_cache': not bypass_cache}
+          if windowed:
+              params.update(window_seconds=window_minutes * 60, max_workers=max_workers)
+          job = get_job_queue().submit("analyze_video", uploaded_file, params, rerun=bypass_cache)
+          st.session_state.video_job = job.id
   else:
       st.info("Please upload a video file to begin analysis.")
 
+  def render_result(result):
+      for index, error in result['failed']:
+          st.warning(f"Window {index + 1} failed, analyze again to retry it: {error}")
+      if result['windows'] > 1:
+          st.success(f"Metadata generation successful! ({result['windows']} windows, {result['cached']} from cache)")
+      else:
+          st.success("Metadata generation successful!")
+      display_metadata(result['metadata'])
+
+  select_recent_job("analyze_video", "video_job")
+  if st.session_state.get("video_job"):
+      show_job(st.session_state.video_job, render_result)
+
 
 def image_tab():
-    @st.cache_resource
     def get_model():
         model = load_model(type=None, schemaType=None)
         return model
 
-    def process_image(image: Image.Image, object_name: str, model):
-        # Define the dynamic prompt with the user-specified object
-        prompt = f""" 
-        You are given an image. Identify all {object_name} in the image and provide their bounding boxes. 
-        Return ONLY a valid JSON array in the exact format shown below. 
-        return specific name , let say if it's a dog and you know the dog breed name return that.
-        Do NOT include any additional text, explanations, comments, trailing commas, or markdown formatting such as code blocks.
-        Use this JSON schema:
-        [
-            {{
-                "name": "string",
-                "ymin": float,
-                "xmin": float,
-                "ymax": float,
-                "xmax": float
-            }}
-        ]
-        """
+    def process_image(image: Image.Image, object_name: str, model, use_cache: bool = True, preprocess=None, stats=None):
+        service = get_service()
         try:
-            response = model.generate_content([image, prompt])
-        except Exception as e:
-            st.error(f"Error generating content from the model: {e}")
-            return None
-
-        final_response = remove_markdown(response.text)
-        
-        try:
-            bounding_boxes = parse_bounding_boxes(final_response)
-        except ValueError as ve:
-            st.error(f"Error parsing bounding boxes: {ve}")
+            return service.run(
+                service.detect(model, image, object_name, use_cache=use_cache, preprocess=preprocess, stats=stats)
+            )
+        except ServiceError as e:
+            if e.code == "invalid_response":
+                st.error(f"Error parsing bounding boxes: {e.message}")
+            else:
+                st.error(f"Error generating content from the model: {e.message}")
             return None
 
-        image_width, image_height = image.size
-        converted_boxes = convert_normalized_to_pixel(bounding_boxes, image_width, image_height)
-        return converted_boxes
-
     st.header("📸 Object Detection")
     st.write("""
     Upload an image or use your camera to capture one, then specify the object you want to detect.
@@ -143,20 +181,65 @@ def image_tab():
     input_method = st.sidebar.radio(
         "Select Image Input Method",
         # ("Upload Image", "Use Camera")
-        ("Upload Image")
+        ("Upload Image", "Batch Images", "Video")
     )
 
     # Initialize uploaded_image as None
     uploaded_image = None
+    batch_files = []
+    tiled = False
+    ensemble = False
 
     if input_method == "Upload Image":
-        uploaded_file = st.sidebar.file_uploader("📂 Choose an image...", type=["jpg", "jpeg", "png"])
+        uploaded_file = st.sidebar.file_uploader("📂 Choose an image...", type=["jpg", "jpeg", "png", "tif", "tiff"])
+        tiled = st.sidebar.checkbox("Tiled detection (large images)")
+        if tiled:
+            tile_size = st.sidebar.number_input("Tile size (px)", min_value=256, max_value=4096, value=TILE_SIZE, step=128)
+            tile_overlap = st.sidebar.number_input("Tile overlap (px)", min_value=0, max_value=1024, value=TILE_OVERLAP, step=32)
+            max_workers = st.sidebar.number_input("Concurrent requests", min_value=1, max_value=32, value=4)
+        else:
+            ensemble = st.sidebar.checkbox("Ensemble detection (fuse several requests)")
+        if ensemble:
+            ensemble_size = st.sidebar.number_input("Ensemble members", min_value=2, max_value=9, value=3)
+            min_votes = st.sidebar.slider(
+                "Minimum agreeing members", min_value=1, max_value=int(ensemble_size), value=(int(ensemble_size) + 1) // 2
+            )
         if uploaded_file is not None:
             try:
-                uploaded_image = Image.open(uploaded_file).convert("RGB")
-                st.image(uploaded_image, caption='🖼️ Uploaded Image', use_container_width=True)
+                if tiled:
+                    # Only a reduced preview is decoded here; utils.tiling reads the tiles
+                    with TiledImage(uploaded_file) as tiled_image:
+                        image_size = tiled_image.size
+                    uploaded_file.seek(0)
+                    uploaded_image = preview_image(uploaded_file)
+                    uploaded_file.seek(0)
+                    st.image(uploaded_image, caption=f'🖼️ Uploaded Image ({image_size[0]}×{image_size[1]})', use_container_width=True)
+                else:
+                    uploaded_image = Image.open(uploaded_file).convert("RGB")
+                    st.image(uploaded_image, caption='🖼️ Uploaded Image', use_container_width=True)
             except Exception as e:
                 st.error(f"❌ Error opening image: {e}")
+    elif input_method == "Batch Images":
+        batch_files = st.sidebar.file_uploader(
+            "📂 Choose images...", type=["jpg", "jpeg", "png"], accept_multiple_files=True
+        ) or []
+        images_per_request = st.sidebar.number_input("Images per request", min_value=1, max_value=16, value=4)
+        max_workers = st.sidebar.number_input("Concurrent requests", min_value=1, max_value=32, value=4)
+        if batch_files:
+            st.write(f"🗂️ {len(batch_files)} images selected.")
+    elif input_method == "Video":
+        video_file = st.sidebar.file_uploader("📂 Choose a video...", type=["mp4", "mov", "avi", "mkv"])
+        scene_threshold = st.sidebar.slider(
+            "Scene change threshold", min_value=0.05, max_value=1.0, value=SCENE_CHANGE_THRESHOLD, step=0.05,
+            help="Frames that differ at least this much from the previous one are sent to the model."
+        )
+        max_keyframe_interval = st.sidebar.number_input(
+            "Force a keyframe every (s, 0 = never)", min_value=0.0, max_value=600.0, value=0.0, step=5.0
+        )
+        max_workers = st.sidebar.number_input("Concurrent requests", min_value=1, max_value=32, value=4)
+        if video_file is not None:
+            st.video(video_file)
+            video_file.seek(0)
     # elif input_method == "Use Camera":
     #     captured_image = st.sidebar.camera_input("📸 Capture an image")
     #     if captured_image is not None:
@@ -174,9 +257,223 @@ def image_tab():
     else:
         object_name = "all"  # Set object_name to "all" when detect all is checked
 
+    with st.sidebar.expander("🗜️ Image Preprocessing"):
+        max_edge = st.number_input("Max edge (px, 0 = full size)", min_value=0, max_value=8192, value=DETECTION_MAX_EDGE, step=128)
+        image_format = st.selectbox("Encoding", ["JPEG", "WEBP", "PNG"])
+        quality = st.slider("Quality", min_value=40, max_value=100, value=DETECTION_IMAGE_QUALITY)
+    preprocess = {'max_edge': max_edge, 'image_format': image_format, 'quality': quality}
+
+    bypass_cache = st.sidebar.checkbox("Bypass response cache")
+    stream_boxes = input_method == "Upload Image" and not (tiled or ensemble) and st.sidebar.checkbox("Stream detections as they arrive", value=True)
     detect_button = st.sidebar.button("🚀 Detect Objects")
 
-    if detect_button:
+    if detect_button and input_method == "Batch Images":
+        if not batch_files:
+            st.error("⚠️ Please upload at least one image.")
+            st.stop()
+        if not detect_all and not object_name.strip():
+            st.error("⚠️ Please enter a valid object name to detect.")
+            st.stop()
+
+        model = get_model()
+        progress_bar = st.progress(0.0, text=f"Detecting objects in {len(batch_files)} images...")
+
+        def update_progress(done, total):
+            progress_bar.progress(done / total, text=f"Processed {done} of {total} images")
+
+        try:
+            images = [Image.open(f) for f in batch_files]
+        except Exception as e:
+            st.error(f"❌ Error opening image: {e}")
+            st.stop()
+        service = get_service()
+        try:
+            result = service.run_with_progress(
+                lambda progress: service.detect_batch(
+                    model,
+                    images,
+                    object_name,
+                    images_per_request=images_per_request,
+                    max_workers=max_workers,
+                    use_cache=not bypass_cache,
+                    preprocess=preprocess,
+                    progress_callback=progress
+                ),
+                update_progress
+            )
+        except ServiceError as e:
+            st.error(f"❌ Error during batch detection: {e.message}")
+            st.stop()
+
+        metric_cols = st.columns(3)
+        metric_cols[0].metric("Images", len(batch_files))
+        metric_cols[1].metric("Throughput", f"{result['images_per_second']:.2f} img/s")
+        metric_cols[2].metric("Failed", len(result['failed']))
+        for index, error in result['failed']:
+            st.warning(f"⚠️ {batch_files[index].name}: {error}")
+
+        summary = [
+            {'image': f.name, 'objects': len(boxes) if boxes is not None else None}
+            for f, boxes in zip(batch_files, result['boxes'])
+        ]
+        st.dataframe(summary, use_container_width=True, hide_index=True)
+        st.download_button(
+            "Download boxes (JSON)",
+            data=json.dumps({f.name: boxes for f, boxes in zip(batch_files, result['boxes'])}, indent=2),
+            file_name="detections.json",
+            mime="application/json"
+        )
+    elif detect_button and tiled:
+        if uploaded_image is None:
+            st.error("⚠️ Please upload an image.")
+            st.stop()
+        if not detect_all and not object_name.strip():
+            st.error("⚠️ Please enter a valid object name to detect.")
+            st.stop()
+
+        model = get_model()
+        progress_bar = st.progress(0.0, text="Detecting objects in tiles...")
+
+        def update_progress(done, total):
+            progress_bar.progress(done / total, text=f"Processed {done} of {total} tiles")
+
+        service = get_service()
+        try:
+            result = service.run_with_progress(
+                lambda progress: service.detect_tiled(
+                    model,
+                    uploaded_file,
+                    object_name,
+                    tile_size=tile_size,
+                    overlap=tile_overlap,
+                    max_workers=max_workers,
+                    use_cache=not bypass_cache,
+                    preprocess=preprocess,
+                    progress_callback=progress
+                ),
+                update_progress
+            )
+        except ServiceError as e:
+            st.error(f"❌ Error during tiled detection: {e.message}")
+            st.stop()
+        progress_bar.empty()
+
+        metric_cols = st.columns(4)
+        metric_cols[0].metric("Tiles", result['tiles'])
+        metric_cols[1].metric("Objects", len(result['boxes']))
+        metric_cols[2].metric("Failed tiles", len(result['failed']))
+        metric_cols[3].metric("Elapsed", f"{result['elapsed']:.1f} s")
+        for tile, error in result['failed']:
+            st.warning(f"⚠️ Tile at ({tile[0]}, {tile[1]}): {error}")
+
+        # Boxes are in full-resolution pixels; draw them on the preview
+        scale = uploaded_image.width / result['size'][0]
+        preview_boxes = [
+            {**b, 'xmin': b['xmin'] * scale, 'ymin': b['ymin'] * scale, 'xmax': b['xmax'] * scale, 'ymax': b['ymax'] * scale}
+            for b in result['boxes']
+        ]
+        st.image(draw_bounding_boxes(uploaded_image, preview_boxes), caption='🖼️ Annotated Image', use_container_width=True)
+        st.download_button(
+            "Download boxes (JSON)",
+            data=json.dumps(result['boxes'], indent=2),
+            file_name="detections.json",
+            mime="application/json"
+        )
+    elif detect_button and ensemble:
+        if uploaded_image is None:
+            st.error("⚠️ Please upload an image.")
+            st.stop()
+        if not detect_all and not object_name.strip():
+            st.error("⚠️ Please enter a valid object name to detect.")
+            st.stop()
+
+        with st.spinner(f"🔍 Running {ensemble_size} detections in parallel..."):
+            service = get_service()
+            try:
+                members = build_members(object_name, size=ensemble_size)
+                result = service.run(service.detect_ensemble(
+                    members, uploaded_image, object_name, use_cache=not bypass_cache, preprocess=preprocess, min_votes=min_votes
+                ))
+            except Exception as e:
+                st.error(f"❌ Error during ensemble detection: {getattr(e, 'message', e)}")
+                st.stop()
+
+        slowest = max(member['seconds'] for member in result['members'])
+        metric_cols = st.columns(3)
+        metric_cols[0].metric("Objects", len(result['boxes']))
+        metric_cols[1].metric("Elapsed", f"{result['elapsed']:.2f} s", f"slowest member {slowest:.2f} s", delta_color="off")
+        metric_cols[2].metric("Failed members", sum(member['error'] is not None for member in result['members']))
+        with st.expander("Ensemble members"):
+            st.dataframe(result['members'], use_container_width=True, hide_index=True)
+
+        if result['boxes']:
+            labeled_boxes = [{**box, 'name': f"{box['name']} {box['confidence']:.0%}"} for box in result['boxes']]
+            st.image(draw_bounding_boxes(uploaded_image, labeled_boxes), caption='🖼️ Fused Detections', use_container_width=True)
+            st.dataframe(result['boxes'], use_container_width=True, hide_index=True)
+        else:
+            st.warning("⚠️ The ensemble did not agree on any object.")
+    elif detect_button and input_method == "Video":
+        if video_file is None:
+            st.error("⚠️ Please upload a video.")
+            st.stop()
+        if not detect_all and not object_name.strip():
+            st.error("⚠️ Please enter a valid object name to detect.")
+            st.stop()
+
+        model = get_model()
+        progress_bar = st.progress(0.0, text="Finding keyframes...")
+
+        def update_progress(done, total):
+            stage = "Finding keyframes" if done * 2 <= total else "Tracking boxes"
+            progress_bar.progress(min(1.0, done / total), text=f"{stage}...")
+
+        with tempfile.TemporaryDirectory() as work_dir:
+            source = save_upload(video_file, work_dir)
+            output_video = os.path.join(work_dir, "annotated.mp4")
+            service = get_service()
+            try:
+                result = service.run_with_progress(
+                    lambda progress: service.detect_video(
+                        model,
+                        source,
+                        object_name,
+                        scene_threshold=scene_threshold,
+                        max_keyframe_interval=max_keyframe_interval,
+                        max_workers=max_workers,
+                        use_cache=not bypass_cache,
+                        preprocess=preprocess,
+                        output_video=output_video,
+                        progress_callback=progress
+                    ),
+                    update_progress
+                )
+            except ServiceError as e:
+                st.error(f"❌ Error detecting objects in the video: {e.message}")
+                st.stop()
+            with open(output_video, 'rb') as f:
+                annotated_video = f.read()
+        progress_bar.empty()
+
+        metric_cols = st.columns(4)
+        metric_cols[0].metric("Frames", result['frame_count'])
+        metric_cols[1].metric("Model calls", len(result['keyframes']))
+        metric_cols[2].metric("Failed", len(result['failed']))
+        metric_cols[3].metric("Elapsed", f"{result['elapsed']:.1f} s")
+        for index, error in result['failed']:
+            st.warning(f"⚠️ Keyframe at {index / result['fps']:.1f} s: {error}")
+
+        st.video(annotated_video)
+        download_cols = st.columns(2)
+        download_cols[0].download_button(
+            "Download annotated video", data=annotated_video, file_name="detections.mp4", mime="video/mp4"
+        )
+        download_cols[1].download_button(
+            "Download boxes per frame (JSON)",
+            data=json.dumps(result['frames']),
+            file_name="detections.json",
+            mime="application/json"
+        )
+    elif detect_button:
         if uploaded_image is not None:
             if not detect_all and not object_name.strip():
                 st.error("⚠️ Please enter a valid object name to detect.")
@@ -185,13 +482,58 @@ def image_tab():
             with st.spinner("🔄 Loading the model..."):
                 model = get_model()
 
-            with st.spinner("🔍 Detecting objects..."):
-                converted_boxes = process_image(uploaded_image, object_name, model)
+            request_stats = {}
+            if stream_boxes:
+                preview = uploaded_image.copy()
+                preview.thumbnail((1280, 1280))
+                scale = preview.width / uploaded_image.width
+                placeholder = st.empty()
+                status = st.empty()
+                converted_boxes = []
+                service = get_service()
+                try:
+                    for box in service.iterate(service.stream_detect(
+                        model, uploaded_image, object_name, use_cache=not bypass_cache, preprocess=preprocess
+                    )):
+                        converted_boxes.append(box)
+                        preview_boxes = [
+                            {**b, 'xmin': b['xmin'] * scale, 'ymin': b['ymin'] * scale,
+                             'xmax': b['xmax'] * scale, 'ymax': b['ymax'] * scale}
+                            for b in converted_boxes
+                        ]
+                        placeholder.image(draw_bounding_boxes(preview, preview_boxes), caption='🖼️ Detecting...', use_container_width=True)
+                        status.caption(f"🔍 {len(converted_boxes)} objects found so far...")
+                except ServiceError as e:
+                    st.error(f"❌ Error during streaming detection: {e.message}")
+                    st.stop()
+                placeholder.empty()
+                status.empty()
+            else:
+                with st.spinner("🔍 Detecting objects..."):
+                    converted_boxes = process_image(
+                        uploaded_image, object_name, model, use_cache=not bypass_cache, preprocess=preprocess, stats=request_stats
+                    )
 
             if converted_boxes is None:
                 st.error("❌ An error occurred during object detection.")
                 st.stop()
 
+            if request_stats.get('hash_hit'):
+                st.caption("♻️ Matched a near-duplicate of an earlier image; the model was not called.")
+            elif request_stats:
+                metric_cols = st.columns(3)
+                saved = request_stats['bytes_saved']
+                metric_cols[0].metric(
+                    "Sent", f"{request_stats['sent_bytes'] / 1024:.0f} KB",
+                    f"{-saved / 1024:+.0f} KB vs unprocessed upload" if saved is not None else None,
+                    delta_color="inverse"
+                )
+                metric_cols[1].metric("Sent size", f"{request_stats['sent_size'][0]}×{request_stats['sent_size'][1]}")
+                metric_cols[2].metric(
+                    "Latency", f"{request_stats['request_seconds']:.2f} s", f"+{request_stats['encode_seconds'] * 1000:.0f} ms encode",
+                    delta_color="off"
+                )
+
             if converted_boxes:
                 annotated_image = draw_bounding_boxes(uploaded_image.copy(), converted_boxes, output_path=None)
                 st.image(annotated_image, caption='🖼️ Annotated Image', use_container_width=True)
@@ -225,29 +567,89 @@ def audio_tab():
 
   if uploaded_audio is not None:
       st.audio(uploaded_audio, format='audio/mp3')
+      bypass_cache = st.checkbox("Bypass response cache", key="audio_bypass_cache")
+      long_audio = st.checkbox("Long audio mode (transcribe overlapping segments in parallel)")
+      if long_audio:
+          segment_cols = st.columns(3)
+          with segment_cols[0]:
+              segment_minutes = st.number_input("Segment length (minutes)", min_value=1, max_value=60, value=10)
+          with segment_cols[1]:
+              overlap_seconds = st.number_input("Overlap (seconds)", min_value=0, max_value=120, value=20)
+          with segment_cols[2]:
+              max_workers = st.number_input("Parallel segments", min_value=1, max_value=16, value=4)
+      else:
+          stream_output = st.checkbox(
+              "Stream transcript while it is generated", value=False,
+              help="Streaming runs in this page and stops when the page reruns; otherwise a background job transcribes."
+          )
       if st.button("Transcribe Audio"):
-          with st.spinner('Uploading audio...'):
+          if long_audio or not stream_output:
+              params = {'long_audio': long_audio, 'use_cache': not bypass_cache}
+              if long_audio:
+                  params.update(
+                      segment_seconds=segment_minutes * 60, overlap_seconds=overlap_seconds, max_workers=max_workers
+                  )
+              job = get_job_queue().submit("transcribe_audio", uploaded_audio, params, rerun=bypass_cache)
+              st.session_state.audio_job = job.id
+          else:
+              service = get_service()
               try:
-                  uploaded_genai_file = upload_file_to_gemini(uploaded_audio)
-                  if uploaded_genai_file:
-                      st.success("File Upload successful!")
-              except Exception as e:
-                  st.error(f"Error uploading audio: {e}")
+                  with st.spinner('Uploading audio...'):
+                      uploaded_genai_file = service.run(service.upload(uploaded_audio))
+                  st.success("File Upload successful!")
+                  with st.spinner('Processing file...'):
+                      processed_file = service.run(service.wait_active(uploaded_genai_file))
+                  st.success(" File processing completed.")
+              except ServiceError as e:
+                  st.error(f"Audio processing failed ({e.stage}): {e.message}")
                   return
 
-          processed_file = poll_file_processing(uploaded_genai_file)
-          if processed_file is None:
-              st.error("Audio processing failed.")
-              return
+              cached = None
+              if not bypass_cache:
+                  cached = get_response_cache().get(request_key(model, [processed_file, TRANSCRIPTION_PROMPT]))
+              if cached:
+                  st.success("Transcription successful!")
+                  st.text_area("Transcription", cached.strip(), height=300)
+                  return
 
-          with st.spinner('Transcribing audio...'):
-              transcription = generate_transcription(model, processed_file)
+              # Any widget interaction reruns the script, which closes the stream
+              st.button("Stop transcription")
+              placeholder = st.empty()
+              metrics = {}
+              transcription = ""
+              try:
+                  for text in service.iterate(service.stream_transcribe(model, processed_file, metrics=metrics)):
+                      transcription += text
+                      placeholder.markdown(transcription)
+              except ServiceError as e:
+                  st.error(f"Error generating transcription: {e.message}")
+                  return
+              placeholder.text_area("Transcription", transcription.strip(), height=300)
               if transcription:
                   st.success("Transcription successful!")
-                  st.text_area("Transcription", transcription, height=300)
+                  metric_cols = st.columns(3)
+                  metric_cols[0].metric("Time to first token", f"{metrics['time_to_first_token']:.2f} s")
+                  metric_cols[1].metric("Total time", f"{metrics['total_time']:.2f} s")
+                  metric_cols[2].metric("Chunks", metrics['chunks'])
+              else:
+                  st.error("No response received from the model.")
+              return
   else:
       st.info("Please upload an audio file to begin transcription.")
 
+  def render_result(result):
+      for index, error in result['failed']:
+          st.warning(f"Segment {index + 1} could not be transcribed, transcribe again to retry it: {error}")
+      if result['segments'] > 1:
+          st.success(f"Transcription successful! ({result['segments']} segments)")
+      else:
+          st.success("Transcription successful!")
+      st.text_area("Transcription", result['transcript'], height=300)
+
+  select_recent_job("transcribe_audio", "audio_job")
+  if st.session_state.get("audio_job"):
+      show_job(st.session_state.audio_job, render_result)
+
 
 def file_api_tab():
 
@@ -255,25 +657,41 @@ def file_api_tab():
   st.write("List and manage files uploaded to the API.")
 
   # List files
-  if st.button("List Files"):
+  service = get_service()
+  inventory = get_file_inventory()
+  list_cols = st.columns([1, 1, 4])
+  with list_cols[0]:
+      if st.button("List Files"):
+          st.session_state.show_inventory = True
+  with list_cols[1]:
+      refresh = st.button("Refresh")
+      if refresh:
+          st.session_state.show_inventory = True
+
+  if st.session_state.get("show_inventory"):
       st.subheader("Uploaded Files:")
       try:
-          files = genai.list_files()
-          file_list = list(files)  # Convert generator to list
+          controls = st.columns(4)
+          with controls[0]:
+              sort_by = st.selectbox("Sort by", INVENTORY_COLUMNS, index=INVENTORY_COLUMNS.index("create_time"))
+          with controls[1]:
+              descending = st.checkbox("Descending", value=True)
+          with controls[2]:
+              page_size = st.selectbox("Rows per page", [25, 50, 100, 250], index=1)
+          with controls[3]:
+              page_number = st.number_input("Page", min_value=1, value=1, step=1)
+
+          result = service.run(
+              service.file_page(page_number, page_size, sort_by=sort_by, descending=descending, refresh=refresh)
+          )
 
           # Check if the list has files
-          if len(file_list) > 0:
-              cols = st.columns(2)  # Create two columns
-              with cols[0]:
-                  st.markdown("**__Display Name__**")
-              with cols[1]:
-                  st.write("**__File Name__**")
-
-              for f in file_list:
-                  with cols[0]:
-                      st.write(f"📄 {f.display_name}")  # Display Name
-                  with cols[1]:
-                      st.write(f"📄 {f.name}")  # File Name
+          if result['total'] > 0:
+              st.dataframe(result['rows'], column_order=INVENTORY_COLUMNS, use_container_width=True, hide_index=True)
+              st.caption(
+                  f"Page {result['page']} of {result['pages']} · {result['total']} files · "
+                  f"listed {int(time.time() - inventory.fetched_at)}s ago"
+              )
           else:
               st.markdown("<span style='color:red;'>No files found.</span>", unsafe_allow_html=True)  # Display error if no files
       except Exception as e:
@@ -285,29 +703,50 @@ def file_api_tab():
   if st.button("Delete File"):
       if file_name_to_delete.strip():
           try:
-              myfile = genai.get_file(file_name_to_delete)
-              myfile.delete()
+              service.run(service.delete_file(file_name_to_delete.strip()))
               st.success(f"File '{file_name_to_delete}' has been deleted.")
           except Exception as e:
               st.error(f"Error deleting file: {e}")
       else:
           st.error("Please enter a valid file name.")
 
-  # Option to delete all files
+  # Option to delete all (or a filtered subset of) files
   st.subheader("Delete All Files")
-  delete_all = st.checkbox("Delete all files")
+  filter_cols = st.columns(2)
+  with filter_cols[0]:
+      older_than_hours = st.number_input("Only files older than (hours, 0 = any age)", min_value=0.0, value=0.0, step=1.0)
+  with filter_cols[1]:
+      name_pattern = st.text_input("Only names matching (e.g. *.mp4)", value="")
+  delete_all = st.checkbox("Delete all matching files")
   if delete_all:
       if st.button("Confirm Delete All"):
-          with st.spinner("Deleting all files..."):
+          with st.spinner("Deleting files..."):
               try:
-                  files = genai.list_files()
-                  for f in files:
-                      myfile = genai.get_file(f.name)
-                      myfile.delete()
-                  st.success("All files have been deleted.")
+                  files = filter_files(
+                      service.run(service.list_files()),
+                      older_than_hours=older_than_hours or None,
+                      name_pattern=name_pattern.strip() or None
+                  )
+                  if not files:
+                      st.info("No files match the selected filters.")
+                      return
+
+                  progress_bar = st.progress(0.0, text=f"Deleting {len(files)} files...")
+
+                  def update_progress(done, total):
+                      progress_bar.progress(done / total, text=f"Deleted {done} of {total} files")
+
+                  summary = service.run_with_progress(
+                      lambda progress: service.delete_files(files, progress_callback=progress), update_progress
+                  )
+                  if summary['failed']:
+                      st.warning(f"Deleted {len(summary['deleted'])} files, {len(summary['failed'])} failed.")
+                      for name, error in summary['failed']:
+                          st.write(f"❌ {name}: {error}")
+                  else:
+                      st.success(f"All {len(summary['deleted'])} matching files have been deleted.")
               except Exception as e:
                   st.error(f"Error deleting all files: {e}")
 
-
 if __name__ == "__main__":
   main()
\ No newline at end of file
@@ -1,17 +1,33 @@
 import streamlit as st
 import os
 import json
+from utils.context_cache import get_context_cache
 from utils.lacia_prompt import LaciaAssessment
-import google.generativeai as genai
-from dotenv import load_dotenv
+from utils.scheduler import scheduled
 
 class LaciaVideoAssessment:
     def __init__(self):
-        load_dotenv()
-        genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
-        self.model = genai.GenerativeModel('gemini-1.5-pro-latest')
         self.checklists_file = 'lacia_checklists.json'
 
+    def context_model(self, selected_checklist):
+        """
+        Returns the model with the LACia system instruction and the checklist as cached context.
+
+        The context is cached on the service once per checklist and reused by
+        every later assessment; if it cannot be cached, it is sent inline.
+        """
+        checklist_context = f"""Checklist: {selected_checklist['name']}
+Procedimento: {selected_checklist['procedure']}
+
+Itens do Checklist:
+{chr(10).join([f"- {item}" for item in selected_checklist['items']])}
+"""
+        return get_context_cache().get(
+            LaciaAssessment.prompt,
+            [checklist_context],
+            display_name=f"lacia-{selected_checklist['name']}"
+        )
+
     def load_checklists(self):
         """Load checklists from JSON file."""
         if os.path.exists(self.checklists_file):
@@ -27,16 +43,9 @@ class LaciaVideoAssessment:
         :param selected_checklist: Selected checklist details
         :return: Markdown assessment
         """
-        # Prepare the prompt with checklist details
+        # The LACia instruction and the checklist come from the cached context
         prompt = f"""
-Você é LACia, avaliadora de competências médicas. 
-Você receberá um vídeo de um procedimento médico e um checklist para avaliação.
-
-Checklist Selecionado: {selected_checklist['name']}
-Procedimento: {selected_checklist['procedure']}
-
-Itens do Checklist:
-{chr(10).join([f"- {item}" for item in selected_checklist['items']]}
+Você receberá um vídeo de um procedimento médico para avaliação com o checklist "{selected_checklist['name']}".
 
 Por favor, analise o vídeo e forneça uma avaliação detalhada seguindo os critérios do checklist.
 Gere um relatório em markdown que inclua:
@@ -50,7 +59,8 @@ Gere um relatório em markdown que inclua:
         # Generate assessment using Gemini
         try:
             # Note: This is a placeholder. In a real scenario, you'd need to process the video
-            response = self.model.generate_content(prompt)
+            context = self.context_model(selected_checklist)
+            response = scheduled('generate', context.model.generate_content, context.contents + [prompt])
             
             # Convert response to markdown
             markdown_assessment = f"""
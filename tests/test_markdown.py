@@ -0,0 +1,72 @@
+import json
+
+import pytest
+
+from utils.markdown import _reference_remove_markdown, extract_json_block, remove_markdown
+
+CORPUS = [
+    "",
+    "Plain sentence without any markup.",
+    "# Title\n## Subtitle\nText after #hashtag and a ### trailing header",
+    "**bold** and __bold__ and *italic* and _italic_ and ~~struck~~",
+    "***bold italic*** and **nested _emphasis_ inside** and *unclosed",
+    "a * b * c and 2 * 3 = 6 and snake_case_name and ~single tilde~",
+    "**spans\nlines** and _also\nthis_",
+    "```python\nprint('hi')\n```\nafter",
+    "```\nno language\n```",
+    "```json\n[{\"name\": \"dog\"}]\n```\n```\nsecond\n```",
+    "```unterminated\ncode",
+    "Inline `code`, ``double``, ```triple``` and a lone ` tick",
+    "[link](https://example.com) and ![image](img.png) and [broken](link",
+    "[a](b)[c](d) ![](empty.png) [nested [brackets]](x)",
+    "> quoted\n>> double quoted\nnot > quoted",
+    "---\n___\n***\ntext\n----",
+    "1. first\n2. second\n- dash\n+ plus\n* star\n  * nested\n    - deeper\n10. tenth",
+    "-not a list\n1.not a list\n3.14 is pi",
+    "**Speaker A**: We _really_ need the [report](https://example.com/r) by Friday.\n"
+    "> Quoted remark with `inline code` and ~~struck~~ text.\n\n1. First item\n- second item\n",
+    "été **café** _naïve_ — [über](u) \U0001F600",
+    "*" * 2000,
+    "_" * 2000,
+    "~" * 2001,
+    "[" * 2000,
+    "[" * 1000 + "](" * 1000,
+    "`" * 2000,
+    "#" * 2000 + " x",
+    "**a" * 1000,
+    "- " * 1000,
+    "\n".join(["* item"] * 500),
+]
+
+
+@pytest.mark.parametrize("text", CORPUS)
+def test_remove_markdown_matches_reference(text):
+    assert remove_markdown(text) == _reference_remove_markdown(text)
+
+
+JSON_RESPONSES = [
+    '[{"name": "dog", "ymin": 1, "xmin": 2, "ymax": 3, "xmax": 4}]',
+    '```json\n[{"name": "dog", "ymin": 1, "xmin": 2, "ymax": 3, "xmax": 4}]\n```',
+    '```\n{"title": "Clip", "tags": ["a", "b"]}\n```',
+    '{"summary": "A short clip", "objects": []}',
+    '[]',
+]
+
+
+@pytest.mark.parametrize("text", JSON_RESPONSES)
+def test_extract_json_block_matches_reference(text):
+    assert json.loads(extract_json_block(text)) == json.loads(_reference_remove_markdown(text))
+
+
+@pytest.mark.parametrize("text, expected", [
+    ('Here are the boxes:\n```json\n[{"name": "cat"}]\n```\nDone.', [{"name": "cat"}]),
+    ('Sure! [{"name": "car"}] Hope that helps.', [{"name": "car"}]),
+])
+def test_extract_json_block_ignores_surrounding_prose(text, expected):
+    # The markdown pass kept the prose, so these never decoded before
+    assert json.loads(extract_json_block(text)) == expected
+
+
+def test_extract_json_block_keeps_markup_characters_in_strings():
+    text = '```json\n[{"name": "snake_case *star* ~tilde~"}]\n```'
+    assert json.loads(extract_json_block(text)) == [{"name": "snake_case *star* ~tilde~"}]
@@ -0,0 +1,35 @@
+from utils.transcription import parse_transcript, stitch_transcripts
+
+
+def test_overlap_is_dropped_once():
+    first = "Speaker A: Hello there.\nSpeaker B: Hi, how are you?\nSpeaker A: Fine, thanks."
+    second = "Speaker A: Hi, how are you?\nSpeaker B: Fine, thanks.\nSpeaker B: Let's begin."
+    assert stitch_transcripts([first, second]).splitlines() == [
+        "Speaker A: Hello there.",
+        "Speaker B: Hi, how are you?",
+        "Speaker A: Fine, thanks.",
+        "Speaker A: Let's begin.",
+    ]
+
+
+def test_repeated_line_later_in_segment_is_not_overlap():
+    first = "Speaker A: So that is the plan.\nSpeaker B: Okay."
+    second = (
+        "Speaker A: Next item is the budget.\n"
+        "Speaker A: We are over by ten percent.\n"
+        "Speaker B: That is a lot.\n"
+        "Speaker A: It is.\n"
+        "Speaker B: Okay."
+    )
+    lines = stitch_transcripts([first, second]).splitlines()
+    assert lines[:2] == ["Speaker A: So that is the plan.", "Speaker B: Okay."]
+    assert len(lines) == 7
+    assert lines[2] == "Speaker A: Next item is the budget."
+
+
+def test_timestamps_are_not_speakers():
+    assert parse_transcript("00:12: Welcome back.\n[01:02:03] Speaker A: Hi.") == [
+        (None, "00:12: Welcome back."),
+        (None, "[01:02:03] Speaker A: Hi."),
+    ]
+    assert parse_transcript("Speaker A: At 10:30 we start.") == [("Speaker A", "At 10:30 we start.")]
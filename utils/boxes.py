@@ -0,0 +1,221 @@
+import time
+from typing import Optional, Dict, Any, List, Sequence
+
+import numpy as np
+
+
+class BoxArray:
+    """
+    Struct-of-arrays container for bounding boxes.
+
+    ``coords`` is an ``(N, 4)`` float64 array in ``xmin, ymin, xmax, ymax``
+    order, ``label_ids`` indexes into the shared ``labels`` table and
+    ``scores`` holds an optional per-box confidence. All geometry operations
+    are vectorized over the whole set.
+    """
+
+    __slots__ = ("coords", "label_ids", "labels", "scores")
+
+    def __init__(self, coords, label_ids, labels: Sequence[str], scores=None):
+        self.coords = np.asarray(coords, dtype=np.float64).reshape(-1, 4)
+        self.label_ids = np.asarray(label_ids, dtype=np.int32).reshape(-1)
+        self.labels = list(labels)
+        self.scores = None if scores is None else np.asarray(scores, dtype=np.float64).reshape(-1)
+
+    def __len__(self) -> int:
+        return self.coords.shape[0]
+
+    @classmethod
+    def empty(cls) -> "BoxArray":
+        return cls(np.empty((0, 4)), np.empty(0, dtype=np.int32), [])
+
+    @classmethod
+    def from_dicts(cls, boxes: List[Dict[str, Any]], score_key: Optional[str] = None) -> "BoxArray":
+        """
+        Builds a BoxArray from the list-of-dicts format used by ``utils.util``.
+
+        Raises:
+            ValueError: If a box misses a coordinate or has a non-numeric one.
+        """
+        if not boxes:
+            return cls.empty()
+        try:
+            coords = np.array([(box['xmin'], box['ymin'], box['xmax'], box['ymax']) for box in boxes], dtype=np.float64)
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid bounding box coordinates: {e}")
+        label_index: Dict[str, int] = {}
+        label_ids = [label_index.setdefault(box['name'], len(label_index)) for box in boxes]
+        scores = None
+        if score_key is not None:
+            scores = np.array([box.get(score_key, 1.0) for box in boxes], dtype=np.float64)
+        return cls(coords, label_ids, list(label_index), scores)
+
+    def to_dicts(self, as_int: bool = True, score_key: str = "score") -> List[Dict[str, Any]]:
+        """Converts back to the list-of-dicts format, ``{'name', 'xmin', 'ymin', 'xmax', 'ymax'}``."""
+        coords = self.coords.astype(np.int64) if as_int else self.coords
+        labels = self.labels
+        result = [
+            {'name': labels[label_id], 'xmin': xmin, 'ymin': ymin, 'xmax': xmax, 'ymax': ymax}
+            for label_id, (xmin, ymin, xmax, ymax) in zip(self.label_ids.tolist(), coords.tolist())
+        ]
+        if self.scores is not None:
+            for box, score in zip(result, self.scores.tolist()):
+                box[score_key] = score
+        return result
+
+    def subset(self, mask_or_index) -> "BoxArray":
+        """Returns the boxes selected by a boolean mask or an index array."""
+        scores = None if self.scores is None else self.scores[mask_or_index]
+        return BoxArray(self.coords[mask_or_index], self.label_ids[mask_or_index], self.labels, scores)
+
+    def normalized_to_pixel(self, image_width: int, image_height: int) -> "BoxArray":
+        """Maps 0-1000 normalized coordinates to truncated pixel coordinates."""
+        scale = np.array([image_width, image_height, image_width, image_height], dtype=np.float64)
+        coords = np.trunc(self.coords / 1000 * scale)
+        return BoxArray(coords, self.label_ids, self.labels, self.scores)
+
+    def valid_mask(self, image_width: int, image_height: int) -> np.ndarray:
+        """Boxes with ``0 <= min < max <= size`` on both axes, as in ``convert_normalized_to_pixel``."""
+        xmin, ymin, xmax, ymax = self.coords.T
+        return (
+            (0 <= xmin) & (xmin < xmax) & (xmax <= image_width)
+            & (0 <= ymin) & (ymin < ymax) & (ymax <= image_height)
+        )
+
+    def clip(self, image_width: int, image_height: int) -> "BoxArray":
+        """Clamps coordinates into the image."""
+        upper = np.array([image_width, image_height, image_width, image_height], dtype=np.float64)
+        return BoxArray(np.clip(self.coords, 0, upper), self.label_ids, self.labels, self.scores)
+
+    def areas(self) -> np.ndarray:
+        widths = np.clip(self.coords[:, 2] - self.coords[:, 0], 0, None)
+        heights = np.clip(self.coords[:, 3] - self.coords[:, 1], 0, None)
+        return widths * heights
+
+    def filter_area(self, min_area: float = 0.0, max_area: Optional[float] = None) -> "BoxArray":
+        areas = self.areas()
+        mask = areas >= min_area
+        if max_area is not None:
+            mask &= areas <= max_area
+        return self.subset(mask)
+
+    def translate(self, dx: float, dy: float) -> "BoxArray":
+        return BoxArray(self.coords + np.array([dx, dy, dx, dy]), self.label_ids, self.labels, self.scores)
+
+
+def iou_matrix(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """
+    Pairwise intersection-over-union of two ``(N, 4)`` and ``(M, 4)`` xyxy arrays.
+
+    Returns:
+        np.ndarray: ``(N, M)`` IoU values.
+    """
+    a = np.asarray(a, dtype=np.float64).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float64).reshape(-1, 4)
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+    area_a = np.prod(np.clip(a[:, 2:] - a[:, :2], 0, None), axis=1)
+    area_b = np.prod(np.clip(b[:, 2:] - b[:, :2], 0, None), axis=1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.divide(intersection, union, out=np.zeros_like(intersection), where=union > 0)
+
+
+def non_max_suppression(boxes: BoxArray, iou_threshold: float = 0.5, containment_threshold: Optional[float] = None,
+                        class_aware: bool = True, containment_mask: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Greedy non-maximum suppression.
+
+    Boxes are visited by descending score, or by descending area when there
+    are no scores; a box is dropped when it overlaps an already kept box of
+    the same label by at least ``iou_threshold`` IoU, or when at least
+    ``containment_threshold`` of its own area lies inside a kept box.
+
+    Args:
+        boxes (BoxArray): The candidate boxes.
+        iou_threshold (float): IoU at which the lower ranked box is dropped.
+        containment_threshold (float, optional): Fraction of the smaller box
+            covered by a kept box at which it is dropped, which catches
+            partial boxes cut off at tile borders.
+        class_aware (bool): Only suppress boxes sharing a label.
+        containment_mask (np.ndarray, optional): ``(N, N)`` booleans; when
+            given, containment only suppresses the pairs marked ``True``.
+
+    Returns:
+        np.ndarray: Indices of the kept boxes, in ranking order.
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+    areas = boxes.areas()
+    priority = boxes.scores if boxes.scores is not None else areas
+    groups = [np.flatnonzero(boxes.label_ids == label_id) for label_id in np.unique(boxes.label_ids)] \
+        if class_aware else [np.arange(len(boxes))]
+
+    kept = []
+    for members in groups:
+        members = members[np.argsort(-priority[members], kind="stable")]
+        coords = boxes.coords[members]
+        overlaps = iou_matrix(coords, coords)
+        if containment_threshold is not None:
+            top_left = np.maximum(coords[:, None, :2], coords[None, :, :2])
+            bottom_right = np.minimum(coords[:, None, 2:], coords[None, :, 2:])
+            intersection = np.prod(np.clip(bottom_right - top_left, 0, None), axis=2)
+            own_area = areas[members][None, :]
+            contained = np.divide(intersection, own_area, out=np.zeros_like(intersection), where=own_area > 0)
+            if containment_mask is not None:
+                contained = np.where(containment_mask[np.ix_(members, members)], contained, 0.0)
+        suppressed = np.zeros(len(members), dtype=bool)
+        for position in range(len(members)):
+            if suppressed[position]:
+                continue
+            kept.append(members[position])
+            later = slice(position + 1, None)
+            suppressed[later] |= overlaps[position, later] >= iou_threshold
+            if containment_threshold is not None:
+                suppressed[later] |= contained[position, later] >= containment_threshold
+
+    kept = np.asarray(kept, dtype=np.int64)
+    return kept[np.argsort(-priority[kept], kind="stable")]
+
+
+def convert_normalized_to_pixel_fast(bounding_boxes: List[Dict[str, Any]], image_width: int,
+                                     image_height: int) -> List[Dict[str, Any]]:
+    """Vectorized equivalent of ``utils.util.convert_normalized_to_pixel`` (without the log line)."""
+    boxes = BoxArray.from_dicts(bounding_boxes).normalized_to_pixel(image_width, image_height)
+    return boxes.subset(boxes.valid_mask(image_width, image_height)).to_dicts()
+
+
+def benchmark(count: int = 10000, repeat: int = 5) -> Dict[str, float]:
+    """Times the dict loop against the array path on random boxes; returns the best seconds of each."""
+    from utils.util import convert_normalized_to_pixel
+
+    rng = np.random.default_rng(0)
+    mins = rng.uniform(0, 900, size=(count, 2))
+    maxs = mins + rng.uniform(1, 100, size=(count, 2))
+    boxes = [
+        {'name': f"object {i % 20}", 'xmin': float(x0), 'ymin': float(y0), 'xmax': float(x1), 'ymax': float(y1)}
+        for i, ((x0, y0), (x1, y1)) in enumerate(zip(mins, maxs))
+    ]
+    width, height = 1920, 1080
+
+    def best(fn):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn()
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    array_boxes = BoxArray.from_dicts(boxes)
+    results = {
+        'dict_loop': best(lambda: convert_normalized_to_pixel(boxes, width, height)),
+        'array_round_trip': best(lambda: convert_normalized_to_pixel_fast(boxes, width, height)),
+        'array_only': best(lambda: array_boxes.normalized_to_pixel(width, height).valid_mask(width, height)),
+    }
+    assert convert_normalized_to_pixel(boxes, width, height) == convert_normalized_to_pixel_fast(boxes, width, height)
+    return results
+
+
+if __name__ == "__main__":
+    for name, seconds in benchmark().items():
+        print(f"{name:>18}: {seconds * 1000:8.2f} ms")
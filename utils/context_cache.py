@@ -0,0 +1,221 @@
+import datetime
+import hashlib
+import os
+import threading
+import time
+from typing import Optional, Dict, Any, List, NamedTuple
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+from google.generativeai import caching
+
+from utils.model import configure, get_model, register_model_key
+from utils.response_cache import content_key
+from utils.scheduler import scheduled
+
+CONTEXT_CACHE_MODEL = os.getenv('CACHING_MODEL') or 'models/gemini-1.5-pro-002'
+CONTEXT_CACHE_TTL_SECONDS = float(os.getenv('CONTEXT_CACHE_TTL_SECONDS', '3600'))
+# An entry used with less than this share of its TTL left is extended to a full TTL again
+CONTEXT_CACHE_RENEW_FRACTION = 0.5
+# After a failed creation (usually content below the minimum cacheable size) wait this long before retrying
+CONTEXT_CACHE_RETRY_SECONDS = float(os.getenv('CONTEXT_CACHE_RETRY_SECONDS', '3600'))
+_DISPLAY_PREFIX = "ctx-"
+
+
+class ContextModel(NamedTuple):
+    """
+    A model to call plus the contents to prepend to every request.
+
+    ``contents`` is empty when the context is served from a cache entry, and
+    holds the context itself when the registry had to fall back to a plain
+    model with the system instruction.
+    """
+    model: Any
+    contents: List[Any]
+    cached: bool
+
+
+def context_fingerprint(model_name: str, system_instruction: Optional[str], contents: Optional[List[Any]]) -> str:
+    """Returns a stable identifier of a model, system instruction and context contents."""
+    digest = hashlib.sha256(model_name.encode())
+    digest.update(b"\0" + (system_instruction or "").encode())
+    for part in contents or []:
+        digest.update(b"\0" + content_key(part).encode())
+    return digest.hexdigest()
+
+
+class _Entry:
+    __slots__ = ("lock", "ttl", "cached_content", "model", "expire_time", "failed_at", "error")
+
+    def __init__(self, ttl: datetime.timedelta):
+        self.lock = threading.Lock()
+        self.ttl = ttl
+        self.cached_content = None
+        self.model = None
+        self.expire_time: Optional[datetime.datetime] = None
+        self.failed_at: Optional[float] = None
+        self.error: Optional[str] = None
+
+
+def _now() -> datetime.datetime:
+    return datetime.datetime.now(datetime.timezone.utc)
+
+
+class ContextCacheRegistry:
+    """
+    Creates, reuses, renews and rebuilds Gemini context caches.
+
+    Entries are identified by a fingerprint of the model, the system
+    instruction and the context contents. The first request creates the
+    cached content (or adopts one a previous process created, found by its
+    display name); later requests reuse it through
+    ``GenerativeModel.from_cached_content``, extend its TTL when it is past
+    half-life and rebuild it once it has expired or was deleted. When the
+    service refuses to cache the context, callers get a plain model plus the
+    context to send inline, and creation is retried only after
+    ``CONTEXT_CACHE_RETRY_SECONDS``.
+    """
+
+    def __init__(self, ttl_seconds: float = CONTEXT_CACHE_TTL_SECONDS):
+        self.ttl = datetime.timedelta(seconds=ttl_seconds)
+        self._entries: Dict[str, _Entry] = {}
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'created': 0, 'adopted': 0, 'renewed': 0, 'rebuilt': 0, 'fallbacks': 0}
+
+    def get(self, system_instruction: Optional[str], contents: Optional[List[Any]] = None,
+            model_name: str = CONTEXT_CACHE_MODEL, display_name: Optional[str] = None,
+            ttl_seconds: Optional[float] = None) -> ContextModel:
+        """
+        Returns a model with the context applied, caching it on the service when possible.
+
+        Args:
+            system_instruction (str, optional): The shared system instruction.
+            contents (list, optional): Shared leading contents, such as a checklist.
+            model_name (str): A versioned model that supports context caching.
+            display_name (str, optional): Human readable prefix of the entry name.
+            ttl_seconds (float, optional): Lifetime of a new entry and of each
+                renewal; ``CONTEXT_CACHE_TTL_SECONDS`` by default.
+
+        Returns:
+            ContextModel: The model and the contents to prepend to each request.
+        """
+        configure()
+        contents = list(contents or [])
+        fingerprint = context_fingerprint(model_name, system_instruction, contents)
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is None:
+                ttl = datetime.timedelta(seconds=ttl_seconds) if ttl_seconds else self.ttl
+                entry = self._entries[fingerprint] = _Entry(ttl)
+
+        # One caller per entry talks to the service; others wait for its result
+        with entry.lock:
+            if entry.model is not None and entry.expire_time is not None and entry.expire_time > _now():
+                self._renew_if_needed(entry)
+                if entry.model is not None:
+                    self._count('hits')
+                    return ContextModel(entry.model, [], True)
+            if entry.failed_at is not None and time.monotonic() - entry.failed_at < CONTEXT_CACHE_RETRY_SECONDS:
+                self._count('fallbacks')
+                return self._fallback(model_name, system_instruction, contents)
+
+            rebuilding = entry.cached_content is not None
+            try:
+                cached_content = self._adopt(fingerprint) or self._create(
+                    fingerprint, model_name, system_instruction, contents, display_name, entry.ttl
+                )
+            except google_exceptions.GoogleAPIError as e:
+                entry.cached_content = entry.model = entry.expire_time = None
+                entry.failed_at, entry.error = time.monotonic(), str(e)
+                self._count('fallbacks')
+                return self._fallback(model_name, system_instruction, contents)
+
+            entry.cached_content = cached_content
+            entry.expire_time = cached_content.expire_time
+            entry.model = genai.GenerativeModel.from_cached_content(cached_content=cached_content)
+            entry.failed_at = entry.error = None
+            # Responses depend on the cached context, so the response cache must tell entries apart
+            register_model_key(entry.model, f"cached-content:{fingerprint}")
+            if rebuilding:
+                self._count('rebuilt')
+            return ContextModel(entry.model, [], True)
+
+    def _count(self, name: str):
+        with self._lock:
+            self._stats[name] += 1
+
+    def _renew_if_needed(self, entry: _Entry):
+        remaining = entry.expire_time - _now()
+        if remaining > entry.ttl * CONTEXT_CACHE_RENEW_FRACTION:
+            return
+        try:
+            scheduled('cache', entry.cached_content.update, ttl=entry.ttl)
+            entry.expire_time = entry.cached_content.expire_time or _now() + entry.ttl
+            self._count('renewed')
+        except google_exceptions.NotFound:
+            # Deleted on the service; the caller rebuilds it
+            entry.model = entry.expire_time = None
+        except google_exceptions.GoogleAPIError:
+            # Still valid until it expires, the next request tries again
+            pass
+
+    def _adopt(self, fingerprint: str):
+        display_name = _DISPLAY_PREFIX + fingerprint[:32]
+        try:
+            for cached_content in scheduled('cache', lambda: list(caching.CachedContent.list(page_size=100))):
+                if (cached_content.display_name or "").endswith(display_name) and cached_content.expire_time > _now():
+                    self._count('adopted')
+                    return cached_content
+        except google_exceptions.GoogleAPIError:
+            pass
+        return None
+
+    def _create(self, fingerprint: str, model_name: str, system_instruction: Optional[str], contents: List[Any],
+                display_name: Optional[str], ttl: datetime.timedelta):
+        name = _DISPLAY_PREFIX + fingerprint[:32]
+        if display_name:
+            name = f"{display_name[:80]}-{name}"
+        cached_content = scheduled(
+            'cache',
+            caching.CachedContent.create,
+            model=model_name,
+            display_name=name,
+            system_instruction=system_instruction,
+            contents=contents or None,
+            ttl=ttl,
+        )
+        self._count('created')
+        return cached_content
+
+    @staticmethod
+    def _fallback(model_name: str, system_instruction: Optional[str], contents: List[Any]) -> ContextModel:
+        return ContextModel(get_model(model_name, system_instruction=system_instruction), contents, False)
+
+    def delete(self, system_instruction: Optional[str], contents: Optional[List[Any]] = None,
+               model_name: str = CONTEXT_CACHE_MODEL):
+        """Deletes the service entry of a context, for example after the instruction changed."""
+        fingerprint = context_fingerprint(model_name, system_instruction, list(contents or []))
+        with self._lock:
+            entry = self._entries.pop(fingerprint, None)
+        if entry is not None and entry.cached_content is not None:
+            try:
+                scheduled('cache', entry.cached_content.delete)
+            except google_exceptions.NotFound:
+                pass
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return dict(self._stats, entries=sum(entry.model is not None for entry in self._entries.values()))
+
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+def get_context_cache() -> ContextCacheRegistry:
+    """Returns the process-wide context cache registry."""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ContextCacheRegistry()
+        return _registry
@@ -0,0 +1,314 @@
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Dict, Any, List, Callable
+
+from utils.boxes import convert_normalized_to_pixel_fast
+from utils.image_prep import prepare_image, unprocessed_upload_bytes
+from utils.json_stream import JsonArrayStream
+from utils.markdown import extract_json_block
+from utils.phash_cache import fingerprint, get_detection_cache
+from utils.response_cache import generate_text, get_response_cache, request_key
+from utils.scheduler import BATCH, in_lane, scheduled_stream
+from utils.tracing import get_tracer, trace
+from utils.util import (
+    chunk_text,
+    parse_bounding_boxes,
+    validate_bounding_boxes
+)
+
+# Defaults for batch detection
+IMAGES_PER_REQUEST = 4
+DETECTION_WORKERS = 4
+
+
+def build_detection_prompt(object_name: str, guidance: str = "") -> str:
+    """Returns the single-image detection prompt for the requested object, with optional extra guidance."""
+    guidance = f"\n        {guidance}" if guidance else ""
+    return f"""
+        You are given an image. Identify all {object_name} in the image and provide their bounding boxes.{guidance}
+        Return ONLY a valid JSON array in the exact format shown below.
+        return specific name , let say if it's a dog and you know the dog breed name return that.
+        Do NOT include any additional text, explanations, comments, trailing commas, or markdown formatting such as code blocks.
+        Use this JSON schema:
+        [
+            {{
+                "name": "string",
+                "ymin": float,
+                "xmin": float,
+                "ymax": float,
+                "xmax": float
+            }}
+        ]
+        """
+
+
+def build_batch_prompt(object_name: str, count: int) -> str:
+    """Returns the prompt asking for one box list per image when several images share a request."""
+    return f"""
+        You are given {count} images, in order. For each image, identify all {object_name} in it and provide their bounding boxes.
+        Coordinates are normalized to 0-1000 relative to that image.
+        return specific name , let say if it's a dog and you know the dog breed name return that.
+        Return ONLY a valid JSON array with exactly {count} elements, one per image in the same order as the images.
+        Each element is the (possibly empty) array of boxes of that image.
+        Do NOT include any additional text, explanations, comments, trailing commas, or markdown formatting such as code blocks.
+        Use this JSON schema:
+        [
+            [
+                {{
+                    "name": "string",
+                    "ymin": float,
+                    "xmin": float,
+                    "ymax": float,
+                    "xmax": float
+                }}
+            ]
+        ]
+        """
+
+
+def detect_objects(model, image, object_name: str, use_cache: bool = True, preprocess: Optional[Dict[str, Any]] = None,
+                   stats: Optional[Dict[str, Any]] = None, match_similar: bool = True,
+                   prompt: Optional[str] = None) -> List[Dict[str, Any]]:
+    """
+    Detects objects in one image.
+
+    Args:
+        model (GenerativeModel): The detection model.
+        image (PIL.Image.Image): The image to analyse.
+        object_name (str): What to detect, or ``"all"``.
+        use_cache (bool): Whether the result may come from the response cache
+            or from a near-duplicate image in the detection cache.
+        preprocess (dict, optional): Keyword arguments for ``prepare_image``
+            (``max_edge``, ``image_format``, ``quality``).
+        stats (dict, optional): Filled with ``hash_hit`` and, when the model
+            was asked, ``raw_bytes`` (decoded pixels), ``baseline_bytes``
+            (what the unprocessed image would have been uploaded as, see
+            ``unprocessed_upload_bytes``), ``sent_bytes``, ``bytes_saved``,
+            ``sent_size``, ``encode_seconds`` and ``request_seconds``.
+        match_similar (bool): Whether to look up near-duplicates at all; off
+            for crops such as tiles, where unrelated low-texture regions can
+            hash alike.
+        prompt (str, optional): Replaces ``build_detection_prompt(object_name)``;
+            near-duplicate matching is skipped for custom prompts.
+
+    Returns:
+        list of dict: Boxes in pixel coordinates of the original ``image``.
+
+    Raises:
+        ValueError: If the response cannot be parsed into boxes.
+    """
+    match_similar = match_similar and prompt is None
+    detection_cache = get_detection_cache()
+    image_fingerprint = fingerprint(image) if match_similar else None
+    if use_cache and match_similar:
+        cached_boxes = detection_cache.lookup(model, object_name, image_fingerprint)
+        if cached_boxes is not None:
+            # A near-duplicate was analysed before; its normalized boxes fit this size too
+            if stats is not None:
+                stats.update({'hash_hit': True})
+            return convert_normalized_to_pixel_fast(cached_boxes, image.width, image.height)
+
+    prepared = prepare_image(image, **(preprocess or {}))
+    started = time.perf_counter()
+    prompt = prompt or build_detection_prompt(object_name)
+    if stats is None:
+        response_text = generate_text(model, [prepared.part, prompt], use_cache=use_cache)
+    else:
+        # The baseline encode runs while the request is in flight
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            baseline = executor.submit(unprocessed_upload_bytes, image)
+            response_text = generate_text(model, [prepared.part, prompt], use_cache=use_cache)
+            request_seconds = time.perf_counter() - started
+            try:
+                baseline_bytes = baseline.result()
+            except (OSError, ValueError):
+                # Modes WebP cannot encode; the SDK could not have sent them as they were either
+                baseline_bytes = None
+        stats.update({
+            'hash_hit': False,
+            'raw_bytes': prepared.raw_bytes,
+            'baseline_bytes': baseline_bytes,
+            'sent_bytes': prepared.sent_bytes,
+            'bytes_saved': baseline_bytes - prepared.sent_bytes if baseline_bytes is not None else None,
+            'sent_size': prepared.sent_size,
+            'encode_seconds': prepared.encode_seconds,
+            'request_seconds': request_seconds,
+        })
+    with trace('parse'):
+        bounding_boxes = parse_bounding_boxes(extract_json_block(response_text))
+    if match_similar:
+        detection_cache.store(model, object_name, image_fingerprint, bounding_boxes)
+    image_width, image_height = prepared.original_size
+    return convert_normalized_to_pixel_fast(bounding_boxes, image_width, image_height)
+
+
+def stream_detect_objects(model, image, object_name: str, use_cache: bool = True,
+                          preprocess: Optional[Dict[str, Any]] = None):
+    """
+    Streams detections, yielding each box as soon as its JSON object is complete.
+
+    Args:
+        model (GenerativeModel): The detection model.
+        image (PIL.Image.Image): The image to analyse.
+        object_name (str): What to detect, or ``"all"``.
+        use_cache (bool): Whether a cached response or near-duplicate result may be replayed instead.
+        preprocess (dict, optional): Keyword arguments for ``prepare_image``.
+
+    Yields:
+        dict: One box in pixel coordinates of the original ``image``; boxes
+        that fall outside the image are skipped.
+
+    Raises:
+        ValueError: If a streamed element is not a valid box.
+    """
+    detection_cache = get_detection_cache()
+    image_fingerprint = fingerprint(image)
+    if use_cache:
+        cached_boxes = detection_cache.lookup(model, object_name, image_fingerprint)
+        if cached_boxes is not None:
+            yield from convert_normalized_to_pixel_fast(cached_boxes, image.width, image.height)
+            return
+
+    prepared = prepare_image(image, **(preprocess or {}))
+    contents = [prepared.part, build_detection_prompt(object_name)]
+    image_width, image_height = prepared.original_size
+    parser = JsonArrayStream()
+    cache = get_response_cache()
+    key = request_key(model, contents)
+
+    cached = cache.get(key) if use_cache else None
+    if cached is not None:
+        for element in parser.feed(cached):
+            validate_bounding_boxes([element])
+            yield from convert_normalized_to_pixel_fast([element], image_width, image_height)
+        return
+
+    parts = []
+    bounding_boxes = []
+    span = get_tracer().start('generate', stream=True, cache_hit=False, bytes_sent=prepared.sent_bytes)
+    error = None
+    # Holds a scheduler slot until closed
+    response = scheduled_stream('generate', model.generate_content, contents, stream=True)
+    try:
+        for chunk in response:
+            span.record_usage(chunk)
+            text = chunk_text(chunk)
+            if not text:
+                continue
+            parts.append(text)
+            for element in parser.feed(text):
+                validate_bounding_boxes([element])
+                bounding_boxes.append(element)
+                yield from convert_normalized_to_pixel_fast([element], image_width, image_height)
+    except Exception as e:
+        error = e
+        raise
+    finally:
+        response.close()
+        span.end(error)
+
+    if parser.finished:
+        # A complete stream is as good as a blocking call, so detect_objects can reuse it
+        cache.put(key, "".join(parts))
+        detection_cache.store(model, object_name, image_fingerprint, bounding_boxes)
+
+
+def _detect_group(model, images, object_name: str, use_cache: bool,
+                  preprocess: Optional[Dict[str, Any]] = None) -> List[List[Dict[str, Any]]]:
+    """
+    Detects objects in a group of images sharing one request.
+
+    Returns one box list per image; when the group had to be retried image by
+    image, failed images hold the exception instead.
+    """
+    if len(images) == 1:
+        return [detect_objects(model, images[0], object_name, use_cache=use_cache, preprocess=preprocess)]
+
+    prepared_images = [prepare_image(image, **(preprocess or {})) for image in images]
+    contents = []
+    for position, prepared in enumerate(prepared_images, start=1):
+        contents.extend([f"Image {position}:", prepared.part])
+    contents.append(build_batch_prompt(object_name, len(images)))
+
+    try:
+        response_text = generate_text(model, contents, use_cache=use_cache)
+        with trace('parse'):
+            per_image = json.loads(extract_json_block(response_text))
+        if not isinstance(per_image, list) or len(per_image) != len(images):
+            raise ValueError(f"Expected {len(images)} box lists, got {len(per_image) if isinstance(per_image, list) else 'none'}.")
+        results = []
+        for prepared, bounding_boxes in zip(prepared_images, per_image):
+            validate_bounding_boxes(bounding_boxes)
+            image_width, image_height = prepared.original_size
+            results.append(convert_normalized_to_pixel_fast(bounding_boxes, image_width, image_height))
+        return results
+    except (ValueError, json.JSONDecodeError):
+        # The model did not keep the images apart; fall back to one request per image
+        results = []
+        for image in images:
+            try:
+                results.append(detect_objects(model, image, object_name, use_cache=use_cache, preprocess=preprocess))
+            except Exception as e:
+                results.append(e)
+        return results
+
+
+def detect_batch(model, images, object_name: str, images_per_request: int = IMAGES_PER_REQUEST,
+                 max_workers: int = DETECTION_WORKERS, use_cache: bool = True,
+                 preprocess: Optional[Dict[str, Any]] = None,
+                 progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+    """
+    Detects objects in many images, packing several images into each request.
+
+    Args:
+        model (GenerativeModel): The detection model.
+        images (list of PIL.Image.Image): The images, opened lazily is fine.
+        object_name (str): What to detect, or ``"all"``.
+        images_per_request (int): Images sent together in one request.
+        max_workers (int): Maximum number of requests in flight.
+        use_cache (bool): Whether responses may come from the cache.
+        preprocess (dict, optional): Keyword arguments for ``prepare_image``.
+        progress_callback (callable, optional): Called as ``(images done, total)``.
+
+    Returns:
+        dict: ``boxes`` with one box list per input image in input order
+        (None where detection failed), ``failed`` with ``(index, error)``
+        pairs, ``elapsed`` in seconds and ``images_per_second``.
+    """
+    images = list(images)
+    total = len(images)
+    images_per_request = max(1, images_per_request)
+    groups = [list(range(start, min(start + images_per_request, total))) for start in range(0, total, images_per_request)]
+
+    boxes: List[Optional[List[Dict[str, Any]]]] = [None] * total
+    failed = []
+    done = 0
+    started = time.perf_counter()
+    if groups:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(groups)))) as executor:
+            futures = {
+                executor.submit(in_lane(BATCH, _detect_group), model, [images[i] for i in group], object_name, use_cache, preprocess): group
+                for group in groups
+            }
+            for future in as_completed(futures):
+                group = futures[future]
+                try:
+                    for index, image_boxes in zip(group, future.result()):
+                        if isinstance(image_boxes, Exception):
+                            failed.append((index, str(image_boxes)))
+                        else:
+                            boxes[index] = image_boxes
+                except Exception as e:
+                    failed.extend((index, str(e)) for index in group)
+                done += len(group)
+                if progress_callback is not None:
+                    progress_callback(done, total)
+
+    elapsed = time.perf_counter() - started
+    return {
+        'boxes': boxes,
+        'failed': sorted(failed),
+        'elapsed': elapsed,
+        'images_per_second': total / elapsed if elapsed > 0 else 0.0,
+    }
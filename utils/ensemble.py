@@ -0,0 +1,182 @@
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, NamedTuple, Sequence
+
+import numpy as np
+
+from utils.boxes import iou_matrix
+from utils.detection import build_detection_prompt, detect_objects
+from utils.model import get_model
+
+# Members cycle through these, so an ensemble of N differs in temperature and wording
+ENSEMBLE_TEMPERATURES = (0.2, 0.6, 1.0)
+ENSEMBLE_GUIDANCE = (
+    "",
+    "Draw each box as tightly as possible around the visible extent of one instance.",
+    "Include partially visible or occluded instances, and give every instance its own box.",
+)
+ENSEMBLE_IOU = 0.55
+
+# Same as the default configuration of load_model, apart from the temperature
+_BASE_CONFIG = dict(top_p=1.0, top_k=32, candidate_count=1, max_output_tokens=8192)
+
+
+class EnsembleMember(NamedTuple):
+    model: Any
+    prompt: str
+    weight: float
+    label: str
+
+
+def build_members(object_name: str, size: int = 3, model_names: Optional[Sequence[str]] = None,
+                  temperatures: Sequence[float] = ENSEMBLE_TEMPERATURES,
+                  guidance: Sequence[str] = ENSEMBLE_GUIDANCE) -> List[EnsembleMember]:
+    """
+    Returns ``size`` detection members that differ in model, temperature and prompt.
+
+    Member ``i`` takes the ``i``-th entry (cyclically) of each list, so two
+    members only coincide when ``size`` exceeds every list length.
+
+    Args:
+        object_name (str): What to detect, or ``"all"``.
+        size (int): Number of members.
+        model_names (list of str, optional): Models to cycle through; the
+            default model when omitted.
+        temperatures (list of float): Temperatures to cycle through.
+        guidance (list of str): Extra prompt instructions to cycle through.
+
+    Returns:
+        list of EnsembleMember: Members with weight 1.
+    """
+    model_names = list(model_names or [None])
+    members = []
+    for index in range(max(1, size)):
+        model_name = model_names[index % len(model_names)]
+        temperature = temperatures[index % len(temperatures)]
+        model = get_model(model_name, generation_config=dict(_BASE_CONFIG, temperature=temperature))
+        extra = guidance[index % len(guidance)]
+        label = f"{model_name or 'default'} · t={temperature}" + (f" · prompt {index % len(guidance) + 1}" if extra else "")
+        members.append(EnsembleMember(model, build_detection_prompt(object_name, extra), 1.0, label))
+    return members
+
+
+def fuse_boxes(member_boxes: List[Optional[List[Dict[str, Any]]]], weights: Optional[Sequence[float]] = None,
+               iou_threshold: float = ENSEMBLE_IOU, min_votes: int = 1) -> List[Dict[str, Any]]:
+    """
+    Weighted box fusion over the boxes of several ensemble members.
+
+    Boxes are visited by descending member weight and joined to the fused
+    box they overlap most (at least ``iou_threshold`` IoU, at most one box per
+    member); each fused box is the weighted mean of its members. Labels are
+    not required to agree, since members may name the same object at
+    different specificity; the fused label is the weighted majority.
+
+    Args:
+        member_boxes (list): Pixel boxes per member, None for failed members.
+        weights (list of float, optional): Member weights, 1 by default.
+        iou_threshold (float): Minimum IoU for a box to join a fused box.
+        min_votes (int): Fused boxes backed by fewer members are dropped.
+
+    Returns:
+        list of dict: Fused pixel boxes with ``confidence`` (weight share of
+        the members that agree) and ``votes``, most confident first.
+    """
+    weights = list(weights) if weights is not None else [1.0] * len(member_boxes)
+    total_weight = sum(weight for weight, boxes in zip(weights, member_boxes) if boxes is not None) or 1.0
+
+    entries = [
+        (weights[member], member, box)
+        for member, boxes in enumerate(member_boxes) if boxes
+        for box in boxes
+    ]
+    if not entries:
+        return []
+    entries.sort(key=lambda entry: -entry[0])
+    coords = np.array([(box['xmin'], box['ymin'], box['xmax'], box['ymax']) for _, _, box in entries], dtype=np.float64)
+    entry_weights = np.array([weight for weight, _, _ in entries], dtype=np.float64)
+
+    fused = np.empty((0, 4), dtype=np.float64)
+    # Which members already contributed to each fused box
+    taken = np.zeros((0, len(member_boxes)), dtype=bool)
+    clusters: List[List[int]] = []
+    for index in range(len(entries)):
+        member = entries[index][1]
+        if clusters:
+            overlaps = iou_matrix(coords[index:index + 1], fused)[0]
+            overlaps[taken[:, member]] = -1.0
+            best = int(np.argmax(overlaps))
+            if overlaps[best] >= iou_threshold:
+                cluster = clusters[best]
+                cluster.append(index)
+                taken[best, member] = True
+                fused[best] = np.average(coords[cluster], axis=0, weights=entry_weights[cluster])
+                continue
+        clusters.append([index])
+        fused = np.vstack([fused, coords[index]])
+        taken = np.vstack([taken, np.eye(1, len(member_boxes), member, dtype=bool)])
+
+    results = []
+    for cluster, box in zip(clusters, fused):
+        if len(cluster) < min_votes:
+            continue
+        names = Counter()
+        for index in cluster:
+            names[str(entries[index][2]['name'])] += entries[index][0]
+        xmin, ymin, xmax, ymax = (int(round(value)) for value in box)
+        results.append({
+            'name': names.most_common(1)[0][0],
+            'xmin': xmin, 'ymin': ymin, 'xmax': xmax, 'ymax': ymax,
+            'confidence': float(entry_weights[cluster].sum() / total_weight),
+            'votes': len(cluster),
+        })
+    results.sort(key=lambda box: -box['confidence'])
+    return results
+
+
+def detect_ensemble(members: List[EnsembleMember], image, object_name: str, use_cache: bool = True,
+                    preprocess: Optional[Dict[str, Any]] = None, iou_threshold: float = ENSEMBLE_IOU,
+                    min_votes: int = 1) -> Dict[str, Any]:
+    """
+    Runs all members on one image concurrently and fuses their boxes.
+
+    Every member gets its own request, all in flight at once, so the call
+    takes about as long as the slowest single request.
+
+    Args:
+        members (list of EnsembleMember): See ``build_members``.
+        image (PIL.Image.Image): The image to analyse.
+        object_name (str): What to detect, or ``"all"``.
+        use_cache (bool): Whether member responses may come from the cache.
+        preprocess (dict, optional): Keyword arguments for ``prepare_image``.
+        iou_threshold (float): See ``fuse_boxes``.
+        min_votes (int): See ``fuse_boxes``.
+
+    Returns:
+        dict: ``boxes`` (fused), ``members`` with ``label``, ``boxes`` (count
+        or None), ``seconds`` and ``error`` per member, and ``elapsed``.
+    """
+    started = time.perf_counter()
+
+    def run(member: EnsembleMember):
+        member_started = time.perf_counter()
+        try:
+            boxes = detect_objects(
+                member.model, image, object_name, use_cache=use_cache, preprocess=preprocess, prompt=member.prompt
+            )
+            return boxes, None, time.perf_counter() - member_started
+        except Exception as e:
+            return None, str(e), time.perf_counter() - member_started
+
+    with ThreadPoolExecutor(max_workers=max(1, len(members))) as executor:
+        outcomes = list(executor.map(run, members))
+
+    member_boxes = [boxes for boxes, _, _ in outcomes]
+    return {
+        'boxes': fuse_boxes(member_boxes, [member.weight for member in members], iou_threshold, min_votes),
+        'members': [
+            {'label': member.label, 'boxes': None if boxes is None else len(boxes), 'seconds': seconds, 'error': error}
+            for member, (boxes, error, seconds) in zip(members, outcomes)
+        ],
+        'elapsed': time.perf_counter() - started,
+    }
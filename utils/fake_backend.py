@@ -0,0 +1,110 @@
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any
+
+from google.api_core import exceptions as google_exceptions
+
+from utils.scheduler import BATCH, INTERACTIVE, RequestScheduler
+
+
+class FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGeminiBackend:
+    """
+    In-process stand-in for the Gemini API with its own quota.
+
+    Requests beyond ``rpm`` within a sliding 60 second window (scaled by
+    ``time_scale``) fail with ``ResourceExhausted``, like the real service;
+    ``error_rate`` adds random ``ServiceUnavailable`` failures and every
+    request takes ``latency`` seconds.
+    """
+
+    def __init__(self, rpm: float = 60, latency: float = 0.05, error_rate: float = 0.0,
+                 time_scale: float = 1.0, seed: Optional[int] = None):
+        self.rpm = rpm
+        self.latency = latency
+        self.error_rate = error_rate
+        self.window = 60.0 * time_scale
+        self._random = random.Random(seed)
+        self._requests = deque()
+        self._lock = threading.Lock()
+        self.stats = {'requests': 0, 'throttled': 0, 'errors': 0, 'ok': 0}
+
+    def _admit(self):
+        now = time.monotonic()
+        with self._lock:
+            self.stats['requests'] += 1
+            while self._requests and now - self._requests[0] >= self.window:
+                self._requests.popleft()
+            if len(self._requests) >= self.rpm:
+                self.stats['throttled'] += 1
+                raise google_exceptions.ResourceExhausted("Quota exceeded (fake backend)")
+            self._requests.append(now)
+            if self._random.random() < self.error_rate:
+                self.stats['errors'] += 1
+                raise google_exceptions.ServiceUnavailable("Service unavailable (fake backend)")
+
+    def generate_content(self, contents, stream: bool = False, **kwargs):
+        self._admit()
+        time.sleep(self.latency)
+        with self._lock:
+            self.stats['ok'] += 1
+        text = f"response to {len(contents) if isinstance(contents, list) else 1} part(s)"
+        return iter([FakeResponse(text)]) if stream else FakeResponse(text)
+
+
+def simulate(requests: int = 120, workers: int = 32, batch_share: float = 0.75, backend_rpm: float = 30,
+             scheduler_rpm: float = 25, time_scale: float = 0.05, error_rate: float = 0.05,
+             seed: int = 0) -> Dict[str, Any]:
+    """
+    Fires a burst of interactive and batch requests at a throttling fake backend.
+
+    The scheduler runs slightly under the backend quota, so throttling shows
+    up only as far as retries and jitter let it; interactive requests should
+    finish well ahead of batch ones.
+
+    Returns:
+        dict: Backend and scheduler statistics, failures and mean latency per lane.
+    """
+    backend = FakeGeminiBackend(rpm=backend_rpm, latency=0.01, error_rate=error_rate, time_scale=time_scale, seed=seed)
+    scheduler = RequestScheduler(
+        limits={'generate': (scheduler_rpm / time_scale, 5)},
+        max_concurrency=8,
+        base_delay=0.05,
+        max_delay=1.0,
+    )
+    rng = random.Random(seed)
+    lanes = [BATCH if rng.random() < batch_share else INTERACTIVE for _ in range(requests)]
+    latencies = {INTERACTIVE: [], BATCH: []}
+    failures = []
+
+    def run(priority: int):
+        started = time.perf_counter()
+        try:
+            scheduler.call('generate', backend.generate_content, ["prompt"], priority=priority)
+            latencies[priority].append(time.perf_counter() - started)
+        except Exception as e:
+            failures.append(str(e))
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(run, lanes))
+    return {
+        'elapsed': time.perf_counter() - started,
+        'backend': dict(backend.stats),
+        'scheduler': scheduler.stats(),
+        'failures': len(failures),
+        'interactive_latency': sum(latencies[INTERACTIVE]) / max(1, len(latencies[INTERACTIVE])),
+        'batch_latency': sum(latencies[BATCH]) / max(1, len(latencies[BATCH])),
+    }
+
+
+if __name__ == "__main__":
+    for name, value in simulate().items():
+        print(f"{name:>20}: {value}")
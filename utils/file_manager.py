@@ -0,0 +1,196 @@
+import datetime
+import fnmatch
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Dict, Any, List, Callable
+
+import google.generativeai as genai
+
+from utils.scheduler import BATCH, scheduled
+from utils.upload_index import get_upload_index
+
+# Upper bound on concurrent delete requests
+BULK_DELETE_WORKERS = 8
+
+# How long a fetched file inventory is served before it is listed again
+INVENTORY_TTL_SECONDS = float(os.getenv('INVENTORY_TTL_SECONDS', '300'))
+INVENTORY_PAGE_SIZE = 100
+
+INVENTORY_COLUMNS = ["display_name", "name", "mime_type", "size_bytes", "state", "create_time", "expiration_time"]
+
+
+def _file_row(f) -> Dict[str, Any]:
+    """Flattens a File handle into a table row."""
+    return {
+        'display_name': f.display_name,
+        'name': f.name,
+        'mime_type': f.mime_type,
+        'size_bytes': f.size_bytes,
+        'state': f.state.name,
+        'create_time': f.create_time,
+        'expiration_time': f.expiration_time,
+    }
+
+
+class FileInventory:
+    """
+    Process-wide cache of the remote file listing.
+
+    The listing is fetched page by page and kept for ``ttl`` seconds, so
+    Streamlit reruns are served from memory. Sorted views are cached as well,
+    which leaves slicing out the visible page as the only per-rerun work.
+    """
+
+    def __init__(self, ttl: float = INVENTORY_TTL_SECONDS):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._rows: Optional[List[Dict[str, Any]]] = None
+        self._fetched_at = 0.0
+        self._sorted: Dict[tuple, List[Dict[str, Any]]] = {}
+
+    @property
+    def fetched_at(self) -> float:
+        return self._fetched_at
+
+    def is_stale(self) -> bool:
+        return self._rows is None or time.time() - self._fetched_at > self.ttl
+
+    def invalidate(self):
+        with self._lock:
+            self._rows = None
+            self._sorted = {}
+
+    def rows(self, refresh: bool = False) -> List[Dict[str, Any]]:
+        """Returns the cached listing, fetching it if missing, stale or forced."""
+        with self._lock:
+            if refresh or self.is_stale():
+                files = scheduled('files', lambda: list(genai.list_files(page_size=INVENTORY_PAGE_SIZE)))
+                self._rows = [_file_row(f) for f in files]
+                self._fetched_at = time.time()
+                self._sorted = {}
+            return self._rows
+
+    def page(self, page: int, page_size: int, sort_by: str = "create_time", descending: bool = True,
+             refresh: bool = False) -> Dict[str, Any]:
+        """
+        Returns one page of the sorted inventory.
+
+        Args:
+            page (int): 1-based page number, clamped to the valid range.
+            page_size (int): Rows per page.
+            sort_by (str): One of ``INVENTORY_COLUMNS``.
+            descending (bool): Sort order.
+            refresh (bool): Force a new listing from the API.
+
+        Returns:
+            dict: ``rows`` for the page, plus ``page``, ``pages`` and ``total``.
+        """
+        rows = self.rows(refresh=refresh)
+        key = (sort_by, descending)
+        with self._lock:
+            ordered = self._sorted.get(key)
+            if ordered is None:
+                # None sorts last regardless of direction
+                present = [row for row in rows if row.get(sort_by) is not None]
+                missing = [row for row in rows if row.get(sort_by) is None]
+                ordered = sorted(present, key=lambda row: row[sort_by], reverse=descending) + missing
+                self._sorted[key] = ordered
+
+        total = len(ordered)
+        pages = max(1, -(-total // page_size))
+        page = min(max(1, page), pages)
+        start = (page - 1) * page_size
+        return {'rows': ordered[start:start + page_size], 'page': page, 'pages': pages, 'total': total}
+
+
+_inventory = None
+_inventory_lock = threading.Lock()
+
+
+def get_file_inventory() -> FileInventory:
+    """Returns the process-wide file inventory cache."""
+    global _inventory
+    with _inventory_lock:
+        if _inventory is None:
+            _inventory = FileInventory()
+        return _inventory
+
+
+def filter_files(files, older_than_hours: Optional[float] = None, name_pattern: Optional[str] = None) -> List[Any]:
+    """
+    Selects the files matching an age and/or name filter.
+
+    Args:
+        files (iterable of File): Files as returned by ``genai.list_files()``.
+        older_than_hours (float, optional): Keep only files created more than
+            this many hours ago.
+        name_pattern (str, optional): Shell-style pattern (e.g. ``"*.mp4"``)
+            matched against the display name and the file name.
+
+    Returns:
+        list of File: The matching files.
+    """
+    cutoff = None
+    if older_than_hours:
+        cutoff = datetime.datetime.now(datetime.timezone.utc) - datetime.timedelta(hours=older_than_hours)
+
+    selected = []
+    for f in files:
+        if cutoff is not None:
+            create_time = f.create_time
+            if create_time.tzinfo is None:
+                create_time = create_time.replace(tzinfo=datetime.timezone.utc)
+            if create_time > cutoff:
+                continue
+        if name_pattern and not (
+            fnmatch.fnmatch(f.display_name or "", name_pattern) or fnmatch.fnmatch(f.name, name_pattern)
+        ):
+            continue
+        selected.append(f)
+    return selected
+
+
+def delete_file(name: str):
+    """Deletes a file by name with a single API call."""
+    scheduled('files', genai.delete_file, name)
+    get_file_inventory().invalidate()
+    get_upload_index().remove_names([name if "/" in name else f"files/{name}"])
+
+
+def bulk_delete(files, max_workers: int = BULK_DELETE_WORKERS,
+                progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+    """
+    Deletes files concurrently, straight from their listed handles.
+
+    Args:
+        files (list of File): The files to delete.
+        max_workers (int): Maximum number of concurrent delete requests.
+        progress_callback (callable, optional): Called as ``(done, total)``
+            after each deletion finishes.
+
+    Returns:
+        dict: ``deleted`` holds the deleted file names and ``failed`` holds
+        ``(name, error message)`` pairs.
+    """
+    files = list(files)
+    total = len(files)
+    deleted, failed = [], []
+
+    if total:
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, total))) as executor:
+            futures = {executor.submit(scheduled, 'files', genai.delete_file, f.name, priority=BATCH): f.name for f in files}
+            for done, future in enumerate(as_completed(futures), start=1):
+                name = futures[future]
+                try:
+                    future.result()
+                    deleted.append(name)
+                except Exception as e:
+                    failed.append((name, str(e)))
+                if progress_callback is not None:
+                    progress_callback(done, total)
+
+    get_file_inventory().invalidate()
+    get_upload_index().remove_names(deleted)
+    return {'deleted': deleted, 'failed': failed}
@@ -0,0 +1,200 @@
+import heapq
+import itertools
+import os
+import random
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, Optional
+
+import google.generativeai as genai
+from google.api_core import exceptions as google_exceptions
+
+from utils.scheduler import scheduled
+from utils.tracing import get_tracer
+
+# Backoff settings for file state checks
+POLL_INITIAL_DELAY = 1.0
+POLL_MAX_DELAY = 15.0
+POLL_BACKOFF_FACTOR = 1.6
+POLL_JITTER = 0.25
+
+# Default time a file may stay in PROCESSING before its future times out
+POLL_DEFAULT_TIMEOUT = float(os.getenv('POLL_TIMEOUT_SECONDS', '600'))
+
+# With this many files due at once, a list_files pass replaces N get_file calls
+POLL_BATCH_THRESHOLD = 5
+POLL_LIST_PAGE_SIZE = 100
+# The listing stops after this many files; files it did not reach are checked with get_file
+POLL_LIST_MAX_FILES = int(os.getenv('POLL_LIST_MAX_FILES', '500'))
+
+
+class _PendingFile:
+    def __init__(self, name: str, deadline: float):
+        self.name = name
+        self.deadline = deadline
+        self.delay = POLL_INITIAL_DELAY
+        self.futures = []
+
+
+class FilePoller:
+    """
+    Shared background poller that waits for uploaded files to leave PROCESSING.
+
+    A single daemon thread tracks every pending file. Each file is re-checked
+    with exponential backoff and jitter, and when several files are due at
+    the same time their states are refreshed with a ``list_files`` pass,
+    capped at ``POLL_LIST_MAX_FILES``, instead of one ``get_file`` call each.
+    """
+
+    def __init__(self):
+        self._lock = threading.Condition()
+        self._pending: Dict[str, _PendingFile] = {}
+        self._schedule = []
+        self._counter = itertools.count()
+        self._thread = None
+
+    def watch(self, uploaded_file, timeout: Optional[float] = None, callback=None) -> Future:
+        """
+        Registers a file and returns a future for its final state.
+
+        Args:
+            uploaded_file (File): The Gemini file returned by the upload.
+            timeout (float, optional): Seconds to wait before giving up.
+            callback (callable, optional): Called with the future once it is done.
+
+        Returns:
+            Future: Resolves to the file once it is ACTIVE or FAILED, or raises
+            TimeoutError when the deadline passes first.
+        """
+        future = Future()
+        span = get_tracer().start('processing', file=uploaded_file.name)
+        future.add_done_callback(lambda done: span.end(done.exception()))
+        if callback is not None:
+            future.add_done_callback(callback)
+
+        if uploaded_file.state.name != "PROCESSING":
+            future.set_result(uploaded_file)
+            return future
+
+        timeout = POLL_DEFAULT_TIMEOUT if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        with self._lock:
+            pending = self._pending.get(uploaded_file.name)
+            if pending is None:
+                pending = _PendingFile(uploaded_file.name, deadline)
+                self._pending[pending.name] = pending
+                self._push(pending, time.monotonic() + self._jittered(pending.delay))
+            else:
+                pending.deadline = max(pending.deadline, deadline)
+            pending.futures.append(future)
+            self._ensure_thread()
+            self._lock.notify()
+        return future
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    @staticmethod
+    def _jittered(delay: float) -> float:
+        return delay * random.uniform(1 - POLL_JITTER, 1 + POLL_JITTER)
+
+    def _push(self, pending: _PendingFile, due: float):
+        heapq.heappush(self._schedule, (due, next(self._counter), pending.name))
+
+    def _ensure_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._run, name="gemini-file-poller", daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while True:
+            with self._lock:
+                while not self._schedule:
+                    self._lock.wait()
+                now = time.monotonic()
+                due_at = self._schedule[0][0]
+                if due_at > now:
+                    self._lock.wait(due_at - now)
+                    continue
+                due = []
+                while self._schedule and self._schedule[0][0] <= now:
+                    _, _, name = heapq.heappop(self._schedule)
+                    if name in self._pending:
+                        due.append(self._pending[name])
+
+            if due:
+                states = self._refresh(due)
+                self._settle(due, states)
+
+    def _refresh(self, due) -> Dict[str, object]:
+        """Fetches the current state of every due file."""
+        states = {}
+        if len(due) >= POLL_BATCH_THRESHOLD:
+            wanted = {pending.name for pending in due}
+            files = genai.list_files(page_size=POLL_LIST_PAGE_SIZE)
+            listed = 0
+            try:
+                while len(states) < len(wanted) and listed < POLL_LIST_MAX_FILES:
+                    # One scheduler token per page of the listing
+                    page = scheduled('files', lambda: list(itertools.islice(files, POLL_LIST_PAGE_SIZE)))
+                    if not page:
+                        break
+                    listed += len(page)
+                    states.update((f.name, f) for f in page if f.name in wanted)
+            except Exception:
+                pass
+        # Files the listing did not reach are checked one by one
+        for pending in due:
+            if pending.name in states:
+                continue
+            try:
+                states[pending.name] = scheduled('files', genai.get_file, pending.name)
+            except Exception as e:
+                states[pending.name] = e
+        return states
+
+    def _settle(self, due, states):
+        now = time.monotonic()
+        for pending in due:
+            result = states.get(pending.name)
+            done = False
+            if isinstance(result, google_exceptions.NotFound):
+                done, outcome = True, FileNotFoundError(f"File '{pending.name}' no longer exists.")
+            elif isinstance(result, Exception):
+                if now >= pending.deadline:
+                    done, outcome = True, result
+            elif result.state.name != "PROCESSING":
+                done, outcome = True, result
+            elif now >= pending.deadline:
+                done, outcome = True, TimeoutError(f"File '{pending.name}' is still processing after the deadline.")
+
+            with self._lock:
+                if not done:
+                    pending.delay = min(pending.delay * POLL_BACKOFF_FACTOR, POLL_MAX_DELAY)
+                    self._push(pending, now + self._jittered(pending.delay))
+                    continue
+                self._pending.pop(pending.name, None)
+                futures, pending.futures = pending.futures, []
+
+            for future in futures:
+                if future.done():
+                    continue
+                if isinstance(outcome, Exception):
+                    future.set_exception(outcome)
+                else:
+                    future.set_result(outcome)
+
+
+_poller = None
+_poller_lock = threading.Lock()
+
+
+def get_file_poller() -> FilePoller:
+    """Returns the process-wide file poller shared by all sessions."""
+    global _poller
+    with _poller_lock:
+        if _poller is None:
+            _poller = FilePoller()
+        return _poller
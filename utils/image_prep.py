@@ -0,0 +1,88 @@
+import io
+import os
+import time
+from typing import Dict, Any, NamedTuple, Tuple
+
+from PIL import Image
+
+# Longest edge sent to the model; 0 disables resizing
+DETECTION_MAX_EDGE = int(os.getenv('DETECTION_MAX_EDGE', '1024'))
+DETECTION_IMAGE_FORMAT = os.getenv('DETECTION_IMAGE_FORMAT', 'JPEG')
+DETECTION_IMAGE_QUALITY = int(os.getenv('DETECTION_IMAGE_QUALITY', '85'))
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "WEBP": "image/webp", "PNG": "image/png"}
+
+
+class PreparedImage(NamedTuple):
+    part: Dict[str, Any]
+    original_size: Tuple[int, int]
+    sent_size: Tuple[int, int]
+    # Size of the decoded RGB pixels, not of any upload
+    raw_bytes: int
+    sent_bytes: int
+    encode_seconds: float
+
+
+def unprocessed_upload_bytes(image: Image.Image) -> int:
+    """
+    Returns the bytes the SDK would send for ``image`` without ``prepare_image``.
+
+    ``generate_content`` sends an image opened from a file on disk as that
+    file and any other image as lossless WebP, so this is the baseline that
+    preprocessing saves against. Encoding the WebP is not cheap; call it off
+    the request path.
+    """
+    filename = getattr(image, 'filename', None)
+    if filename and os.path.isfile(filename):
+        return os.path.getsize(filename)
+    buffer = io.BytesIO()
+    image.save(buffer, format="WEBP", lossless=True)
+    return buffer.tell()
+
+
+def prepare_image(image: Image.Image, max_edge: int = DETECTION_MAX_EDGE, image_format: str = DETECTION_IMAGE_FORMAT,
+                  quality: int = DETECTION_IMAGE_QUALITY) -> PreparedImage:
+    """
+    Downscales and re-encodes an image before it is sent for detection.
+
+    Detection boxes come back normalized to 0-1000, so the model does not need
+    the full resolution; the original size is kept so boxes can still be
+    mapped onto the full image with ``convert_normalized_to_pixel``.
+
+    Args:
+        image (PIL.Image.Image): The image to send.
+        max_edge (int): Longest edge of the sent image; 0 keeps the size.
+        image_format (str): ``"JPEG"``, ``"WEBP"`` or ``"PNG"``.
+        quality (int): Encoder quality for JPEG and WebP.
+
+    Returns:
+        PreparedImage: The inline blob for ``generate_content`` plus sizes
+        and encode time.
+    """
+    started = time.perf_counter()
+    image_format = image_format.upper()
+    if image_format not in _MIME_TYPES:
+        raise ValueError(f"Unsupported image format: {image_format}")
+
+    original_size = image.size
+    if image.mode != "RGB":
+        image = image.convert("RGB")
+    if max_edge and max(original_size) > max_edge:
+        image = image.copy()
+        image.thumbnail((max_edge, max_edge), reducing_gap=2.0)
+
+    buffer = io.BytesIO()
+    if image_format == "PNG":
+        image.save(buffer, format="PNG", optimize=True)
+    else:
+        image.save(buffer, format=image_format, quality=quality)
+    data = buffer.getvalue()
+
+    return PreparedImage(
+        part={'mime_type': _MIME_TYPES[image_format], 'data': data},
+        original_size=original_size,
+        sent_size=image.size,
+        raw_bytes=original_size[0] * original_size[1] * 3,
+        sent_bytes=len(data),
+        encode_seconds=time.perf_counter() - started,
+    )
@@ -0,0 +1,381 @@
+import hashlib
+import json
+import os
+import pathlib
+import shutil
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Optional, Dict, Any, List, Callable, NamedTuple
+
+from utils.model import load_model
+from utils.prompts import VideoAnalysis
+from utils.service import get_service
+from utils.tracing import trace
+from utils.transcription import OVERLAP_SECONDS, SEGMENT_SECONDS, TRANSCRIBE_WORKERS, transcribe_long_audio
+from utils.upload_index import hash_file
+from utils.video_analysis import ANALYSIS_WORKERS, WINDOW_SECONDS, analyze_video_windows
+
+JOB_DB_FILE = os.getenv('JOB_DB_FILE', '.cache/jobs.sqlite3')
+# Uploaded inputs are kept here until their job has finished
+JOB_INPUT_DIR = os.getenv('JOB_INPUT_DIR', '.cache/job_inputs')
+JOB_WORKERS = int(os.getenv('JOB_WORKERS', '2'))
+# Running jobs refresh their record this often; records silent for JOB_STALE_SECONDS are taken over
+JOB_HEARTBEAT_SECONDS = float(os.getenv('JOB_HEARTBEAT_SECONDS', '30'))
+JOB_STALE_SECONDS = 4 * JOB_HEARTBEAT_SECONDS
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobRecord(NamedTuple):
+    id: str
+    task: str
+    name: str
+    content_sha256: str
+    params: Dict[str, Any]
+    status: str
+    progress: float
+    message: str
+    result: Optional[Any]
+    error: Optional[str]
+    created_at: float
+    updated_at: float
+
+    @property
+    def finished(self) -> bool:
+        return self.status in (DONE, FAILED)
+
+
+_COLUMNS = ("id, task, name, content_sha256, params, status, progress, message, result, error, "
+            "created_at, updated_at")
+
+
+def _record(row) -> JobRecord:
+    (job_id, task, name, content_sha256, params, status, progress, message, result, error,
+     created_at, updated_at) = row
+    return JobRecord(
+        job_id, task, name, content_sha256, json.loads(params), status, progress, message or "",
+        json.loads(result) if result is not None else None, error, created_at, updated_at
+    )
+
+
+class JobContext:
+    """Handed to a running task to report progress."""
+
+    def __init__(self, queue: "JobQueue", job: JobRecord):
+        self.queue = queue
+        self.job = job
+
+    def progress(self, done: int, total: int, message: Optional[str] = None):
+        """Records ``done`` of ``total`` steps; usable as a ``progress_callback``."""
+        self.queue._update(self.job.id, progress=done / total if total else 0.0,
+                           message=message or f"{done} of {total}")
+
+
+class JobQueue:
+    """
+    SQLite-backed queue of long analyses run by a pool of worker threads.
+
+    A job is identified by its task, the SHA-256 of its input and its
+    parameters, so submitting the same upload again returns the existing
+    job, finished or not, instead of starting over. Inputs are copied to
+    ``JOB_INPUT_DIR`` and records live in ``JOB_DB_FILE``, so jobs outlive
+    Streamlit reruns and closed browsers, and queued or interrupted jobs
+    are picked up again after a restart. Running jobs send a heartbeat;
+    one whose process died is taken over once it has been silent for
+    ``JOB_STALE_SECONDS``.
+    """
+
+    def __init__(self, path: str = JOB_DB_FILE, input_dir: str = JOB_INPUT_DIR, workers: int = JOB_WORKERS):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.input_dir = pathlib.Path(input_dir)
+        self.input_dir.mkdir(parents=True, exist_ok=True)
+        self.workers = workers
+        self._tasks: Dict[str, Callable] = {}
+        self._running = set()
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._threads: List[threading.Thread] = []
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY,"
+            " idempotency_key TEXT UNIQUE NOT NULL,"
+            " task TEXT NOT NULL,"
+            " name TEXT NOT NULL,"
+            " content_sha256 TEXT NOT NULL,"
+            " params TEXT NOT NULL,"
+            " input_path TEXT,"
+            " status TEXT NOT NULL,"
+            " progress REAL NOT NULL DEFAULT 0,"
+            " message TEXT,"
+            " result TEXT,"
+            " error TEXT,"
+            " attempts INTEGER NOT NULL DEFAULT 0,"
+            " created_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def register(self, task: str, fn: Callable):
+        """Registers ``fn(context, input_path, **params)`` as the implementation of a task."""
+        self._tasks[task] = fn
+
+    def start(self):
+        """Starts the workers and the heartbeat thread; later calls do nothing."""
+        with self._lock:
+            if self._threads:
+                return
+            for index in range(self.workers):
+                thread = threading.Thread(target=self._work, name=f"job-worker-{index}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            thread = threading.Thread(target=self._heartbeat, name="job-heartbeat", daemon=True)
+            thread.start()
+            self._threads.append(thread)
+
+    @staticmethod
+    def idempotency_key(task: str, content_sha256: str, params: Dict[str, Any]) -> str:
+        payload = json.dumps([task, content_sha256, params], sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def submit(self, task: str, file, params: Optional[Dict[str, Any]] = None, rerun: bool = False) -> JobRecord:
+        """
+        Queues a task for an uploaded file, or returns the job that already covers it.
+
+        Args:
+            task (str): A registered task name.
+            file (IO): The input, such as a Streamlit upload; ``file.name`` is kept.
+            params (dict, optional): JSON-serializable task parameters.
+            rerun (bool): Queue a finished job again instead of returning its result. Jobs
+                that failed, or finished with failed windows or segments, are queued again
+                regardless.
+
+        Returns:
+            JobRecord: The queued, running or finished job.
+        """
+        if task not in self._tasks:
+            raise ValueError(f"Unknown task: {task}")
+        params = dict(params or {})
+        name = pathlib.Path(getattr(file, 'name', '') or task).name
+        content_sha256 = hash_file(file)
+        key = self.idempotency_key(task, content_sha256, params)
+
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, result FROM jobs WHERE idempotency_key = ?", (key,)
+            ).fetchone()
+            if row is not None and not self._should_requeue(row[1], row[2], rerun):
+                return self._get(row[0])
+
+        # Every submission gets its own copy, so a finishing job never removes an input another one needs
+        input_path = self.input_dir / f"{uuid.uuid4().hex}{pathlib.Path(name).suffix}"
+        partial = input_path.with_name(f"{input_path.name}.part")
+        file.seek(0)
+        with open(partial, 'wb') as f:
+            shutil.copyfileobj(file, f, length=1024 * 1024)
+        file.seek(0)
+        os.replace(partial, input_path)
+
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id, status, result FROM jobs WHERE idempotency_key = ?", (key,)
+            ).fetchone()
+            queued = True
+            if row is None:
+                job_id = uuid.uuid4().hex
+                self._conn.execute(
+                    "INSERT INTO jobs (id, idempotency_key, task, name, content_sha256, params, input_path, status,"
+                    " message, created_at, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (job_id, key, task, name, content_sha256, json.dumps(params), str(input_path), QUEUED,
+                     "Waiting for a worker", now, now)
+                )
+            else:
+                job_id = row[0]
+                # Another submission may have queued the job while the input was being copied
+                queued = self._should_requeue(row[1], row[2], rerun) and self._conn.execute(
+                    "UPDATE jobs SET status = ?, progress = 0, message = ?, result = NULL, error = NULL,"
+                    " input_path = ?, updated_at = ? WHERE id = ? AND status IN (?, ?)",
+                    (QUEUED, "Waiting for a worker", str(input_path), now, job_id, DONE, FAILED)
+                ).rowcount > 0
+            if queued:
+                self._wakeup.notify()
+            job = self._get(job_id)
+        if not queued:
+            os.remove(input_path)
+        self.start()
+        return job
+
+    @staticmethod
+    def _should_requeue(status: str, result: Optional[str], rerun: bool) -> bool:
+        if status in (QUEUED, RUNNING):
+            return False
+        if status == FAILED or rerun:
+            return True
+        # A finished job with failed windows or segments runs again; the response cache skips the rest
+        result = json.loads(result) if result else None
+        return isinstance(result, dict) and bool(result.get('failed'))
+
+    def _get(self, job_id: str) -> Optional[JobRecord]:
+        row = self._conn.execute(f"SELECT {_COLUMNS} FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _record(row) if row is not None else None
+
+    def get(self, job_id: str) -> Optional[JobRecord]:
+        with self._lock:
+            return self._get(job_id)
+
+    def recent(self, task: Optional[str] = None, limit: int = 20) -> List[JobRecord]:
+        """Returns the latest jobs, newest first."""
+        with self._lock:
+            if task is None:
+                rows = self._conn.execute(
+                    f"SELECT {_COLUMNS} FROM jobs ORDER BY created_at DESC LIMIT ?", (limit,)
+                ).fetchall()
+            else:
+                rows = self._conn.execute(
+                    f"SELECT {_COLUMNS} FROM jobs WHERE task = ? ORDER BY created_at DESC LIMIT ?", (task, limit)
+                ).fetchall()
+        return [_record(row) for row in rows]
+
+    def _update(self, job_id: str, **fields):
+        fields['updated_at'] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock:
+            self._conn.execute(f"UPDATE jobs SET {assignments} WHERE id = ?", (*fields.values(), job_id))
+
+    def _claim(self) -> Optional[tuple]:
+        stale_before = time.time() - JOB_STALE_SECONDS
+        rows = self._conn.execute(
+            "SELECT id, input_path FROM jobs WHERE status = ? OR (status = ? AND updated_at < ?)"
+            " ORDER BY created_at LIMIT 10",
+            (QUEUED, RUNNING, stale_before)
+        ).fetchall()
+        for job_id, input_path in rows:
+            # The status check makes the claim atomic across processes sharing the database
+            claimed = self._conn.execute(
+                "UPDATE jobs SET status = ?, message = ?, attempts = attempts + 1, updated_at = ?"
+                " WHERE id = ? AND (status = ? OR (status = ? AND updated_at < ?))",
+                (RUNNING, "Starting", time.time(), job_id, QUEUED, RUNNING, stale_before)
+            ).rowcount
+            if claimed:
+                self._running.add(job_id)
+                return self._get(job_id), input_path
+        return None
+
+    def _work(self):
+        while True:
+            with self._lock:
+                claimed = self._claim()
+                while claimed is None:
+                    self._wakeup.wait(JOB_HEARTBEAT_SECONDS)
+                    claimed = self._claim()
+            job, input_path = claimed
+            self._run(job, input_path)
+
+    def _run(self, job: JobRecord, input_path: str):
+        try:
+            fn = self._tasks.get(job.task)
+            if fn is None:
+                raise ValueError(f"Unknown task: {job.task}")
+            if not input_path or not os.path.exists(input_path):
+                raise FileNotFoundError("The job input is no longer available; submit the file again.")
+            with trace(job.task, job=job.id):
+                result = fn(JobContext(self, job), input_path, **job.params)
+            self._update(job.id, status=DONE, progress=1.0, message="Finished", result=json.dumps(result))
+        except Exception as e:
+            self._update(job.id, status=FAILED, message="Failed", error=str(e) or type(e).__name__)
+        finally:
+            with self._lock:
+                self._running.discard(job.id)
+                # Other jobs (or a resubmission) may still need the same input
+                in_use = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE input_path = ? AND status IN (?, ?)",
+                    (input_path, QUEUED, RUNNING)
+                ).fetchone()[0]
+            if input_path and not in_use:
+                try:
+                    os.remove(input_path)
+                except OSError:
+                    pass
+
+    def _heartbeat(self):
+        while True:
+            time.sleep(JOB_HEARTBEAT_SECONDS)
+            with self._lock:
+                running = list(self._running)
+                if running:
+                    self._conn.execute(
+                        f"UPDATE jobs SET updated_at = ? WHERE id IN ({', '.join('?' * len(running))})",
+                        (time.time(), *running)
+                    )
+
+
+def _analyze_video(context: JobContext, input_path: str, windowed: bool = False,
+                   window_seconds: float = WINDOW_SECONDS, max_workers: int = ANALYSIS_WORKERS,
+                   use_cache: bool = True) -> Dict[str, Any]:
+    model = load_model(type="video", schemaType=VideoAnalysis)
+    with open(input_path, 'rb') as f:
+        if windowed:
+            result = analyze_video_windows(
+                model, f, window_seconds=window_seconds, max_workers=max_workers, use_cache=use_cache,
+                reduce_model=load_model(type=None, schemaType=None), progress_callback=context.progress
+            )
+            if result['metadata'] is None:
+                raise RuntimeError("; ".join(error for _, error in result['failed']) or "Every window failed.")
+            return result
+
+        service = get_service()
+        context.progress(0, 3, "Uploading video")
+        remote_file = service.run(service.upload(f, display_name=context.job.name))
+    context.progress(1, 3, "Processing video")
+    remote_file = service.run(service.wait_active(remote_file))
+    context.progress(2, 3, "Generating metadata")
+    metadata = service.run(service.analyze_video(model, remote_file, use_cache=use_cache))
+    return {'metadata': metadata, 'windows': 1, 'cached': 0, 'failed': []}
+
+
+def _transcribe_audio(context: JobContext, input_path: str, long_audio: bool = False,
+                      segment_seconds: float = SEGMENT_SECONDS, overlap_seconds: float = OVERLAP_SECONDS,
+                      max_workers: int = TRANSCRIBE_WORKERS, use_cache: bool = True) -> Dict[str, Any]:
+    model = load_model(type=None, schemaType=None)
+    with open(input_path, 'rb') as f:
+        if long_audio:
+            result = transcribe_long_audio(
+                model, f, segment_seconds=segment_seconds, overlap_seconds=overlap_seconds,
+                max_workers=max_workers, use_cache=use_cache, progress_callback=context.progress
+            )
+            if not result['transcript']:
+                raise RuntimeError("; ".join(error for _, error in result['failed']) or "No transcript was produced.")
+            return result
+
+        service = get_service()
+        context.progress(0, 3, "Uploading audio")
+        remote_file = service.run(service.upload(f, display_name=context.job.name))
+    context.progress(1, 3, "Processing audio")
+    remote_file = service.run(service.wait_active(remote_file))
+    context.progress(2, 3, "Transcribing")
+    transcript = service.run(service.transcribe(model, remote_file, use_cache=use_cache))
+    return {'transcript': transcript, 'segments': 1, 'failed': []}
+
+
+_queue = None
+_queue_lock = threading.Lock()
+
+
+def get_job_queue() -> JobQueue:
+    """Returns the process-wide job queue with the analysis tasks registered and its workers running."""
+    global _queue
+    with _queue_lock:
+        if _queue is None:
+            _queue = JobQueue()
+            _queue.register("analyze_video", _analyze_video)
+            _queue.register("transcribe_audio", _transcribe_audio)
+            _queue.start()
+        return _queue
@@ -0,0 +1,81 @@
+import json
+from typing import Any, List
+
+
+class JsonArrayStream:
+    """
+    Incremental parser for a streamed top-level JSON array of objects.
+
+    Text is fed in arbitrary chunks; every element object is decoded and
+    returned as soon as its closing brace arrives. Anything before the first
+    ``[`` (such as a markdown code fence) is ignored, and each character is
+    scanned once, so the total cost is linear in the response length.
+    """
+
+    def __init__(self):
+        self._buffer: List[str] = []
+        self._started = False
+        self._finished = False
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._capturing = False
+
+    @property
+    def finished(self) -> bool:
+        """True once the closing bracket of the array was seen."""
+        return self._finished
+
+    def feed(self, chunk: str) -> List[Any]:
+        """
+        Consumes a chunk of text and returns the elements completed by it.
+
+        Raises:
+            ValueError: If a completed element is not valid JSON.
+        """
+        completed = []
+        if self._finished:
+            return completed
+
+        start = 0
+        for position, char in enumerate(chunk):
+            if not self._started:
+                if char == "[":
+                    self._started = True
+                    self._depth = 1
+                continue
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                continue
+
+            if char == '"':
+                self._in_string = True
+            elif char in "{[":
+                if self._depth == 1 and char == "{":
+                    self._capturing = True
+                    start = position
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+                if self._depth == 1 and self._capturing:
+                    self._buffer.append(chunk[start:position + 1])
+                    text = "".join(self._buffer)
+                    self._buffer = []
+                    self._capturing = False
+                    try:
+                        completed.append(json.loads(text))
+                    except json.JSONDecodeError as e:
+                        raise ValueError(f"Invalid JSON element in stream: {e}")
+                elif self._depth == 0:
+                    self._finished = True
+                    break
+
+        if self._capturing:
+            self._buffer.append(chunk[start:])
+        return completed
@@ -0,0 +1,291 @@
+import re
+import time
+from typing import Dict, Optional
+
+# Patterns of the stages whose regex form is already linear, compiled once
+_HEADER = re.compile(r'(^|\s)#+\s+')
+_INLINE_CODE = re.compile(r'`{1,3}([^`]*)`{1,3}')
+_BLOCKQUOTE = re.compile(r'^>\s+', flags=re.MULTILINE)
+_HORIZONTAL_RULE = re.compile(r'(^|\n)(-{3,}|_{3,}|\*{3,})(\n|$)')
+_LEFTOVER_CHARACTERS = str.maketrans('', '', '*_~`')
+_EMPHASIS_CHARACTER = re.compile(r'[*_~]')
+
+_JSON_FENCE = re.compile(r'```[a-zA-Z]*[ \t]*\n')
+
+
+class _Finder:
+    """
+    Memoized ``str.find`` for scans that only move forward.
+
+    A stage asks for the next occurrence of a needle at or after a position
+    that never decreases, so a previous answer stays valid until the scan
+    passes it; each needle is searched over the text at most once in total.
+    """
+
+    def __init__(self, text: str):
+        self.text = text
+        self._last: Dict[str, tuple] = {}
+
+    def next(self, needle: str, start: int) -> int:
+        last = self._last.get(needle)
+        if last is not None and last[0] <= start and (last[1] == -1 or last[1] >= start):
+            return last[1]
+        found = self.text.find(needle, start)
+        self._last[needle] = (start, found)
+        return found
+
+
+def _strip_emphasis(text: str) -> str:
+    # Equivalent of re.sub(r'(\*{1,2}|_{1,2}|~~)(.*?)\1', r'\2', text): a
+    # delimiter pairs with its first repetition later on the same line.
+    finder = _Finder(text)
+    length = len(text)
+    out = []
+    copied = 0
+    match = _EMPHASIS_CHARACTER.search(text)
+    while match is not None:
+        i = match.start()
+        char = text[i]
+        line_end = finder.next('\n', i)
+        if line_end == -1:
+            line_end = length
+        doubled = i + 1 < length and text[i + 1] == char
+        if char == '~':
+            candidates = ('~~',) if doubled else ()
+        else:
+            candidates = (char * 2, char) if doubled else (char,)
+        for delimiter in candidates:
+            closing = finder.next(delimiter, i + len(delimiter))
+            if closing != -1 and closing < line_end:
+                out.append(text[copied:i])
+                out.append(text[i + len(delimiter):closing])
+                copied = closing + len(delimiter)
+                match = _EMPHASIS_CHARACTER.search(text, copied)
+                break
+        else:
+            match = _EMPHASIS_CHARACTER.search(text, i + 1)
+    out.append(text[copied:])
+    return ''.join(out)
+
+
+def _strip_code_blocks(text: str) -> str:
+    # Equivalent of re.sub(r'```[a-zA-Z]*\n([\s\S]*?)\n```', r'\1', text)
+    out = []
+    copied = 0
+    i = text.find('```')
+    while i != -1:
+        body = i + 3
+        while body < len(text) and text[body].isascii() and text[body].isalpha():
+            body += 1
+        if body < len(text) and text[body] == '\n':
+            closing = text.find('\n```', body + 1)
+            if closing == -1:
+                # No later fence can be closed either
+                break
+            out.append(text[copied:i])
+            out.append(text[body + 1:closing])
+            copied = closing + 4
+            i = text.find('```', copied)
+        else:
+            i = text.find('```', i + 1)
+    out.append(text[copied:])
+    return ''.join(out)
+
+
+def _strip_links(text: str, prefix: str) -> str:
+    # Equivalent of re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', text) for
+    # prefix "[", and of the image pattern r'!\[([^\]]*)\]\([^\)]+\)' for "![".
+    finder = _Finder(text)
+    min_label = 1 if prefix == '[' else 0
+    out = []
+    copied = 0
+    i = text.find(prefix)
+    while i != -1:
+        label = i + len(prefix)
+        closing = finder.next(']', label)
+        if closing == -1:
+            break
+        if closing - label >= min_label and text.startswith('(', closing + 1):
+            url_end = finder.next(')', closing + 2)
+            if url_end == -1:
+                break
+            if url_end > closing + 2:
+                out.append(text[copied:i])
+                out.append(text[label:closing])
+                copied = url_end + 1
+                i = text.find(prefix, copied)
+                continue
+        i = text.find(prefix, i + 1)
+    out.append(text[copied:])
+    return ''.join(out)
+
+
+def _strip_list_markers(text: str) -> str:
+    # Equivalent of re.sub(r'(^|\n)(\s*[-+*]|\d+\.)\s+', r'\1', text). The
+    # leading \s* never needs to backtrack, so the end of each whitespace run
+    # is computed once and shared by every line start inside it.
+    length = len(text)
+    run = [-1, -1]
+
+    def whitespace_end(start: int) -> int:
+        if run[0] <= start <= run[1]:
+            return run[1]
+        end = start
+        while end < length and text[end].isspace():
+            end += 1
+        run[0], run[1] = start, end
+        return end
+
+    def marker_end(start: int) -> Optional[int]:
+        marker = whitespace_end(start)
+        if marker < length and text[marker] in '-+*':
+            after = marker + 1
+        else:
+            after = start
+            while after < length and text[after].isdecimal():
+                after += 1
+            if after == start or after >= length or text[after] != '.':
+                return None
+            after += 1
+        if after < length and text[after].isspace():
+            return whitespace_end(after)
+        return None
+
+    out = []
+    copied = 0
+    line_start = 0
+    while line_start != -1 and line_start < length:
+        end = marker_end(0) if line_start == 0 else None
+        keep = ''
+        if end is None and text[line_start] == '\n':
+            end = marker_end(line_start + 1)
+            keep = '\n'
+        if end is not None:
+            out.append(text[copied:line_start])
+            out.append(keep)
+            copied = end
+            line_start = text.find('\n', end)
+        else:
+            line_start = text.find('\n', line_start + 1)
+    out.append(text[copied:])
+    return ''.join(out)
+
+
+def remove_markdown(text):
+    """
+    Remove Markdown formatting from the given text.
+
+    The stages run in the historical order, since later stages see the output
+    of earlier ones, but each one is a linear scan or a precompiled pattern
+    and is skipped when its trigger characters do not occur in the text.
+
+    Args:
+        text (str): The input text containing Markdown.
+
+    Returns:
+        str: The text without any Markdown formatting.
+    """
+    if '#' in text:
+        text = _HEADER.sub('', text)
+    if '*' in text or '_' in text or '~' in text:
+        text = _strip_emphasis(text)
+    if '```' in text:
+        text = _strip_code_blocks(text)
+    if '`' in text:
+        text = _INLINE_CODE.sub(r'\1', text)
+    if '[' in text:
+        text = _strip_links(text, '[')
+    if '![' in text:
+        text = _strip_links(text, '![')
+    if '>' in text:
+        text = _BLOCKQUOTE.sub('', text)
+    if '---' in text or '___' in text or '***' in text:
+        text = _HORIZONTAL_RULE.sub(r'\1', text)
+    if '-' in text or '+' in text or '*' in text or '.' in text:
+        text = _strip_list_markers(text)
+    return text.translate(_LEFTOVER_CHARACTERS).strip()
+
+
+def extract_json_block(text: str) -> str:
+    """
+    Returns the JSON payload of a model response without a full markdown pass.
+
+    The body of the first fenced code block is returned when there is one;
+    otherwise the text from the first ``[`` or ``{`` to the last ``]`` or
+    ``}``. Unlike ``remove_markdown`` this leaves ``*``, ``_`` and ``~``
+    inside string values untouched.
+
+    Args:
+        text (str): The raw response text.
+
+    Returns:
+        str: The candidate JSON text, stripped.
+    """
+    fence = _JSON_FENCE.search(text)
+    if fence is not None:
+        closing = text.find('```', fence.end())
+        return text[fence.end():closing if closing != -1 else len(text)].strip()
+
+    starts = [position for position in (text.find('['), text.find('{')) if position != -1]
+    if not starts:
+        return text.strip()
+    end = max(text.rfind(']'), text.rfind('}'))
+    start = min(starts)
+    return text[start:end + 1].strip() if end > start else text[start:].strip()
+
+
+# The original regex cascade, kept as the reference for ``benchmark``
+_REFERENCE_STAGES = [
+    (re.compile(r'(^|\s)#+\s+'), ''),
+    (re.compile(r'(\*{1,2}|_{1,2}|~~)(.*?)\1'), r'\2'),
+    (re.compile(r'```[a-zA-Z]*\n([\s\S]*?)\n```'), r'\1'),
+    (re.compile(r'`{1,3}([^`]*)`{1,3}'), r'\1'),
+    (re.compile(r'\[([^\]]+)\]\([^\)]+\)'), r'\1'),
+    (re.compile(r'!\[([^\]]*)\]\([^\)]+\)'), r'\1'),
+    (re.compile(r'^>\s+', flags=re.MULTILINE), ''),
+    (re.compile(r'(^|\n)(-{3,}|_{3,}|\*{3,})(\n|$)'), r'\1'),
+    (re.compile(r'(^|\n)(\s*[-+*]|\d+\.)\s+'), r'\1'),
+    (re.compile(r'[*_~`]'), ''),
+]
+
+
+def _reference_remove_markdown(text: str) -> str:
+    for pattern, replacement in _REFERENCE_STAGES:
+        text = pattern.sub(replacement, text)
+    return text.strip()
+
+
+def benchmark(repeat: int = 5) -> Dict[str, float]:
+    """Times the regex cascade against ``remove_markdown`` on a long report; returns the best seconds of each."""
+    section = (
+        "## Scene 3\n\n"
+        "**Speaker A**: We _really_ need the [report](https://example.com/r) by Friday.\n"
+        "> Quoted remark with `inline code` and ~~struck~~ text.\n\n"
+        "1. First item\n- second item\n  * nested item\n\n---\n"
+        "```json\n[{\"name\": \"dog\", \"ymin\": 1, \"xmin\": 2, \"ymax\": 3, \"xmax\": 4}]\n```\n"
+        "Plain sentence without any markup at all, repeated to look like prose.\n"
+    )
+    documents = {
+        'report': section * 2000,
+        'plain': "Plain transcript text without markup.\n" * 20000,
+    }
+
+    def best(fn, text):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            fn(text)
+            timings.append(time.perf_counter() - started)
+        return min(timings)
+
+    results = {}
+    for name, text in documents.items():
+        assert remove_markdown(text) == _reference_remove_markdown(text)
+        results[f'{name}_regex_cascade'] = best(_reference_remove_markdown, text)
+        results[f'{name}_remove_markdown'] = best(remove_markdown, text)
+    return results
+
+
+if __name__ == "__main__":
+    for name, seconds in benchmark().items():
+        print(f"{name:>26}: {seconds * 1000:8.2f} ms")
@@ -0,0 +1,134 @@
+import json
+import pathlib
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Iterable, List, NamedTuple
+
+# Number of ffmpeg processes cutting segments at the same time
+CUT_WORKERS = 4
+
+
+class Segment(NamedTuple):
+    index: int
+    start: float
+    end: float
+    path: pathlib.Path
+
+
+def _require(tool: str) -> str:
+    path = shutil.which(tool)
+    if path is None:
+        raise RuntimeError(f"'{tool}' was not found on PATH; it is required to split media locally.")
+    return path
+
+
+def save_upload(file, directory: str) -> pathlib.Path:
+    """
+    Writes an uploaded file into a directory so ffmpeg can seek in it.
+
+    Args:
+        file (UploadedFile): The Streamlit upload.
+        directory (str): Destination directory, typically a TemporaryDirectory.
+
+    Returns:
+        pathlib.Path: The path of the written file.
+    """
+    suffix = pathlib.Path(file.name).suffix
+    path = pathlib.Path(directory) / f"source{suffix}"
+    file.seek(0)
+    with open(path, 'wb') as f:
+        shutil.copyfileobj(file, f, length=1024 * 1024)
+    file.seek(0)
+    return path
+
+
+def probe_duration(path) -> float:
+    """Returns the duration of a media file in seconds using ffprobe."""
+    ffprobe = _require("ffprobe")
+    result = subprocess.run(
+        [ffprobe, "-v", "error", "-show_entries", "format=duration", "-of", "json", str(path)],
+        capture_output=True, check=True, text=True
+    )
+    return float(json.loads(result.stdout)["format"]["duration"])
+
+
+def plan_segments(duration: float, segment_seconds: float, overlap_seconds: float = 0.0) -> List[tuple]:
+    """
+    Splits ``[0, duration]`` into windows of ``segment_seconds`` that overlap.
+
+    Returns:
+        list of tuple: ``(start, end)`` pairs in seconds.
+    """
+    if segment_seconds <= overlap_seconds:
+        raise ValueError("segment_seconds must be larger than overlap_seconds.")
+    windows = []
+    start = 0.0
+    while start < duration:
+        end = min(start + segment_seconds, duration)
+        windows.append((start, end))
+        if end >= duration:
+            break
+        start = end - overlap_seconds
+    return windows
+
+
+def _cut(ffmpeg: str, source, start: float, end: float, target: pathlib.Path, codec_args: List[str]):
+    subprocess.run(
+        [ffmpeg, "-v", "error", "-y", "-ss", f"{start:.3f}", "-to", f"{end:.3f}", "-i", str(source),
+         *codec_args, str(target)],
+        check=True
+    )
+
+
+def split_media(source, segment_seconds: float, overlap_seconds: float = 0.0, out_dir: Optional[str] = None,
+                kind: str = "audio", max_workers: int = CUT_WORKERS,
+                only: Optional[Iterable[int]] = None) -> List[Segment]:
+    """
+    Cuts a media file into overlapping segments with ffmpeg.
+
+    Audio is re-encoded to 16 kHz mono FLAC, which is small to upload and
+    lossless for speech. Video segments are re-encoded so cuts land exactly
+    on the requested times instead of the nearest keyframe.
+
+    Args:
+        source (str or Path): The media file to split.
+        segment_seconds (float): Length of each segment.
+        overlap_seconds (float): Overlap between consecutive segments.
+        out_dir (str, optional): Where segments are written; a temporary
+            directory is created when omitted.
+        kind (str): ``"audio"`` or ``"video"``.
+        max_workers (int): Number of ffmpeg processes run concurrently.
+        only (iterable of int, optional): Indices of the segments to cut;
+            the others are planned but not written.
+
+    Returns:
+        list of Segment: The segments in playback order.
+    """
+    ffmpeg = _require("ffmpeg")
+    duration = probe_duration(source)
+    out_dir = pathlib.Path(out_dir or tempfile.mkdtemp(prefix="segments-"))
+    out_dir.mkdir(parents=True, exist_ok=True)
+
+    if kind == "audio":
+        codec_args, suffix = ["-vn", "-ac", "1", "-ar", "16000", "-c:a", "flac"], ".flac"
+    elif kind == "video":
+        codec_args, suffix = ["-c:v", "libx264", "-preset", "veryfast", "-crf", "28", "-c:a", "aac"], ".mp4"
+    else:
+        raise ValueError(f"Unsupported media kind: {kind}")
+
+    segments = [
+        Segment(index, start, end, out_dir / f"segment_{index:04d}{suffix}")
+        for index, (start, end) in enumerate(plan_segments(duration, segment_seconds, overlap_seconds))
+    ]
+    only = None if only is None else set(only)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_cut, ffmpeg, source, segment.start, segment.end, segment.path, codec_args)
+            for segment in segments
+            if only is None or segment.index in only
+        ]
+        for future in futures:
+            future.result()
+    return segments
@@ -2,15 +2,94 @@ import google.generativeai as genai
 from google.generativeai.types import GenerationConfig
 from dotenv import load_dotenv
 import os
-from google.generativeai import caching
-import datetime
+import json
+import threading
+
+# Process-wide registry of configured models, shared by every session and rerun
+_models = {}
+_model_keys = {}
+_registry_lock = threading.Lock()
+_configured = False
+
+
+def configure():
+  """Loads the environment and configures the Gemini client once per process."""
+  global _configured
+  with _registry_lock:
+      if not _configured:
+          load_dotenv()
+          genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
+          _configured = True
+
+
+def schema_fingerprint(schemaType):
+  """Returns a stable identifier for a response schema class.
+
+  TypedDicts declared inside a tab function are new class objects on every
+  rerun, so the class itself cannot be used as a cache key.
+  """
+  if schemaType is None:
+      return None
+  annotations = getattr(schemaType, '__annotations__', {})
+  fields = ",".join(f"{name}:{annotation!r}" for name, annotation in annotations.items())
+  return f"{schemaType.__module__}.{schemaType.__qualname__}({fields})"
+
+
+def _registry_key(model_name, generation_config, system_instruction):
+  config = dict(generation_config or {})
+  if 'response_schema' in config:
+      config['response_schema'] = schema_fingerprint(config['response_schema'])
+  return json.dumps(
+      {'model': model_name, 'config': config, 'system_instruction': system_instruction},
+      sort_keys=True,
+      default=str
+  )
+
+
+def get_model(model_name=None, generation_config=None, system_instruction=None):
+  """
+  Returns the shared GenerativeModel for a model name and configuration.
+
+  Args:
+      model_name (str, optional): Gemini model, defaults to the MODEL env variable.
+      generation_config (dict, optional): Keyword arguments for GenerationConfig.
+      system_instruction (str, optional): System instruction for the model.
+
+  Returns:
+      GenerativeModel: A model built once and reused for identical keys.
+  """
+  configure()
+  # Default model is latest Gemini 1.5 Pro
+  model_name = model_name or os.getenv('MODEL', 'gemini-1.5-pro-latest')
+  key = _registry_key(model_name, generation_config, system_instruction)
+  with _registry_lock:
+      model = _models.get(key)
+      if model is None:
+          model = genai.GenerativeModel(
+              model_name=model_name,
+              generation_config=GenerationConfig(**generation_config) if generation_config else None,
+              system_instruction=system_instruction
+          )
+          _models[key] = model
+          _model_keys[id(model)] = key
+      return model
+
+
+def register_model_key(model, key):
+  """Records the key describing a model built outside ``get_model``, such as one from cached content."""
+  with _registry_lock:
+      _model_keys[id(model)] = key
+
+
+def model_key(model):
+  """Returns the registry key describing a model, or its name if unregistered."""
+  return _model_keys.get(id(model), getattr(model, 'model_name', repr(model)))
+
 
 def load_model(type, schemaType):
-  load_dotenv()
-  genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
   if type is not None and schemaType is not None:
       # Configuration when both type and schemaType are provided
-      generation_config = GenerationConfig(
+      generation_config = dict(
           temperature=0.7,
           top_p=0.9,
           top_k=40,
@@ -21,33 +100,36 @@ def load_model(type, schemaType):
       )
   else:
       # Default configuration when type or schemaType is not provided
-      generation_config = GenerationConfig(
+      generation_config = dict(
           temperature=0.9,
           top_p=1.0,
           top_k=32,
           candidate_count=1,
           max_output_tokens=8192
       )
-  
-  # Default model is latest Gemini 1.5 Pro
-  model_name = os.getenv('MODEL', 'gemini-1.5-pro-latest')
-  model = genai.GenerativeModel(model_name=model_name, generation_config=generation_config)
-  return model
+
+  return get_model(generation_config=generation_config)
 
 
 def load_cached_content_model(contents, display_name, system_instruction, ttl_minutes=5):
-  print('loading cached content model')
-  load_dotenv() 
-  genai.configure(api_key=os.getenv('GOOGLE_API_KEY'))
-  # Create a cache with the specified TTL
-  cache = caching.CachedContent.create(
-      model=os.getenv('CACHING_MODEL'),
+  """
+  Returns the model and contents to use for a cached system instruction and context.
+
+  The entry is managed by ``utils.context_cache``: it is created once, reused
+  and renewed while in use. When the service cannot cache the context, the
+  model only carries the system instruction, and the context is returned
+  as contents to prepend to every request.
+
+  Returns:
+      ContextModel: ``model``, ``contents`` to prepend (empty when cached) and
+      ``cached``.
+  """
+  from utils.context_cache import CONTEXT_CACHE_MODEL, get_context_cache
+
+  return get_context_cache().get(
+      system_instruction,
+      contents,
+      model_name=CONTEXT_CACHE_MODEL,
       display_name=display_name,
-      system_instruction=system_instruction,
-      contents=contents,
-      ttl=datetime.timedelta(minutes=ttl_minutes),
+      ttl_seconds=ttl_minutes * 60
   )
-  print('cache',cache)
-  # Construct a GenerativeModel which uses the created cache.
-  model = genai.GenerativeModel.from_cached_content(cached_content=cache)
-  return model
@@ -0,0 +1,139 @@
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, List, NamedTuple, Optional
+
+from PIL import Image
+
+from utils.model import model_key
+
+# Maximum number of differing bits (out of 64) for two images to count as the same
+DETECTION_HASH_THRESHOLD = int(os.getenv('DETECTION_HASH_THRESHOLD', '6'))
+DETECTION_HASH_CACHE_SIZE = int(os.getenv('DETECTION_HASH_CACHE_SIZE', '256'))
+# Relative aspect ratio difference tolerated between near-duplicates, so crops are not matched
+DETECTION_HASH_ASPECT_TOLERANCE = 0.02
+
+_ALL_QUERIES = {"", "all", "all objects", "everything", "any", "anything"}
+
+
+class ImageFingerprint(NamedTuple):
+    hash: int
+    aspect: float
+
+
+def difference_hash(image: Image.Image) -> int:
+    """
+    Returns the 64-bit difference hash (dHash) of an image.
+
+    The image is shrunk to 9x8 grey pixels and each bit records whether a
+    pixel is brighter than its right neighbour, so re-encoding, resizing and
+    small colour changes flip only a few bits.
+    """
+    if image.mode not in ("L", "RGB"):
+        image = image.convert("RGB")
+    small = image.resize((9, 8), Image.Resampling.BOX, reducing_gap=2.0).convert("L")
+    pixels = small.tobytes()
+    value = 0
+    for row in range(8):
+        offset = row * 9
+        for column in range(8):
+            value = (value << 1) | (pixels[offset + column] > pixels[offset + column + 1])
+    return value
+
+
+def fingerprint(image: Image.Image) -> ImageFingerprint:
+    """Returns the hash and aspect ratio used to match near-duplicate images."""
+    return ImageFingerprint(difference_hash(image), image.width / image.height)
+
+
+def normalize_query(object_name: str) -> str:
+    """Lowercases and collapses an object query; every "detect all" spelling becomes ``"all"``."""
+    query = re.sub(r'\s+', ' ', object_name.strip().lower()).strip(" .!?")
+    return "all" if query in _ALL_QUERIES else query
+
+
+class DetectionCache:
+    """
+    LRU cache of normalized detection results keyed by perceptual image hash.
+
+    Entries are grouped by model and normalized query; a lookup returns the
+    boxes of the closest matching-aspect entry within the Hamming threshold,
+    preferring the most recently used on ties. Boxes are stored in the model's
+    0-1000 space so they can be mapped onto any size of the same image.
+    """
+
+    def __init__(self, max_entries: int = DETECTION_HASH_CACHE_SIZE, threshold: int = DETECTION_HASH_THRESHOLD):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self._entries: "OrderedDict[tuple, List[Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._hits = 0
+        self._misses = 0
+
+    @staticmethod
+    def _group(model, object_name: str) -> tuple:
+        return model_key(model), normalize_query(object_name)
+
+    def lookup(self, model, object_name: str, image_fingerprint: ImageFingerprint) -> Optional[List[Dict[str, Any]]]:
+        """
+        Returns cached normalized boxes for a near-duplicate image, or None.
+        """
+        group = self._group(model, object_name)
+        with self._lock:
+            best_key, best_distance = None, self.threshold + 1
+            for key in reversed(self._entries):
+                if key[0] != group:
+                    continue
+                aspect = key[2]
+                if abs(aspect - image_fingerprint.aspect) > DETECTION_HASH_ASPECT_TOLERANCE * aspect:
+                    continue
+                distance = bin(key[1] ^ image_fingerprint.hash).count("1")
+                if distance < best_distance:
+                    best_key, best_distance = key, distance
+                    if distance == 0:
+                        break
+            if best_key is None:
+                self._misses += 1
+                return None
+            self._entries.move_to_end(best_key)
+            self._hits += 1
+            return [dict(box) for box in self._entries[best_key]]
+
+    def store(self, model, object_name: str, image_fingerprint: ImageFingerprint,
+              bounding_boxes: List[Dict[str, Any]]):
+        """Stores normalized boxes, evicting the least recently used entry when full."""
+        key = (self._group(model, object_name), image_fingerprint.hash, image_fingerprint.aspect)
+        with self._lock:
+            self._entries[key] = [dict(box) for box in bounding_boxes]
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._hits = self._misses = 0
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self._hits + self._misses
+            return {
+                'hits': self._hits,
+                'misses': self._misses,
+                'hit_rate': self._hits / lookups if lookups else 0.0,
+                'entries': len(self._entries),
+            }
+
+
+_detection_cache = None
+_detection_cache_lock = threading.Lock()
+
+
+def get_detection_cache() -> DetectionCache:
+    """Returns the process-wide detection cache."""
+    global _detection_cache
+    with _detection_cache_lock:
+        if _detection_cache is None:
+            _detection_cache = DetectionCache()
+        return _detection_cache
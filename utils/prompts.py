@@ -0,0 +1,22 @@
+from typing import TypedDict, Optional, List
+
+
+class VideoAnalysis(TypedDict):
+    """Response schema of the video metadata request."""
+    name: str
+    title: str
+    total_duration: float  # Duration in seconds
+    summary: str
+    small_summary: str
+    tags: Optional[List[str]]
+
+
+METADATA_PROMPT = "Provide the details based on provided response schema"
+
+TRANSCRIPTION_PROMPT = """
+Please transcribe this interview in the following format:
+[Speaker Name or Speaker A/B]: [Dialogue or caption].
+If a speaker's name is mentioned or can be identified in the audio, map the actual names accordingly.
+If no names are given, use Speaker A, Speaker B, etc.
+Ensure the transcription captures all spoken words accurately, including filler words where appropriate.
+"""
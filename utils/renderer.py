@@ -0,0 +1,123 @@
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Dict, Any, List, Tuple
+
+from PIL import Image, ImageDraw, ImageFont
+
+# Fonts tried in order before falling back to Pillow's bundled font
+FONT_CANDIDATES = ("arial.ttf", "DejaVuSans.ttf", "LiberationSans-Regular.ttf", "Helvetica.ttc")
+
+# Number of rendered label sprites kept in memory
+SPRITE_CACHE_SIZE = 1024
+
+BOX_COLOR = (255, 0, 0, 255)
+LABEL_BACKGROUND = (255, 255, 0, 255)
+LABEL_TEXT = (0, 0, 0, 255)
+
+
+@lru_cache(maxsize=32)
+def load_font(size: int) -> ImageFont.ImageFont:
+    """Loads a TrueType font of the given size once per process."""
+    for candidate in FONT_CANDIDATES:
+        try:
+            return ImageFont.truetype(candidate, size)
+        except OSError:
+            continue
+    try:
+        return ImageFont.load_default(size=size)
+    except TypeError:
+        # Pillow < 10.1 has no sized default font
+        return ImageFont.load_default()
+
+
+def scale_for(image_size: Tuple[int, int]) -> Tuple[int, int]:
+    """Returns ``(line_width, font_size)`` proportional to the shorter image side."""
+    short_side = min(image_size)
+    line_width = max(1, round(short_side / 400))
+    font_size = int(min(64, max(12, short_side / 40)))
+    return line_width, font_size
+
+
+class BoxRenderer:
+    """
+    Draws labeled bounding boxes with cached fonts and label sprites.
+
+    All boxes of an image are drawn onto one transparent overlay which is
+    composited onto the image a single time. Label sprites (text on a
+    background) are rendered once per text and font size and then reused.
+    """
+
+    def __init__(self, sprite_cache_size: int = SPRITE_CACHE_SIZE):
+        self._sprites: "OrderedDict[Tuple[str, int], Image.Image]" = OrderedDict()
+        self._sprite_cache_size = sprite_cache_size
+        self._lock = threading.Lock()
+
+    def label_sprite(self, text: str, font_size: int) -> Image.Image:
+        """Returns the RGBA sprite for a label, rendering it on first use."""
+        key = (text, font_size)
+        with self._lock:
+            sprite = self._sprites.get(key)
+            if sprite is not None:
+                self._sprites.move_to_end(key)
+                return sprite
+
+        font = load_font(font_size)
+        left, top, right, bottom = font.getbbox(text)
+        padding = max(2, font_size // 8)
+        sprite = Image.new("RGBA", (right - left + 2 * padding, bottom - top + 2 * padding), LABEL_BACKGROUND)
+        ImageDraw.Draw(sprite).text((padding - left, padding - top), text, fill=LABEL_TEXT, font=font)
+
+        with self._lock:
+            self._sprites[key] = sprite
+            if len(self._sprites) > self._sprite_cache_size:
+                self._sprites.popitem(last=False)
+        return sprite
+
+    def render(self, image: Image.Image, bounding_boxes: List[Dict[str, Any]]) -> Image.Image:
+        """
+        Returns a copy of ``image`` with the boxes and their labels drawn.
+
+        Args:
+            image (PIL.Image.Image): The original image.
+            bounding_boxes (list of dict): Boxes with pixel coordinates.
+
+        Returns:
+            PIL.Image.Image: The annotated image, in the mode of the input.
+        """
+        if not bounding_boxes:
+            return image.copy()
+
+        line_width, font_size = scale_for(image.size)
+        overlay = Image.new("RGBA", image.size, (0, 0, 0, 0))
+        draw = ImageDraw.Draw(overlay)
+        for box in bounding_boxes:
+            draw.rectangle([box['xmin'], box['ymin'], box['xmax'], box['ymax']], outline=BOX_COLOR, width=line_width)
+
+        # Labels are opaque, so a plain paste on top of the outlines is enough
+        for box in bounding_boxes:
+            sprite = self.label_sprite(str(box['name']), font_size)
+            x = int(min(max(0, box['xmin']), max(0, image.width - sprite.width)))
+            y = int(max(0, box['ymin'] - sprite.height))
+            overlay.paste(sprite, (x, y))
+
+        base = image.convert("RGBA")
+        base.alpha_composite(overlay)
+        return base if image.mode == "RGBA" else base.convert(image.mode)
+
+    def render_batch(self, images: List[Image.Image], boxes_per_image: List[List[Dict[str, Any]]]) -> List[Image.Image]:
+        """Renders many images, sharing fonts and sprites between them."""
+        return [self.render(image, boxes or []) for image, boxes in zip(images, boxes_per_image)]
+
+
+_renderer = None
+_renderer_lock = threading.Lock()
+
+
+def get_renderer() -> BoxRenderer:
+    """Returns the process-wide renderer."""
+    global _renderer
+    with _renderer_lock:
+        if _renderer is None:
+            _renderer = BoxRenderer()
+        return _renderer
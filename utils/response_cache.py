@@ -0,0 +1,198 @@
+import hashlib
+import json
+import os
+import pathlib
+import sqlite3
+import threading
+import time
+from typing import Optional, Dict, Any, List
+
+from utils.model import model_key
+from utils.scheduler import scheduled
+from utils.tracing import trace
+
+# SQLite file holding cached model responses
+RESPONSE_CACHE_FILE = os.getenv('RESPONSE_CACHE_FILE', '.cache/responses.sqlite3')
+
+# Total size of cached responses before least recently used entries are evicted
+RESPONSE_CACHE_MAX_BYTES = int(os.getenv('RESPONSE_CACHE_MAX_BYTES', str(256 * 1024 * 1024)))
+
+# Optional expiry of cached responses in seconds (unset = never expire)
+RESPONSE_CACHE_TTL = float(os.getenv('RESPONSE_CACHE_TTL_SECONDS', '0')) or None
+
+
+def content_key(part) -> str:
+    """
+    Returns a stable identifier for one element of a ``generate_content`` request.
+
+    Uploaded Gemini files are identified by the SHA-256 the File API computed
+    for them, images and raw blobs by a hash of their bytes, and text by itself.
+    """
+    if isinstance(part, str):
+        return part
+    if isinstance(part, (bytes, bytearray, memoryview)):
+        return "bytes:" + hashlib.sha256(part).hexdigest()
+    if isinstance(part, dict) and 'data' in part:
+        return f"blob:{part.get('mime_type')}:" + hashlib.sha256(part['data']).hexdigest()
+    if hasattr(part, 'tobytes') and hasattr(part, 'size') and hasattr(part, 'mode'):
+        digest = hashlib.sha256(f"{part.mode}:{part.size}".encode())
+        digest.update(part.tobytes())
+        return "image:" + digest.hexdigest()
+    sha256_hash = getattr(part, 'sha256_hash', None)
+    if sha256_hash:
+        return "file:" + (sha256_hash.hex() if isinstance(sha256_hash, bytes) else str(sha256_hash))
+    name = getattr(part, 'name', None)
+    if name:
+        return "file:" + name
+    return repr(part)
+
+
+def inline_bytes(contents) -> int:
+    """Bytes of the text and inline blobs in a request; uploaded files were sent separately."""
+    if not isinstance(contents, (list, tuple)):
+        contents = [contents]
+    total = 0
+    for part in contents:
+        if isinstance(part, str):
+            total += len(part.encode())
+        elif isinstance(part, (bytes, bytearray, memoryview)):
+            total += len(part)
+        elif isinstance(part, dict) and 'data' in part:
+            total += len(part['data'])
+    return total
+
+
+def request_key(model, contents, **extra) -> str:
+    """Hashes the model configuration, request contents and extra options into a cache key."""
+    if not isinstance(contents, (list, tuple)):
+        contents = [contents]
+    payload = {
+        'model': model_key(model),
+        'contents': [content_key(part) for part in contents],
+        'extra': extra,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode()).hexdigest()
+
+
+class ResponseCache:
+    """Disk-backed LRU cache of model responses with optional TTL."""
+
+    def __init__(self, path: str = RESPONSE_CACHE_FILE, max_bytes: int = RESPONSE_CACHE_MAX_BYTES,
+                 ttl: Optional[float] = RESPONSE_CACHE_TTL):
+        self.path = pathlib.Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " size INTEGER NOT NULL,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed)")
+
+    def get(self, key: str) -> Optional[Any]:
+        """Returns the cached value for a key, or None on a miss."""
+        now = time.time()
+        with self._lock:
+            row = self._conn.execute("SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.ttl is not None and now - row[1] > self.ttl:
+                self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+                row = None
+            if row is None:
+                self.misses += 1
+                return None
+            self._conn.execute("UPDATE responses SET accessed = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any):
+        """Stores a JSON-serializable value and evicts old entries beyond the size bound."""
+        data = json.dumps(value)
+        size = len(data.encode())
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, size, created, accessed) VALUES (?, ?, ?, ?, ?)",
+                (key, data, size, now, now)
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size in self._conn.execute("SELECT key, size FROM responses ORDER BY accessed ASC").fetchall():
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+
+    def stats(self) -> Dict[str, Any]:
+        """Returns hit/miss counters and the current size of the cache."""
+        with self._lock:
+            entries, size = self._conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM responses").fetchone()
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'entries': entries,
+            'bytes': size,
+        }
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_response_cache() -> ResponseCache:
+    """Returns the process-wide response cache."""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = ResponseCache()
+        return _cache
+
+
+def generate_text(model, contents: List[Any], use_cache: bool = True, **kwargs) -> str:
+    """
+    Calls ``model.generate_content`` and returns the response text, using the cache.
+
+    Args:
+        model (GenerativeModel): The model to call.
+        contents (list): The request contents.
+        use_cache (bool): Set to False to bypass the cache for this request;
+            the fresh response still replaces the cached one.
+        **kwargs: Passed through to ``generate_content`` and part of the key.
+
+    Returns:
+        str: The response text.
+    """
+    cache = get_response_cache()
+    key = request_key(model, contents, **kwargs)
+    with trace('generate') as span:
+        if use_cache:
+            cached = cache.get(key)
+            if cached is not None:
+                span.set(cache_hit=True)
+                return cached
+
+        span.set(cache_hit=False, bytes_sent=inline_bytes(contents))
+        response = scheduled('generate', model.generate_content, contents, **kwargs)
+        span.record_usage(response)
+        text = response.text
+    if text:
+        cache.put(key, text)
+    return text
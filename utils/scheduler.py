@@ -0,0 +1,328 @@
+import bisect
+import contextvars
+import functools
+import itertools
+import os
+import random
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from typing import Optional, Dict, Any, Callable
+
+from google.api_core import exceptions as google_exceptions
+
+# Priority lanes, lower runs first
+INTERACTIVE = 0
+BATCH = 1
+LANE_NAMES = {INTERACTIVE: "interactive", BATCH: "batch"}
+
+# Requests per minute and burst size per endpoint
+ENDPOINT_LIMITS = {
+    'generate': (float(os.getenv('GEMINI_GENERATE_RPM', '60')), int(os.getenv('GEMINI_GENERATE_BURST', '10'))),
+    'upload': (float(os.getenv('GEMINI_UPLOAD_RPM', '30')), int(os.getenv('GEMINI_UPLOAD_BURST', '5'))),
+    'files': (float(os.getenv('GEMINI_FILES_RPM', '300')), int(os.getenv('GEMINI_FILES_BURST', '20'))),
+    'cache': (float(os.getenv('GEMINI_CACHE_RPM', '60')), int(os.getenv('GEMINI_CACHE_BURST', '5'))),
+}
+MAX_CONCURRENCY = int(os.getenv('GEMINI_MAX_CONCURRENCY', '8'))
+MAX_RETRIES = int(os.getenv('GEMINI_MAX_RETRIES', '5'))
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 60.0
+
+RETRYABLE_ERRORS = (
+    google_exceptions.TooManyRequests,
+    google_exceptions.ResourceExhausted,
+    google_exceptions.ServiceUnavailable,
+    google_exceptions.InternalServerError,
+    google_exceptions.DeadlineExceeded,
+    google_exceptions.GatewayTimeout,
+    ConnectionError,
+    TimeoutError,
+)
+THROTTLING_ERRORS = (google_exceptions.TooManyRequests, google_exceptions.ResourceExhausted)
+
+_lane = contextvars.ContextVar('gemini_lane', default=INTERACTIVE)
+# Marks an empty stream
+_END = object()
+
+
+class TokenBucket:
+    """Classic token bucket: ``rate`` tokens per second up to ``capacity``."""
+
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = max(1, capacity)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self.paused_until = 0.0
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """Seconds until a token is available, 0 when one is available now."""
+        if now < self.paused_until:
+            return self.paused_until - now
+        self._refill(now)
+        if self.tokens >= 1 or self.rate <= 0:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        self._refill(now)
+        self.tokens -= 1
+
+    def pause(self, seconds: float):
+        """Stops handing out tokens for a while, after the service reported throttling."""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+        self.tokens = 0.0
+
+
+class _Ticket:
+    __slots__ = ("endpoint", "priority", "enqueued", "granted")
+
+    def __init__(self, endpoint: str, priority: int):
+        self.endpoint = endpoint
+        self.priority = priority
+        self.enqueued = time.monotonic()
+        self.granted = threading.Event()
+
+
+class RequestScheduler:
+    """
+    Admission control for every Gemini API call in the process.
+
+    Callers block in ``call`` until a dispatcher thread grants them a slot:
+    tickets are considered by lane, then arrival, and a ticket is granted when
+    fewer than ``max_concurrency`` calls are running and its endpoint's token
+    bucket has a token, so a throttled endpoint does not hold up the others.
+    The call itself runs in the caller's thread; retryable failures back off
+    with full jitter and queue again in the same lane, and throttling errors
+    also pause the endpoint's bucket for everybody.
+    """
+
+    def __init__(self, limits: Optional[Dict[str, tuple]] = None, max_concurrency: int = MAX_CONCURRENCY,
+                 max_retries: int = MAX_RETRIES, base_delay: float = RETRY_BASE_DELAY,
+                 max_delay: float = RETRY_MAX_DELAY):
+        limits = limits or ENDPOINT_LIMITS
+        self._buckets = {endpoint: TokenBucket(rpm / 60.0, burst) for endpoint, (rpm, burst) in limits.items()}
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+
+        self._queue = []
+        self._sequence = itertools.count()
+        self._in_flight = 0
+        self._condition = threading.Condition()
+        self._waits = deque(maxlen=1000)
+        self._counters = {'calls': 0, 'retries': 0, 'throttled': 0, 'errors': 0, 'failed': 0}
+        self._dispatcher = threading.Thread(target=self._dispatch, name="gemini-scheduler", daemon=True)
+        self._dispatcher.start()
+
+    def _bucket(self, endpoint: str) -> TokenBucket:
+        bucket = self._buckets.get(endpoint)
+        if bucket is None:
+            raise ValueError(f"Unknown endpoint: {endpoint}")
+        return bucket
+
+    def _dispatch(self):
+        with self._condition:
+            while True:
+                timeout = None
+                if self._queue and self._in_flight < self.max_concurrency:
+                    now = time.monotonic()
+                    for position, (_, _, ticket) in enumerate(self._queue):
+                        bucket = self._buckets[ticket.endpoint]
+                        wait = bucket.wait_time(now)
+                        if wait == 0:
+                            bucket.take(now)
+                            del self._queue[position]
+                            self._in_flight += 1
+                            self._waits.append(now - ticket.enqueued)
+                            ticket.granted.set()
+                            timeout = 0
+                            break
+                        timeout = wait if timeout is None else min(timeout, wait)
+                if timeout != 0:
+                    self._condition.wait(timeout)
+
+    def _acquire(self, endpoint: str, priority: int):
+        self._bucket(endpoint)
+        ticket = _Ticket(endpoint, priority)
+        with self._condition:
+            bisect.insort(self._queue, (priority, next(self._sequence), ticket))
+            self._condition.notify_all()
+        ticket.granted.wait()
+
+    def _release(self):
+        with self._condition:
+            self._in_flight -= 1
+            self._condition.notify_all()
+
+    def _backoff(self, attempt: int) -> float:
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def call(self, endpoint: str, fn: Callable, *args, priority: Optional[int] = None, **kwargs):
+        """
+        Runs ``fn(*args, **kwargs)`` once the scheduler admits it, retrying transient errors.
+
+        Args:
+            endpoint (str): ``"generate"``, ``"upload"``, ``"files"`` or ``"cache"``.
+            fn (callable): The API call.
+            priority (int, optional): ``INTERACTIVE`` or ``BATCH``; defaults to
+                the lane of the current context (see ``lane``).
+
+        Returns:
+            The result of ``fn``.
+
+        Raises:
+            Exception: The last error once retries are exhausted, or the first
+            non-retryable one.
+        """
+        priority = _lane.get() if priority is None else priority
+        attempt = 0
+        while True:
+            self._acquire(endpoint, priority)
+            try:
+                result = fn(*args, **kwargs)
+                error = None
+            except RETRYABLE_ERRORS as e:
+                error = e
+            finally:
+                self._release()
+
+            if error is None:
+                with self._condition:
+                    self._counters['calls'] += 1
+                return result
+            time.sleep(self._retry_delay(endpoint, error, attempt))
+            attempt += 1
+
+    def stream(self, endpoint: str, fn: Callable, *args, priority: Optional[int] = None, **kwargs):
+        """
+        Runs a streaming call, holding its slot until the stream is exhausted or closed.
+
+        Errors until the first chunk arrives are retried as in ``call``. Errors
+        after that propagate without a retry, since the caller has already
+        consumed part of the output.
+
+        Args:
+            endpoint (str): ``"generate"``, ``"upload"``, ``"files"`` or ``"cache"``.
+            fn (callable): The API call; it must return an iterable.
+            priority (int, optional): ``INTERACTIVE`` or ``BATCH``; defaults to
+                the lane of the current context (see ``lane``).
+
+        Yields:
+            The items of the stream.
+        """
+        priority = _lane.get() if priority is None else priority
+        attempt = 0
+        while True:
+            self._acquire(endpoint, priority)
+            try:
+                iterator = iter(fn(*args, **kwargs))
+                first = next(iterator, _END)
+                break
+            except RETRYABLE_ERRORS as e:
+                self._release()
+                error = e
+            except BaseException:
+                self._release()
+                raise
+            time.sleep(self._retry_delay(endpoint, error, attempt))
+            attempt += 1
+
+        try:
+            with self._condition:
+                self._counters['calls'] += 1
+            if first is _END:
+                return
+            yield first
+            yield from iterator
+        finally:
+            self._release()
+
+    def _retry_delay(self, endpoint: str, error: BaseException, attempt: int) -> float:
+        # Counts a retryable failure and returns the backoff, or re-raises once retries are exhausted
+        throttled = isinstance(error, THROTTLING_ERRORS)
+        with self._condition:
+            self._counters['throttled' if throttled else 'errors'] += 1
+            if attempt >= self.max_retries:
+                self._counters['failed'] += 1
+                raise error
+            delay = self._backoff(attempt)
+            if throttled:
+                self._buckets[endpoint].pause(delay)
+            self._counters['retries'] += 1
+        return delay
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue depth per lane, calls in flight, wait times (seconds) and counters."""
+        with self._condition:
+            waits = sorted(self._waits)
+            depth = {name: 0 for name in LANE_NAMES.values()}
+            for priority, _, _ in self._queue:
+                depth[LANE_NAMES.get(priority, str(priority))] += 1
+            return dict(
+                self._counters,
+                queue_depth=depth,
+                in_flight=self._in_flight,
+                wait_mean=sum(waits) / len(waits) if waits else 0.0,
+                wait_p95=waits[int(0.95 * (len(waits) - 1))] if waits else 0.0,
+                tokens={endpoint: round(bucket.tokens, 2) for endpoint, bucket in self._buckets.items()},
+            )
+
+
+@contextmanager
+def lane(priority: int):
+    """Runs the calls made inside the block in the given lane."""
+    token = _lane.set(priority)
+    try:
+        yield
+    finally:
+        _lane.reset(token)
+
+
+def in_lane(priority: int, fn: Callable) -> Callable:
+    """
+    Wraps ``fn`` so it runs in the given lane, for work handed to thread pools.
+
+    The wrapper also runs in a copy of the context ``in_lane`` was called
+    from, so context variables such as the current trace span carry over
+    into the worker threads.
+    """
+    context = contextvars.copy_context()
+
+    def run(*args, **kwargs):
+        with lane(priority):
+            return fn(*args, **kwargs)
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(run, *args, **kwargs)
+    return wrapper
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler() -> RequestScheduler:
+    """Returns the process-wide scheduler."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = RequestScheduler()
+        return _scheduler
+
+
+def scheduled(endpoint: str, fn: Callable, *args, **kwargs):
+    """Shorthand for ``get_scheduler().call(endpoint, fn, *args, **kwargs)``."""
+    return get_scheduler().call(endpoint, fn, *args, **kwargs)
+
+
+def scheduled_stream(endpoint: str, fn: Callable, *args, **kwargs):
+    """Shorthand for ``get_scheduler().stream(endpoint, fn, *args, **kwargs)``."""
+    return get_scheduler().stream(endpoint, fn, *args, **kwargs)
@@ -0,0 +1,336 @@
+import asyncio
+import contextvars
+import json
+import mimetypes
+import os
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from typing import Optional, Dict, Any, List, Callable
+
+import google.generativeai as genai
+
+from utils.detection import detect_batch, detect_objects, stream_detect_objects
+from utils.ensemble import detect_ensemble
+from utils.file_manager import bulk_delete, delete_file, get_file_inventory
+from utils.file_poller import POLL_DEFAULT_TIMEOUT, get_file_poller
+from utils.prompts import METADATA_PROMPT, TRANSCRIPTION_PROMPT
+from utils.response_cache import generate_text
+from utils.scheduler import RETRYABLE_ERRORS, scheduled
+from utils.tiling import detect_tiled
+from utils.tracing import trace
+from utils.upload_index import get_upload_index, upload_stream
+from utils.util import stream_transcription
+from utils.video_detection import detect_video
+
+# Threads running blocking SDK calls; also bounds the connections the service opens at once
+SERVICE_WORKERS = int(os.getenv('SERVICE_WORKERS', '16'))
+# Operations (uploads, analyses, detections) admitted at once; later ones wait their turn
+SERVICE_MAX_OPERATIONS = int(os.getenv('SERVICE_MAX_OPERATIONS', '32'))
+
+# Marks the end of a blocking generator
+_END = object()
+
+
+class ServiceError(Exception):
+    """
+    A failed service operation.
+
+    Attributes:
+        stage (str): ``"upload"``, ``"processing"``, ``"generate"``, ``"parse"``, ``"detect"``
+            or ``"files"``.
+        code (str): ``"failed"``, ``"timeout"``, ``"empty_response"`` or ``"invalid_response"``.
+        message (str): Human readable description.
+        retryable (bool): Whether running the operation again may succeed.
+    """
+
+    def __init__(self, stage: str, code: str, message: str, retryable: bool = False):
+        super().__init__(f"{stage} {code}: {message}")
+        self.stage = stage
+        self.code = code
+        self.message = message
+        self.retryable = retryable
+
+    @classmethod
+    def wrap(cls, stage: str, error: BaseException) -> "ServiceError":
+        if isinstance(error, ServiceError):
+            return error
+        if isinstance(error, (TimeoutError, FutureTimeoutError, asyncio.TimeoutError)):
+            return cls(stage, "timeout", str(error) or "Timed out.", retryable=True)
+        # Only the stages that read model output raise ValueError for a bad response
+        if isinstance(error, ValueError) and stage in ("parse", "detect"):
+            return cls(stage, "invalid_response", str(error))
+        return cls(stage, "failed", str(error), retryable=isinstance(error, RETRYABLE_ERRORS))
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {'stage': self.stage, 'code': self.code, 'message': self.message, 'retryable': self.retryable}
+
+
+class GeminiService:
+    """
+    UI-free asyncio facade over uploads, processing waits and model calls.
+
+    The coroutines run on an event loop in a background thread; blocking SDK
+    calls are handed to a bounded thread pool, so many analyses from many
+    sessions can be in flight in one process. Every failure surfaces as a
+    ``ServiceError``. Synchronous callers such as Streamlit scripts use
+    ``run``, which also carries their context (trace span, scheduler lane)
+    into the coroutine.
+    """
+
+    def __init__(self, max_workers: int = SERVICE_WORKERS, max_operations: int = SERVICE_MAX_OPERATIONS):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="gemini-service")
+        self._loop = asyncio.new_event_loop()
+        self._loop.set_default_executor(self._executor)
+        self._operations = asyncio.Semaphore(max_operations)
+        self._thread = threading.Thread(target=self._loop.run_forever, name="gemini-service-loop", daemon=True)
+        self._thread.start()
+
+    def run(self, coroutine, timeout: Optional[float] = None):
+        """
+        Runs a coroutine of this service from synchronous code and returns its result.
+
+        Raises:
+            ServiceError: When the operation fails or ``timeout`` passes first.
+        """
+        future = contextvars.copy_context().run(asyncio.run_coroutine_threadsafe, coroutine, self._loop)
+        try:
+            return future.result(timeout)
+        except FutureTimeoutError:
+            future.cancel()
+            raise ServiceError("service", "timeout", f"No result after {timeout} seconds.", retryable=True)
+
+    def run_with_progress(self, operation: Callable, progress_callback: Callable[[int, int], None],
+                          timeout: Optional[float] = None):
+        """
+        Like ``run``, for operations that report progress from worker threads.
+
+        Args:
+            operation (callable): Called with a thread-safe ``(done, total)``
+                callback; returns the coroutine to run.
+            progress_callback (callable): Receives the progress on the calling
+                thread, where Streamlit elements can be updated.
+            timeout (float, optional): Seconds to wait for the result.
+        """
+        updates = queue.SimpleQueue()
+        coroutine = operation(lambda done, total: updates.put((done, total)))
+        future = contextvars.copy_context().run(asyncio.run_coroutine_threadsafe, coroutine, self._loop)
+        deadline = None if timeout is None else time.monotonic() + timeout
+        while True:
+            try:
+                result = future.result(0.1)
+                break
+            except FutureTimeoutError:
+                if deadline is not None and time.monotonic() > deadline:
+                    future.cancel()
+                    raise ServiceError("service", "timeout", f"No result after {timeout} seconds.", retryable=True)
+            finally:
+                while not updates.empty():
+                    progress_callback(*updates.get())
+        return result
+
+    def iterate(self, stream):
+        """
+        Iterates an async generator of this service, such as ``stream_detect``, from synchronous code.
+
+        Closing the iterator early, as a Streamlit rerun does, closes the
+        stream and frees its slot.
+        """
+        context = contextvars.copy_context()
+        try:
+            while True:
+                future = context.run(asyncio.run_coroutine_threadsafe, stream.__anext__(), self._loop)
+                try:
+                    item = future.result()
+                except StopAsyncIteration:
+                    return
+                yield item
+        finally:
+            asyncio.run_coroutine_threadsafe(stream.aclose(), self._loop).result()
+
+    async def _call(self, stage: str, fn, *args, **kwargs):
+        async with self._operations:
+            try:
+                return await asyncio.to_thread(fn, *args, **kwargs)
+            except Exception as e:
+                raise ServiceError.wrap(stage, e) from e
+
+    async def _stream(self, stage: str, generator):
+        # Steps a blocking generator in the thread pool, holding an operation slot until it is closed
+        async with self._operations:
+            try:
+                while True:
+                    item = await asyncio.to_thread(next, generator, _END)
+                    if item is _END:
+                        return
+                    yield item
+            except Exception as e:
+                raise ServiceError.wrap(stage, e) from e
+            finally:
+                await asyncio.to_thread(generator.close)
+
+    async def upload(self, file, mime_type: Optional[str] = None, display_name: Optional[str] = None):
+        """
+        Uploads a binary stream, reusing the remote file when the content was uploaded before.
+
+        Args:
+            file (IO): A seekable binary stream, such as a Streamlit upload.
+            mime_type (str, optional): Taken from ``file.type`` or the name when omitted.
+            display_name (str, optional): Defaults to ``file.name``.
+
+        Returns:
+            File: The remote Gemini file, possibly still PROCESSING.
+        """
+        display_name = display_name or getattr(file, 'name', None)
+        mime_type = (
+            mime_type or getattr(file, 'type', None)
+            or mimetypes.guess_type(display_name or "")[0] or "application/octet-stream"
+        )
+        return await self._call("upload", upload_stream, file, mime_type=mime_type, display_name=display_name)
+
+    async def wait_active(self, remote_file, timeout: Optional[float] = None):
+        """
+        Waits, without holding a thread, until a file has finished processing.
+
+        Returns:
+            File: The ACTIVE file.
+
+        Raises:
+            ServiceError: When processing failed or timed out.
+        """
+        watched = get_file_poller().watch(remote_file, timeout=timeout or POLL_DEFAULT_TIMEOUT)
+        try:
+            remote_file = await asyncio.wrap_future(watched)
+        except Exception as e:
+            raise ServiceError.wrap("processing", e) from e
+        await asyncio.to_thread(get_upload_index().update_state, remote_file)
+        if remote_file.state.name != "ACTIVE":
+            raise ServiceError("processing", "failed", f"File {remote_file.name} is {remote_file.state.name}.")
+        return remote_file
+
+    async def _active(self, media, timeout: Optional[float]):
+        # Streams are uploaded first; uploaded files only need to be ACTIVE
+        if not hasattr(media, 'state'):
+            media = await self.upload(media)
+        return await self.wait_active(media, timeout)
+
+    async def _generate(self, model, contents: List[Any], use_cache: bool) -> str:
+        text = await self._call("generate", generate_text, model, contents, use_cache=use_cache)
+        if not text:
+            raise ServiceError("generate", "empty_response", "No response received from the model.", retryable=True)
+        return text
+
+    async def analyze_video(self, model, video, use_cache: bool = True,
+                            timeout: Optional[float] = None) -> Dict[str, Any]:
+        """
+        Returns the metadata of a video, as described by the model's response schema.
+
+        Args:
+            model (GenerativeModel): A model configured for JSON output.
+            video: A binary stream to upload, or an uploaded Gemini file.
+            use_cache (bool): Whether the response may come from the cache.
+            timeout (float, optional): Seconds to wait for processing.
+        """
+        video = await self._active(video, timeout)
+        text = await self._generate(model, [video, METADATA_PROMPT], use_cache)
+        try:
+            with trace('parse'):
+                return json.loads(text)
+        except json.JSONDecodeError as e:
+            raise ServiceError("parse", "invalid_response", f"Error decoding JSON response: {e}") from e
+
+    async def transcribe(self, model, audio, use_cache: bool = True, timeout: Optional[float] = None) -> str:
+        """
+        Returns the transcript of an audio file.
+
+        Args:
+            model (GenerativeModel): The transcription model.
+            audio: A binary stream to upload, or an uploaded Gemini file.
+            use_cache (bool): Whether the response may come from the cache.
+            timeout (float, optional): Seconds to wait for processing.
+        """
+        audio = await self._active(audio, timeout)
+        text = await self._generate(model, [audio, TRANSCRIPTION_PROMPT], use_cache)
+        return text.strip()
+
+    async def detect(self, model, image, object_name: str, use_cache: bool = True,
+                     preprocess: Optional[Dict[str, Any]] = None,
+                     stats: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        """
+        Detects objects in an image; see ``utils.detection.detect_objects``.
+
+        Returns:
+            list of dict: Boxes in image pixels.
+        """
+        return await self._call(
+            "detect", detect_objects, model, image, object_name, use_cache=use_cache, preprocess=preprocess,
+            stats=stats
+        )
+
+    async def stream_detect(self, model, image, object_name: str, use_cache: bool = True,
+                            preprocess: Optional[Dict[str, Any]] = None):
+        """
+        Yields boxes as they are detected; see ``utils.detection.stream_detect_objects``.
+
+        Consume it with ``iterate`` from synchronous code.
+        """
+        generator = stream_detect_objects(model, image, object_name, use_cache=use_cache, preprocess=preprocess)
+        async for box in self._stream("detect", generator):
+            yield box
+
+    async def stream_transcribe(self, model, audio, metrics: Optional[Dict[str, Any]] = None):
+        """
+        Yields the transcript of an ACTIVE audio file as it is generated.
+
+        See ``utils.util.stream_transcription`` for ``metrics``; consume it with
+        ``iterate`` from synchronous code.
+        """
+        async for text in self._stream("generate", stream_transcription(model, audio, metrics=metrics)):
+            yield text
+
+    async def detect_batch(self, model, images, object_name: str, **kwargs) -> Dict[str, Any]:
+        """Detects objects in many images; see ``utils.detection.detect_batch`` for the options."""
+        return await self._call("detect", detect_batch, model, images, object_name, **kwargs)
+
+    async def detect_tiled(self, model, source, object_name: str, **kwargs) -> Dict[str, Any]:
+        """Detects objects in a large image by tiles; see ``utils.tiling.detect_tiled`` for the options."""
+        return await self._call("detect", detect_tiled, model, source, object_name, **kwargs)
+
+    async def detect_ensemble(self, members, image, object_name: str, **kwargs) -> Dict[str, Any]:
+        """Fuses the detections of several members; see ``utils.ensemble.detect_ensemble`` for the options."""
+        return await self._call("detect", detect_ensemble, members, image, object_name, **kwargs)
+
+    async def detect_video(self, model, path, object_name: str, **kwargs) -> Dict[str, Any]:
+        """Detects and tracks objects in a video file; see ``utils.video_detection.detect_video`` for the options."""
+        return await self._call("detect", detect_video, model, path, object_name, **kwargs)
+
+    async def list_files(self) -> List[Any]:
+        """Returns every remote file."""
+        return await self._call("files", scheduled, 'files', lambda: list(genai.list_files()))
+
+    async def file_page(self, page: int, page_size: int, **kwargs) -> Dict[str, Any]:
+        """Returns one page of the cached file inventory; see ``FileInventory.page``."""
+        return await self._call("files", get_file_inventory().page, page, page_size, **kwargs)
+
+    async def delete_file(self, name: str):
+        """Deletes a remote file by name."""
+        await self._call("files", delete_file, name)
+
+    async def delete_files(self, files, progress_callback: Optional[Callable[[int, int], None]] = None
+                           ) -> Dict[str, Any]:
+        """Deletes files concurrently; see ``utils.file_manager.bulk_delete``."""
+        return await self._call("files", bulk_delete, files, progress_callback=progress_callback)
+
+
+_service = None
+_service_lock = threading.Lock()
+
+
+def get_service() -> GeminiService:
+    """Returns the process-wide service."""
+    global _service
+    with _service_lock:
+        if _service is None:
+            _service = GeminiService()
+        return _service
@@ -0,0 +1,276 @@
+import os
+import struct
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Dict, Any, List, Callable, Tuple
+
+import numpy as np
+from PIL import Image, UnidentifiedImageError
+from PIL.Image import DecompressionBombError
+
+from utils.boxes import BoxArray, non_max_suppression
+from utils.detection import DETECTION_WORKERS, detect_objects
+from utils.scheduler import BATCH, in_lane
+
+TILE_SIZE = int(os.getenv('TILE_SIZE', '1024'))
+TILE_OVERLAP = int(os.getenv('TILE_OVERLAP', '128'))
+# Largest image accepted for tiling; Pillow's own limit is meant for untrusted thumbnails.
+# Compressed images are decoded whole, so this also bounds memory (about 1.5 GB for RGB).
+TILED_MAX_PIXELS = int(os.getenv('TILED_MAX_PIXELS', str(500_000_000)))
+TILE_NMS_IOU = 0.5
+# Partial boxes cut off at a tile border are mostly inside the full box from the neighbouring tile
+TILE_NMS_CONTAINMENT = 0.8
+
+
+def plan_tiles(width: int, height: int, tile_size: int = TILE_SIZE,
+               overlap: int = TILE_OVERLAP) -> List[Tuple[int, int, int, int]]:
+    """
+    Returns ``(left, top, right, bottom)`` tiles covering the image.
+
+    Tiles are ``tile_size`` square where the image allows, neighbours share at
+    least ``overlap`` pixels, and the last row and column are aligned to the
+    image border instead of being cut short.
+    """
+    if overlap >= tile_size:
+        raise ValueError("The tile overlap must be smaller than the tile size.")
+
+    def starts(length: int) -> List[int]:
+        if length <= tile_size:
+            return [0]
+        stride = tile_size - overlap
+        positions = list(range(0, length - tile_size, stride))
+        positions.append(length - tile_size)
+        return positions
+
+    return [
+        (left, top, min(left + tile_size, width), min(top + tile_size, height))
+        for top in starts(height)
+        for left in starts(width)
+    ]
+
+
+def _open_unchecked(source) -> Image.Image:
+    # Image.open, without the decompression bomb check against the process-wide limit
+    if isinstance(source, (str, os.PathLike)):
+        with open(source, 'rb') as f:
+            prefix = f.read(16)
+    else:
+        source.seek(0)
+        prefix = source.read(16)
+    Image.init()
+    for image_format in Image.ID:
+        factory, accept = Image.OPEN[image_format]
+        if accept is not None and not accept(prefix):
+            continue
+        if not isinstance(source, (str, os.PathLike)):
+            source.seek(0)
+        try:
+            return factory(source, getattr(source, 'name', None) or "")
+        except (SyntaxError, IndexError, TypeError, struct.error):
+            continue
+    raise UnidentifiedImageError("Cannot identify the image file.")
+
+
+def open_large_image(source) -> Image.Image:
+    """
+    Opens an image lazily, accepting up to ``TILED_MAX_PIXELS`` pixels.
+
+    Pillow's ``MAX_IMAGE_PIXELS`` is left alone, since other sessions rely on
+    it; images above it are opened without Pillow's check and held to
+    ``TILED_MAX_PIXELS`` here instead. Formats that check again while
+    decoding, such as TIFF, remain subject to Pillow's limit.
+
+    Raises:
+        DecompressionBombError: If the image has more than ``TILED_MAX_PIXELS`` pixels.
+    """
+    try:
+        return Image.open(source)
+    except DecompressionBombError:
+        pass
+    image = _open_unchecked(source)
+    pixels = image.size[0] * image.size[1]
+    if pixels > TILED_MAX_PIXELS:
+        image.close()
+        raise DecompressionBombError(f"Image size ({pixels} pixels) exceeds the tiling limit of {TILED_MAX_PIXELS}.")
+    return image
+
+
+def preview_image(source, max_edge: int = 1600) -> Image.Image:
+    """Returns a small RGB preview; JPEGs are decoded at reduced scale directly."""
+    image = open_large_image(source)
+    image.thumbnail((max_edge, max_edge))
+    return image.convert("RGB")
+
+
+class TiledImage:
+    """
+    Read-only access to tiles of a possibly very large image.
+
+    The image is opened lazily, so its size is known without decoding. On the
+    first tile it is decoded once, in its own mode, and tiles are cut from
+    that copy and converted to RGB one at a time. Uncompressed files that
+    Pillow can memory-map are not read into memory; any other format is
+    decoded whole, as Pillow cannot decode it in strips, so memory grows
+    with the image (3 bytes per pixel for RGB) and ``TILED_MAX_PIXELS`` is
+    what bounds it.
+    """
+
+    def __init__(self, source):
+        """
+        Args:
+            source: A path, a binary file object or an already opened ``PIL.Image``.
+        """
+        self._owned = not isinstance(source, Image.Image)
+        if not self._owned:
+            self._image = source
+        else:
+            self._image = open_large_image(source)
+        self.size = self._image.size
+        self._lock = threading.Lock()
+        self._loaded = False
+
+    @property
+    def width(self) -> int:
+        return self.size[0]
+
+    @property
+    def height(self) -> int:
+        return self.size[1]
+
+    def tile(self, box: Tuple[int, int, int, int]) -> Image.Image:
+        """Returns the RGB pixels of ``(left, top, right, bottom)`` as a new image."""
+        with self._lock:
+            if not self._loaded:
+                self._image.load()
+                self._loaded = True
+            region = self._image.crop(box)
+        return region if region.mode == "RGB" else region.convert("RGB")
+
+    def close(self):
+        """Releases the decoded pixels."""
+        with self._lock:
+            if self._image is not None and self._owned:
+                self._image.close()
+            self._image = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def _seam_pairs(coords: np.ndarray, tiles: List[Tuple[int, int, int, int]], counts: List[int]) -> np.ndarray:
+    """
+    Marks the box pairs that come from different tiles and both reach into the band those tiles share.
+
+    Only such pairs can be one object cut by a tile border, so containment
+    suppression is limited to them; a small box inside a large one elsewhere
+    in the same tile is a separate object.
+    """
+    tile_ids = np.repeat(np.arange(len(tiles)), counts)
+    tile_coords = np.asarray(tiles, dtype=coords.dtype)[tile_ids]
+    # The band shared by the tiles of each pair; empty where the tiles do not overlap
+    band_min = np.maximum(tile_coords[:, None, :2], tile_coords[None, :, :2])
+    band_max = np.minimum(tile_coords[:, None, 2:], tile_coords[None, :, 2:])
+    has_band = np.all(band_max > band_min, axis=2)
+
+    def reaches_band(box_coords):
+        return np.all((box_coords[..., :2] < band_max) & (box_coords[..., 2:] > band_min), axis=2)
+
+    return (
+        (tile_ids[:, None] != tile_ids[None, :]) & has_band
+        & reaches_band(coords[:, None, :]) & reaches_band(coords[None, :, :])
+    )
+
+
+def merge_tile_boxes(tile_boxes: List[Tuple[Tuple[int, int, int, int], List[Dict[str, Any]]]],
+                     iou_threshold: float = TILE_NMS_IOU,
+                     containment_threshold: Optional[float] = TILE_NMS_CONTAINMENT) -> List[Dict[str, Any]]:
+    """
+    Maps tile-local boxes to image coordinates and removes overlap duplicates.
+
+    Args:
+        tile_boxes (list): ``(tile, boxes)`` pairs with boxes in tile pixels.
+        iou_threshold (float): IoU above which same-label boxes are merged.
+        containment_threshold (float, optional): See ``non_max_suppression``; only
+            applied between boxes of neighbouring tiles that both reach into
+            the overlap band.
+
+    Returns:
+        list of dict: Boxes in image pixels, largest first.
+    """
+    tile_boxes = [(tile, boxes) for tile, boxes in tile_boxes if boxes]
+    if not tile_boxes:
+        return []
+    arrays = [BoxArray.from_dicts(boxes).translate(tile[0], tile[1]) for tile, boxes in tile_boxes]
+    labels: Dict[str, int] = {}
+    label_ids = np.concatenate([
+        np.array([labels.setdefault(array.labels[i], len(labels)) for i in array.label_ids], dtype=np.int32)
+        for array in arrays
+    ])
+    merged = BoxArray(np.concatenate([array.coords for array in arrays]), label_ids, list(labels))
+    keep = non_max_suppression(
+        merged, iou_threshold=iou_threshold, containment_threshold=containment_threshold,
+        containment_mask=_seam_pairs(merged.coords, [tile for tile, _ in tile_boxes], [len(a) for a in arrays])
+    )
+    return merged.subset(keep).to_dicts()
+
+
+def detect_tiled(model, source, object_name: str, tile_size: int = TILE_SIZE, overlap: int = TILE_OVERLAP,
+                 max_workers: int = DETECTION_WORKERS, use_cache: bool = True,
+                 preprocess: Optional[Dict[str, Any]] = None, iou_threshold: float = TILE_NMS_IOU,
+                 progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+    """
+    Detects objects in a large image by detecting in overlapping tiles.
+
+    Args:
+        model (GenerativeModel): The detection model.
+        source: A path, binary file object or ``PIL.Image`` (see ``TiledImage``).
+        object_name (str): What to detect, or ``"all"``.
+        tile_size (int): Edge of the square tiles in pixels.
+        overlap (int): Pixels shared by neighbouring tiles; should exceed the
+            size of the objects searched for.
+        max_workers (int): Maximum number of tile requests in flight.
+        use_cache (bool): Whether detections may come from the caches.
+        preprocess (dict, optional): Keyword arguments for ``prepare_image``.
+        iou_threshold (float): IoU above which overlapping boxes are merged.
+        progress_callback (callable, optional): Called as ``(tiles done, total)``.
+
+    Returns:
+        dict: ``boxes`` in image pixels, ``size`` of the image, ``tiles``
+        (count), ``failed`` with ``(tile, error)`` pairs and ``elapsed``.
+    """
+    started = time.perf_counter()
+    with TiledImage(source) as image:
+        tiles = plan_tiles(image.width, image.height, tile_size, overlap)
+
+        def detect_tile(box):
+            return detect_objects(
+                model, image.tile(box), object_name, use_cache=use_cache, preprocess=preprocess, match_similar=False
+            )
+
+        tile_boxes = []
+        failed = []
+        done = 0
+        with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(tiles)))) as executor:
+            futures = {executor.submit(in_lane(BATCH, detect_tile), box): box for box in tiles}
+            for future in as_completed(futures):
+                box = futures[future]
+                try:
+                    tile_boxes.append((box, future.result()))
+                except Exception as e:
+                    failed.append((box, str(e)))
+                done += 1
+                if progress_callback is not None:
+                    progress_callback(done, len(tiles))
+        size = image.size
+
+    return {
+        'boxes': merge_tile_boxes(tile_boxes, iou_threshold=iou_threshold),
+        'size': size,
+        'tiles': len(tiles),
+        'failed': sorted(failed),
+        'elapsed': time.perf_counter() - started,
+    }
@@ -0,0 +1,265 @@
+import contextvars
+import json
+import os
+import pathlib
+import threading
+import time
+import uuid
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Optional, Dict, Any, List
+
+# Spans are appended to this file as JSON lines when set
+TRACE_JSONL = os.getenv('TRACE_JSONL', '')
+# A Prometheus text endpoint is served on this port when set
+METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+# Local only by default; set to 0.0.0.0 to let a remote Prometheus scrape it
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+TRACE_BUFFER_SIZE = int(os.getenv('TRACE_BUFFER_SIZE', '500'))
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0)
+
+_current = contextvars.ContextVar('trace_span', default=None)
+
+
+class Span:
+    """
+    One timed pipeline stage.
+
+    ``attributes`` holds what the stage reports, by convention
+    ``bytes_sent``, ``prompt_tokens``, ``output_tokens`` and ``cache_hit``;
+    ``error`` is set when the stage raised.
+    """
+
+    __slots__ = ("tracer", "name", "trace_id", "span_id", "parent_id", "started_at", "_started", "duration",
+                 "attributes", "error")
+
+    def __init__(self, tracer: "Tracer", name: str, parent: Optional["Span"] = None, **attributes):
+        self.tracer = tracer
+        self.name = name
+        self.trace_id = parent.trace_id if parent is not None else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:16]
+        self.parent_id = parent.span_id if parent is not None else None
+        self.started_at = time.time()
+        self._started = time.perf_counter()
+        self.duration: Optional[float] = None
+        self.attributes: Dict[str, Any] = dict(attributes)
+        self.error: Optional[str] = None
+
+    def set(self, **attributes):
+        """Adds or replaces attributes."""
+        self.attributes.update(attributes)
+
+    def add(self, name: str, amount: float):
+        """Increments a numeric attribute."""
+        self.attributes[name] = self.attributes.get(name, 0) + amount
+
+    def record_usage(self, response):
+        """Copies the token counts from a response's ``usage_metadata``, if it has any."""
+        usage = getattr(response, "usage_metadata", None)
+        if not usage:
+            return
+        prompt_tokens = getattr(usage, "prompt_token_count", 0) or 0
+        output_tokens = getattr(usage, "candidates_token_count", 0) or 0
+        if prompt_tokens or output_tokens:
+            self.set(prompt_tokens=prompt_tokens, output_tokens=output_tokens)
+
+    def end(self, error: Optional[BaseException] = None):
+        """Stops the clock and hands the span to the tracer; later calls do nothing."""
+        if self.duration is not None:
+            return
+        self.duration = time.perf_counter() - self._started
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        self.tracer._finish(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            'name': self.name,
+            'trace_id': self.trace_id,
+            'span_id': self.span_id,
+            'parent_id': self.parent_id,
+            'started_at': self.started_at,
+            'duration': self.duration,
+            'error': self.error,
+            **self.attributes,
+        }
+
+
+class _StageMetrics:
+    __slots__ = ("count", "errors", "seconds", "buckets", "bytes_sent", "prompt_tokens", "output_tokens",
+                 "cache_hits")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.buckets = [0] * len(LATENCY_BUCKETS)
+        self.bytes_sent = 0
+        self.prompt_tokens = 0
+        self.output_tokens = 0
+        self.cache_hits = 0
+
+
+class Tracer:
+    """
+    Records spans for the stages of the analysis pipelines.
+
+    Finished spans are kept in a ring buffer for the app panel, aggregated
+    per stage for the Prometheus exposition and, when ``jsonl_path`` is set,
+    appended to a JSON lines file.
+    """
+
+    def __init__(self, jsonl_path: Optional[str] = TRACE_JSONL or None, buffer_size: int = TRACE_BUFFER_SIZE):
+        self.jsonl_path = pathlib.Path(jsonl_path) if jsonl_path else None
+        if self.jsonl_path is not None:
+            self.jsonl_path.parent.mkdir(parents=True, exist_ok=True)
+        self._spans = deque(maxlen=buffer_size)
+        self._stages: Dict[str, _StageMetrics] = {}
+        self._lock = threading.Lock()
+        # Serializes file writes without holding up the spans and metrics behind ``_lock``
+        self._write_lock = threading.Lock()
+
+    def start(self, name: str, **attributes) -> Span:
+        """
+        Starts a span under the current one without making it current.
+
+        For stages that outlive a ``with`` block, such as streaming
+        generators; the caller must call ``end``.
+        """
+        return Span(self, name, _current.get(), **attributes)
+
+    @contextmanager
+    def span(self, name: str, **attributes):
+        """Times the block as a span nested under the current one; exceptions are recorded and re-raised."""
+        span = self.start(name, **attributes)
+        token = _current.set(span)
+        try:
+            yield span
+        except BaseException as e:
+            span.end(e)
+            raise
+        finally:
+            _current.reset(token)
+            span.end()
+
+    def _finish(self, span: Span):
+        with self._lock:
+            self._spans.append(span)
+            stage = self._stages.get(span.name)
+            if stage is None:
+                stage = self._stages[span.name] = _StageMetrics()
+            stage.count += 1
+            stage.errors += span.error is not None
+            stage.seconds += span.duration
+            for index, bound in enumerate(LATENCY_BUCKETS):
+                if span.duration <= bound:
+                    stage.buckets[index] += 1
+            attributes = span.attributes
+            stage.bytes_sent += attributes.get('bytes_sent', 0)
+            stage.prompt_tokens += attributes.get('prompt_tokens', 0)
+            stage.output_tokens += attributes.get('output_tokens', 0)
+            stage.cache_hits += bool(attributes.get('cache_hit'))
+        if self.jsonl_path is not None:
+            line = json.dumps(span.to_dict(), default=str) + "\n"
+            with self._write_lock, open(self.jsonl_path, 'a', encoding='utf-8') as f:
+                f.write(line)
+
+    def spans(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Returns the most recent finished spans, newest first."""
+        with self._lock:
+            spans = list(self._spans)[::-1]
+        return [span.to_dict() for span in spans[:limit]]
+
+    def summary(self) -> List[Dict[str, Any]]:
+        """Per-stage totals: count, errors, mean seconds, bytes, tokens and cache hits."""
+        with self._lock:
+            return [
+                {
+                    'stage': name,
+                    'count': stage.count,
+                    'errors': stage.errors,
+                    'mean_seconds': stage.seconds / stage.count if stage.count else 0.0,
+                    'bytes_sent': stage.bytes_sent,
+                    'prompt_tokens': stage.prompt_tokens,
+                    'output_tokens': stage.output_tokens,
+                    'cache_hits': stage.cache_hits,
+                }
+                for name, stage in sorted(self._stages.items())
+            ]
+
+    def prometheus(self) -> str:
+        """Renders the per-stage metrics in the Prometheus text exposition format."""
+        lines = [
+            "# HELP gemini_stage_seconds Duration of pipeline stages.",
+            "# TYPE gemini_stage_seconds histogram",
+        ]
+        with self._lock:
+            stages = sorted(self._stages.items())
+            for name, stage in stages:
+                for bound, count in zip(LATENCY_BUCKETS, stage.buckets):
+                    lines.append(f'gemini_stage_seconds_bucket{{stage="{name}",le="{bound}"}} {count}')
+                lines.append(f'gemini_stage_seconds_bucket{{stage="{name}",le="+Inf"}} {stage.count}')
+                lines.append(f'gemini_stage_seconds_sum{{stage="{name}"}} {stage.seconds}')
+                lines.append(f'gemini_stage_seconds_count{{stage="{name}"}} {stage.count}')
+            counters = (
+                ("gemini_stage_errors_total", "Pipeline stages that raised.", "errors"),
+                ("gemini_stage_bytes_sent_total", "Bytes sent to the API.", "bytes_sent"),
+                ("gemini_stage_prompt_tokens_total", "Prompt tokens reported by the API.", "prompt_tokens"),
+                ("gemini_stage_output_tokens_total", "Output tokens reported by the API.", "output_tokens"),
+                ("gemini_stage_cache_hits_total", "Stages served from a local cache.", "cache_hits"),
+            )
+            for metric, help_text, attribute in counters:
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} counter")
+                for name, stage in stages:
+                    lines.append(f'{metric}{{stage="{name}"}} {getattr(stage, attribute)}')
+        return "\n".join(lines) + "\n"
+
+
+def serve_metrics(tracer: Tracer, port: int, host: str = METRICS_HOST) -> ThreadingHTTPServer:
+    """Serves ``tracer.prometheus()`` at ``/metrics`` on ``host`` from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.rstrip("/") != "/metrics":
+                self.send_error(404)
+                return
+            body = tracer.prometheus().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer() -> Tracer:
+    """Returns the process-wide tracer, starting the metrics endpoint if ``METRICS_PORT`` is set."""
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer()
+            if METRICS_PORT:
+                serve_metrics(_tracer, METRICS_PORT)
+        return _tracer
+
+
+def trace(name: str, **attributes):
+    """Shorthand for ``get_tracer().span(name, **attributes)``."""
+    return get_tracer().span(name, **attributes)
+
+
+def current_span() -> Optional[Span]:
+    """The span of the innermost ``trace`` block, if any."""
+    return _current.get()
@@ -0,0 +1,186 @@
+import difflib
+import re
+import string
+import tempfile
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Dict, Any, List, Callable, Tuple
+
+from utils.file_poller import get_file_poller
+from utils.media import save_upload, split_media
+from utils.response_cache import generate_text
+from utils.scheduler import BATCH, in_lane
+from utils.upload_index import upload_path
+from utils.util import TRANSCRIPTION_PROMPT
+
+# Defaults for long-audio mode
+SEGMENT_SECONDS = 600
+OVERLAP_SECONDS = 20
+TRANSCRIBE_WORKERS = 4
+
+# Lines compared at each seam when aligning two neighbouring segments
+SEAM_LINES = 40
+SEAM_MATCH_RATIO = 0.75
+# Lines of a segment that may precede its overlap with the previous one (a cut-off utterance)
+SEAM_LEAD_LINES = 1
+
+# A timestamp such as "00:12:" or "[01:02:03]" is not a speaker
+_LINE_PATTERN = re.compile(r'^\s*(?!\[?\d{1,2}:\d{2})\[?([^\]:\n]{1,60}?)\]?\s*:\s*(.*)$')
+_GENERIC_SPEAKER = re.compile(r'^speaker\s+([a-z]{1,2}|\d+)$', re.IGNORECASE)
+_PUNCTUATION = str.maketrans('', '', string.punctuation)
+
+
+def parse_transcript(text: str) -> List[Tuple[Optional[str], str]]:
+    """Splits a transcript into ``(speaker, utterance)`` pairs, one per non-empty line."""
+    lines = []
+    for raw in text.splitlines():
+        if not raw.strip():
+            continue
+        match = _LINE_PATTERN.match(raw)
+        if match:
+            lines.append((match.group(1).strip(), match.group(2).strip()))
+        else:
+            lines.append((None, raw.strip()))
+    return lines
+
+
+def _normalize(utterance: str) -> str:
+    return " ".join(utterance.lower().translate(_PUNCTUATION).split())
+
+
+def _align_seam(previous: List[Tuple[Optional[str], str]], current: List[Tuple[Optional[str], str]]):
+    """
+    Finds the lines at the start of ``current`` that repeat the end of ``previous``.
+
+    The overlap must be a contiguous run of ``current`` that matches a suffix
+    of ``previous`` line by line. It may start after up to ``SEAM_LEAD_LINES``
+    lines, for an utterance cut in half by the segment boundary. A line that
+    merely resembles an earlier one further into ``current`` is not overlap.
+
+    Returns:
+        tuple: The number of leading lines of ``current`` that repeat the
+        overlap, and the matched ``(current_speaker, previous_speaker)`` pairs.
+    """
+    tail = previous[-SEAM_LINES:]
+    head = current[:SEAM_LINES]
+    tail_norm = [_normalize(text) for _, text in tail]
+    head_norm = [_normalize(text) for _, text in head]
+
+    def matches(i: int, j: int) -> bool:
+        return difflib.SequenceMatcher(None, head_norm[i], tail_norm[j]).ratio() >= SEAM_MATCH_RATIO
+
+    for lead in range(min(SEAM_LEAD_LINES, len(head) - 1) + 1):
+        # Longest suffix of the tail first
+        for start in range(len(tail)):
+            length = len(tail) - start
+            if lead + length > len(head):
+                continue
+            if all(matches(lead + k, start + k) for k in range(length)):
+                speaker_pairs = [
+                    (head[lead + k][0], tail[start + k][0]) for k in range(length)
+                    if head[lead + k][0] and tail[start + k][0]
+                ]
+                return lead + length, speaker_pairs
+    return 0, []
+
+
+def _next_generic_label(used: set) -> str:
+    for letter in string.ascii_uppercase:
+        label = f"Speaker {letter}"
+        if label not in used:
+            return label
+    return f"Speaker {len(used) + 1}"
+
+
+def stitch_transcripts(transcripts: List[str]) -> str:
+    """
+    Joins segment transcripts in order, dropping overlap and unifying speaker labels.
+
+    Lines at the start of a segment that repeat the end of the previous one are
+    removed. Speakers are mapped onto the labels already in use by voting over
+    the aligned overlap lines. An unmatched generic label ("Speaker B") keeps
+    its name unless another speaker of the segment was already mapped onto
+    it, in which case it gets a fresh label. Named speakers keep their names.
+    """
+    merged: List[Tuple[Optional[str], str]] = []
+    used_labels = set()
+    for transcript in transcripts:
+        lines = parse_transcript(transcript or "")
+        if not lines:
+            continue
+
+        skip, speaker_pairs = _align_seam(merged, lines) if merged else (0, [])
+
+        votes: Dict[str, Counter] = defaultdict(Counter)
+        for current_speaker, previous_speaker in speaker_pairs:
+            votes[current_speaker][previous_speaker] += 1
+        mapping = {speaker: counter.most_common(1)[0][0] for speaker, counter in votes.items()}
+
+        for speaker, _ in lines:
+            if speaker is None or speaker in mapping:
+                continue
+            if _GENERIC_SPEAKER.match(speaker) and speaker in mapping.values():
+                mapping[speaker] = _next_generic_label(used_labels | set(mapping.values()))
+            else:
+                mapping[speaker] = speaker
+
+        for speaker, text in lines[skip:]:
+            label = mapping.get(speaker, speaker)
+            if label:
+                used_labels.add(label)
+            merged.append((label, text))
+
+    return "\n".join(f"{speaker}: {text}" if speaker else text for speaker, text in merged)
+
+
+def _transcribe_segment(model, segment, use_cache: bool) -> str:
+    remote_file = upload_path(segment.path)
+    remote_file = get_file_poller().watch(remote_file).result()
+    if remote_file.state.name != "ACTIVE":
+        raise RuntimeError(f"Segment {segment.index} failed processing ({remote_file.state.name}).")
+    return generate_text(model, [remote_file, TRANSCRIPTION_PROMPT], use_cache=use_cache)
+
+
+def transcribe_long_audio(model, audio_file, segment_seconds: float = SEGMENT_SECONDS,
+                          overlap_seconds: float = OVERLAP_SECONDS, max_workers: int = TRANSCRIBE_WORKERS,
+                          use_cache: bool = True,
+                          progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+    """
+    Transcribes a long recording as overlapping segments processed concurrently.
+
+    Args:
+        model (GenerativeModel): The model used for transcription.
+        audio_file (UploadedFile): The Streamlit upload.
+        segment_seconds (float): Length of each segment.
+        overlap_seconds (float): Audio shared by neighbouring segments, used
+            to de-duplicate the seams and match speakers.
+        max_workers (int): Maximum number of segments in flight.
+        use_cache (bool): Whether segment responses may come from the cache.
+        progress_callback (callable, optional): Called as ``(done, total)``.
+
+    Returns:
+        dict: ``transcript`` with the stitched text, ``segments`` with the
+        number of segments and ``failed`` with ``(index, error)`` pairs.
+    """
+    with tempfile.TemporaryDirectory(prefix="long-audio-") as work_dir:
+        source = save_upload(audio_file, work_dir)
+        segments = split_media(source, segment_seconds, overlap_seconds, out_dir=work_dir, kind="audio")
+
+        transcripts: List[Optional[str]] = [None] * len(segments)
+        failed = []
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(in_lane(BATCH, _transcribe_segment), model, segment, use_cache): segment for segment in segments}
+            for done, future in enumerate(as_completed(futures), start=1):
+                segment = futures[future]
+                try:
+                    transcripts[segment.index] = future.result()
+                except Exception as e:
+                    failed.append((segment.index, str(e)))
+                if progress_callback is not None:
+                    progress_callback(done, len(segments))
+
+    return {
+        'transcript': stitch_transcripts([text for text in transcripts if text]),
+        'segments': len(segments),
+        'failed': sorted(failed),
+    }
@@ -0,0 +1,236 @@
+import datetime
+import hashlib
+import json
+import mimetypes
+import os
+import pathlib
+import threading
+from typing import Optional, Dict, Any
+
+import google.generativeai as genai
+
+from utils.scheduler import scheduled
+from utils.tracing import trace
+
+# File mapping content hashes to remote Gemini file handles
+UPLOAD_INDEX_FILE = os.getenv('UPLOAD_INDEX_FILE', '.cache/upload_index.json')
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def hash_file(file) -> str:
+    """
+    Computes the SHA-256 of a file-like object without changing its position.
+
+    Args:
+        file (IO): A seekable binary file, e.g. a Streamlit UploadedFile.
+
+    Returns:
+        str: The hex digest of the file contents.
+    """
+    digest = hashlib.sha256()
+    position = file.tell()
+    file.seek(0)
+    for chunk in iter(lambda: file.read(HASH_CHUNK_SIZE), b""):
+        digest.update(chunk)
+    file.seek(position)
+    return digest.hexdigest()
+
+
+def _to_iso(value) -> Optional[str]:
+    if value is None:
+        return None
+    if isinstance(value, datetime.datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=datetime.timezone.utc)
+        return value.isoformat()
+    return str(value)
+
+
+class UploadIndex:
+    """Persistent, process-wide index of uploaded content keyed by SHA-256."""
+
+    def __init__(self, path: str = UPLOAD_INDEX_FILE):
+        self.path = pathlib.Path(path)
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict[str, Any]] = {}
+        self._mtime = None
+        self._load()
+
+    def _load(self):
+        """Reload the index from disk if another process changed it."""
+        try:
+            mtime = self.path.stat().st_mtime
+        except FileNotFoundError:
+            return
+        if mtime == self._mtime:
+            return
+        try:
+            with open(self.path, 'r') as f:
+                self._entries = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            self._entries = {}
+        self._mtime = mtime
+
+    def _save(self):
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix(f".{os.getpid()}.tmp")
+        with open(tmp_path, 'w') as f:
+            json.dump(self._entries, f, indent=4)
+        os.replace(tmp_path, self.path)
+        self._mtime = self.path.stat().st_mtime
+
+    @staticmethod
+    def _is_expired(entry: Dict[str, Any]) -> bool:
+        expiration_time = entry.get('expiration_time')
+        if not expiration_time:
+            return False
+        expires = datetime.datetime.fromisoformat(expiration_time)
+        return expires <= datetime.datetime.now(datetime.timezone.utc)
+
+    def lookup(self, sha256: str):
+        """
+        Returns the live remote file for the given content hash.
+
+        Expired entries and entries whose remote file is gone or FAILED are
+        dropped, so a stale handle is never returned.
+
+        Args:
+            sha256 (str): Hex digest of the content.
+
+        Returns:
+            File: The remote Gemini file (ACTIVE or still PROCESSING), or None.
+        """
+        with self._lock:
+            self._load()
+            entry = self._entries.get(sha256)
+        if entry is None:
+            return None
+
+        if self._is_expired(entry):
+            self.remove(sha256)
+            return None
+
+        try:
+            remote_file = scheduled('files', genai.get_file, entry['name'])
+        except Exception:
+            self.remove(sha256)
+            return None
+
+        if remote_file.state.name not in ("ACTIVE", "PROCESSING"):
+            self.remove(sha256)
+            return None
+
+        if remote_file.state.name != entry.get('state'):
+            self.record(sha256, remote_file)
+        return remote_file
+
+    def record(self, sha256: str, remote_file):
+        """Stores or refreshes the entry for a remote file."""
+        entry = {
+            'name': remote_file.name,
+            'display_name': remote_file.display_name,
+            'state': remote_file.state.name,
+            'size_bytes': remote_file.size_bytes,
+            'expiration_time': _to_iso(remote_file.expiration_time),
+        }
+        with self._lock:
+            self._load()
+            self._entries[sha256] = entry
+            self._save()
+
+    def update_state(self, remote_file):
+        """Refreshes the stored state of a remote file, matched by name."""
+        with self._lock:
+            self._load()
+            changed = False
+            for sha256, entry in list(self._entries.items()):
+                if entry['name'] != remote_file.name:
+                    continue
+                if remote_file.state.name in ("ACTIVE", "PROCESSING"):
+                    entry['state'] = remote_file.state.name
+                else:
+                    del self._entries[sha256]
+                changed = True
+            if changed:
+                self._save()
+
+    def remove(self, sha256: str):
+        """Drops the entry for a content hash."""
+        with self._lock:
+            self._load()
+            if self._entries.pop(sha256, None) is not None:
+                self._save()
+
+    def remove_names(self, names):
+        """Drops all entries pointing at the given remote file names."""
+        names = set(names)
+        with self._lock:
+            self._load()
+            stale = [sha256 for sha256, entry in self._entries.items() if entry['name'] in names]
+            for sha256 in stale:
+                del self._entries[sha256]
+            if stale:
+                self._save()
+
+    def prune(self) -> int:
+        """Removes all expired entries and returns how many were dropped."""
+        with self._lock:
+            self._load()
+            expired = [sha256 for sha256, entry in self._entries.items() if self._is_expired(entry)]
+            for sha256 in expired:
+                del self._entries[sha256]
+            if expired:
+                self._save()
+        return len(expired)
+
+
+def upload_stream(file, mime_type: str, display_name: Optional[str] = None):
+    """
+    Uploads a binary stream, reusing the remote file if the content is known.
+
+    Args:
+        file (IO): A seekable binary stream positioned anywhere.
+        mime_type (str): MIME type of the content.
+        display_name (str, optional): Display name of the remote file.
+
+    Returns:
+        File: The remote Gemini file, possibly still PROCESSING.
+    """
+    upload_index = get_upload_index()
+    with trace('upload') as span:
+        sha256 = hash_file(file)
+        cached_file = upload_index.lookup(sha256)
+        if cached_file is not None:
+            span.set(cache_hit=True, bytes_sent=0)
+            return cached_file
+
+        span.set(cache_hit=False, bytes_sent=file.seek(0, os.SEEK_END))
+        file.seek(0)
+        uploaded_file = scheduled(
+            'upload', genai.upload_file, file, mime_type=mime_type, display_name=display_name, resumable=True
+        )
+        file.seek(0)
+    upload_index.record(sha256, uploaded_file)
+    return uploaded_file
+
+
+def upload_path(path, mime_type: Optional[str] = None):
+    """Uploads a local file through ``upload_stream``."""
+    path = pathlib.Path(path)
+    mime_type = mime_type or mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    with open(path, 'rb') as f:
+        return upload_stream(f, mime_type=mime_type, display_name=path.name)
+
+
+_index = None
+_index_lock = threading.Lock()
+
+
+def get_upload_index() -> UploadIndex:
+    """Returns the process-wide upload index shared by all sessions."""
+    global _index
+    with _index_lock:
+        if _index is None:
+            _index = UploadIndex()
+        return _index
@@ -1,38 +1,60 @@
-import pathlib
-import google.generativeai as genai
-from typing import Optional, Dict, Any, List
+from typing import Optional, Dict, Any
 import json
 import time
-from PIL import Image
 import streamlit as st
-import re
-import PIL.Image
-from PIL import Image, ImageDraw
-import os
+import mimetypes
+import threading
+from utils.file_poller import get_file_poller
+from utils.markdown import remove_markdown
+from utils.prompts import METADATA_PROMPT, TRANSCRIPTION_PROMPT
+from utils.renderer import get_renderer
+from utils.response_cache import generate_text, get_response_cache, request_key
+from utils.scheduler import scheduled_stream
+from utils.tracing import get_tracer, trace
+from utils.upload_index import get_upload_index, upload_stream
 
 def upload_file_to_gemini(file) -> Optional[Dict[str, Any]]:
-    """Uploads a file to Google Gemini."""
+    """
+    Uploads a file to Google Gemini.
+
+    The Streamlit upload is handed to the File API as a stream using the
+    resumable protocol, so the bytes are sent in chunks straight from the
+    uploader buffer without a temporary copy on disk. Content that was already
+    uploaded (by any session) is looked up by its SHA-256 and the existing
+    remote file is reused instead of sending the bytes again.
+
+    Args:
+        file (UploadedFile): The file returned by ``st.file_uploader``.
+
+    Returns:
+        File: The uploaded Gemini file, or None if the upload failed.
+    """
     try:
-        temp_dir = pathlib.Path("temp")
-        temp_dir.mkdir(exist_ok=True)
-        file_path = temp_dir / file.name
-        with open(file_path, "wb") as f:
-            f.write(file.getbuffer())
-        uploaded_file = genai.upload_file(file_path)
-        os.remove(file_path)  # Remove the file from local after upload
-        return uploaded_file
+        mime_type = file.type or mimetypes.guess_type(file.name)[0] or "application/octet-stream"
+        return upload_stream(file, mime_type=mime_type, display_name=file.name)
     except Exception as e:
         st.error(f"Error uploading file: {e}")
         return None
 
 
-def poll_file_processing(uploaded_file) -> Optional[Dict[str, Any]]:
-    """Polls the status of the uploaded file until processing is complete."""
+def poll_file_processing(uploaded_file, timeout: Optional[float] = None) -> Optional[Dict[str, Any]]:
+    """
+    Waits until the uploaded file has finished processing.
+
+    The wait is delegated to the shared background poller, which backs off
+    between checks and batches status refreshes across sessions.
+
+    Args:
+        uploaded_file (File): The Gemini file returned by the upload.
+        timeout (float, optional): Seconds to wait before giving up.
+
+    Returns:
+        File: The ACTIVE file, or None if processing failed or timed out.
+    """
     try:
         with st.spinner('Processing file...'):
-            while uploaded_file.state.name == "PROCESSING":
-                time.sleep(1)
-                uploaded_file = genai.get_file(uploaded_file.name)
+            uploaded_file = get_file_poller().watch(uploaded_file, timeout=timeout).result()
+            get_upload_index().update_state(uploaded_file)
             if uploaded_file.state.name == "ACTIVE":
                 st.success(" File processing completed.")
                 return uploaded_file
@@ -42,18 +64,21 @@ def poll_file_processing(uploaded_file) -> Optional[Dict[str, Any]]:
             else:
                 st.error(f"Unexpected file state: {uploaded_file.state.name}")
                 return None
+    except TimeoutError as te:
+        st.error(f"File processing timed out: {te}")
+        return None
     except Exception as e:
         st.error(f"Error during file processing: {e}")
         return None
 
 
-def generate_metadata(model: Any, video_file) -> Optional[Dict[str, Any]]:
+def generate_metadata(model: Any, video_file, use_cache: bool = True) -> Optional[Dict[str, Any]]:
     """Generates metadata for the uploaded video using the Generative AI model."""
     try:
-        prompt = "Provide the details based on provided response schema"
-        result = model.generate_content([video_file, prompt])
-        if result.text:
-            metadata = json.loads(result.text)
+        result_text = generate_text(model, [video_file, METADATA_PROMPT], use_cache=use_cache)
+        if result_text:
+            with trace('parse'):
+                metadata = json.loads(result_text)
             return metadata
         else:
             st.error("No response received from the model.")
@@ -66,19 +91,13 @@ def generate_metadata(model: Any, video_file) -> Optional[Dict[str, Any]]:
         return None
 
 
-def generate_transcription(model: Any, audio_file) -> Optional[str]:
+def generate_transcription(model: Any, audio_file, use_cache: bool = True) -> Optional[str]:
     """Generates transcription for the uploaded audio using the Generative AI model."""
     try:
-        prompt = """
-Please transcribe this interview in the following format:
-[Speaker Name or Speaker A/B]: [Dialogue or caption].
-If a speaker's name is mentioned or can be identified in the audio, map the actual names accordingly.
-If no names are given, use Speaker A, Speaker B, etc.
-Ensure the transcription captures all spoken words accurately, including filler words where appropriate.
-"""
-        responses = model.generate_content([audio_file, prompt])
-        if responses.text:
-            transcription = responses.text.strip()
+        prompt = TRANSCRIPTION_PROMPT
+        responses_text = generate_text(model, [audio_file, prompt], use_cache=use_cache)
+        if responses_text:
+            transcription = responses_text.strip()
             return transcription
         else:
             st.error("No response received from the model.")
@@ -88,47 +107,115 @@ Ensure the transcription captures all spoken words accurately, including filler
         return None
 
 
-def remove_markdown(text):
+def chunk_text(chunk) -> str:
     """
-    Remove Markdown formatting from the given text.
+    Returns the text of a streamed response chunk, or ``""`` when it has none.
+
+    Closing chunks may carry only usage metadata or a finish reason; on those
+    ``chunk.text`` (and even ``chunk.parts``) raises instead of returning nothing.
+    """
+    if not chunk.candidates or not chunk.candidates[0].content.parts:
+        return ""
+    return chunk.text
+
+
+def stream_transcription(model: Any, audio_file, cancel_event: Optional[threading.Event] = None,
+                         metrics: Optional[Dict[str, Any]] = None):
+    """
+    Streams the transcription of the uploaded audio chunk by chunk.
 
     Args:
-        text (str): The input text containing Markdown.
+        model (GenerativeModel): The model used for transcription.
+        audio_file (File): The ACTIVE Gemini file of the audio.
+        cancel_event (threading.Event, optional): Stops the stream once set.
+        metrics (dict, optional): Filled with ``time_to_first_token``,
+            ``total_time``, ``chunks``, ``cancelled`` and ``error`` (the
+            message of the exception that ended the stream, if any).
 
-    Returns:
-        str: The text without any Markdown formatting.
+    Yields:
+        str: Transcript text as it is generated.
     """
-    # Remove headers (e.g., ###, ##, #)
-    text = re.sub(r'(^|\s)#+\s+', '', text)
-    
-    # Remove emphasis (bold, italic, strikethrough)
-    text = re.sub(r'(\*{1,2}|_{1,2}|~~)(.*?)\1', r'\2', text)
-    
-    # Remove code blocks with language specifiers (e.g., ```json)
-    text = re.sub(r'```[a-zA-Z]*\n([\s\S]*?)\n```', r'\1', text)  
-    
-    # Remove inline code
-    text = re.sub(r'`{1,3}([^`]*)`{1,3}', r'\1', text)
-    
-    # Remove links [text](url)
-    text = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', text)
-    
-    # Remove images ![alt text](url)
-    text = re.sub(r'!\[([^\]]*)\]\([^\)]+\)', r'\1', text)
-    
-    # Remove blockquotes
-    text = re.sub(r'^>\s+', '', text, flags=re.MULTILINE)
-    
-    # Remove horizontal rules (---, ***, ___)
-    text = re.sub(r'(^|\n)(-{3,}|_{3,}|\*{3,})(\n|$)', r'\1', text)
-    
-    # Remove lists (unordered and ordered)
-    text = re.sub(r'(^|\n)(\s*[-+*]|\d+\.)\s+', r'\1', text)
+    metrics = {} if metrics is None else metrics
+    metrics.update({'time_to_first_token': None, 'total_time': None, 'chunks': 0, 'cancelled': False, 'error': None})
+    contents = [audio_file, TRANSCRIPTION_PROMPT]
+    started = time.perf_counter()
+    parts = []
+    completed = False
+    span = get_tracer().start('generate', stream=True, cache_hit=False, bytes_sent=0)
+    error = None
+    # Holds a scheduler slot until closed
+    response = scheduled_stream('generate', model.generate_content, contents, stream=True)
+    try:
+        for chunk in response:
+            if cancel_event is not None and cancel_event.is_set():
+                metrics['cancelled'] = True
+                break
+            span.record_usage(chunk)
+            text = chunk_text(chunk)
+            if not text:
+                continue
+            if metrics['time_to_first_token'] is None:
+                metrics['time_to_first_token'] = time.perf_counter() - started
+            metrics['chunks'] += 1
+            parts.append(text)
+            yield text
+        else:
+            completed = True
+    except Exception as e:
+        error = e
+        metrics['error'] = str(e) or type(e).__name__
+        raise
+    finally:
+        response.close()
+        span.end(error)
+        metrics['total_time'] = time.perf_counter() - started
+        if not completed:
+            # An error is reported in metrics['error'], not as a cancellation
+            metrics['cancelled'] = error is None
+        elif parts:
+            # A finished stream is as good as a blocking call, so later requests can reuse it
+            get_response_cache().put(request_key(model, contents), "".join(parts))
 
-    # Remove any remaining Markdown-specific characters
-    text = re.sub(r'[*_~`]', '', text)
 
-    return text.strip()
+def validate_bounding_boxes(bounding_boxes):
+  """
+  Validates already decoded bounding boxes.
+  
+  Args:
+      bounding_boxes (list of dict): Decoded boxes from the model response.
+      
+  Returns:
+      list of dict: The same boxes, once validated.
+      
+  Raises:
+      ValueError: If the structure is incorrect.
+  """
+  # Validate that the response is a list
+  if not isinstance(bounding_boxes, list):
+      raise ValueError("Response JSON is not a list.")
+  
+  # Define the required keys and their expected types
+  required_keys = {
+      "name": str,
+      "ymin": (int, float),
+      "xmin": (int, float),
+      "ymax": (int, float),
+      "xmax": (int, float)
+  }
+  
+  # Validate each bounding box
+  for box in bounding_boxes:
+      # Check if all required keys are present
+      missing_keys = [key for key in required_keys if key not in box]
+      if missing_keys:
+          raise ValueError(f"Bounding box missing keys: {missing_keys} in {box}")
+      
+      # Validate the type of each key
+      for key, expected_type in required_keys.items():
+          if not isinstance(box[key], expected_type):
+              raise ValueError(f"Bounding box key '{key}' has incorrect type in {box}. Expected {expected_type}, got {type(box[key])}.")
+  
+  return bounding_boxes
 
 
 def parse_bounding_boxes(response_text):
@@ -146,35 +233,9 @@ def parse_bounding_boxes(response_text):
   """
   try:
       bounding_boxes = json.loads(response_text)
-      
-      # Validate that the response is a list
-      if not isinstance(bounding_boxes, list):
-          raise ValueError("Response JSON is not a list.")
-      
-      # Define the required keys and their expected types
-      required_keys = {
-          "name": str,
-          "ymin": (int, float),
-          "xmin": (int, float),
-          "ymax": (int, float),
-          "xmax": (int, float)
-      }
-      
-      # Validate each bounding box
-      for box in bounding_boxes:
-          # Check if all required keys are present
-          missing_keys = [key for key in required_keys if key not in box]
-          if missing_keys:
-              raise ValueError(f"Bounding box missing keys: {missing_keys} in {box}")
-          
-          # Validate the type of each key
-          for key, expected_type in required_keys.items():
-              if not isinstance(box[key], expected_type):
-                  raise ValueError(f"Bounding box key '{key}' has incorrect type in {box}. Expected {expected_type}, got {type(box[key])}.")
-      
-      return bounding_boxes
   except json.JSONDecodeError as e:
       raise ValueError(f"Invalid JSON response: {e}")
+  return validate_bounding_boxes(bounding_boxes)
 
 def convert_normalized_to_pixel(bounding_boxes, image_width, image_height):
   """
@@ -218,6 +279,9 @@ def convert_normalized_to_pixel(bounding_boxes, image_width, image_height):
 def draw_bounding_boxes(image, bounding_boxes, output_path=None):
     """
     Draws multiple bounding boxes on the image with labeled text.
+
+    Line width and font size scale with the image, and fonts and label
+    sprites are cached by the shared ``BoxRenderer``.
     
     Args:
         image (PIL.Image.Image): The original image.
@@ -227,52 +291,9 @@ def draw_bounding_boxes(image, bounding_boxes, output_path=None):
     Returns:
         PIL.Image.Image: Image with bounding boxes and labels drawn.
     """
-    draw = ImageDraw.Draw(image)
-    
-    # You may need to adjust the font size based on your needs
-    try:
-        from PIL import ImageFont
-        font = ImageFont.truetype("arial.ttf", 20)
-    except:
-        font = ImageFont.load_default()
-    
-    for idx, box in enumerate(bounding_boxes, 1):
-        xmin = box['xmin']
-        ymin = box['ymin']
-        xmax = box['xmax']
-        ymax = box['ymax']
-        name = box['name']
-        
-        # Draw the red bounding box
-        draw.rectangle([xmin, ymin, xmax, ymax], outline="red", width=1)
-        
-        # Prepare the label text
-        label_text = f"{name}"
-        
-        # Get text size
-        text_bbox = draw.textbbox((0, 0), label_text, font=font)
-        text_width = text_bbox[2] - text_bbox[0]
-        text_height = text_bbox[3] - text_bbox[1]
-        
-        # Calculate text position (above the bounding box)
-        text_x = xmin
-        text_y = max(0, ymin - text_height - 2)  # 2 pixels padding
-        
-        # Draw yellow background for text
-        draw.rectangle(
-            [
-                text_x - 2,  # 2 pixels padding
-                text_y - 2,
-                text_x + text_width + 2,
-                text_y + text_height + 2
-            ],
-            fill="yellow"
-        )
-        
-        # Draw black text on yellow background
-        draw.text((text_x, text_y), label_text, fill="black", font=font)
+    image = get_renderer().render(image, bounding_boxes)
     
     if output_path:
         image.save(output_path)
         print(f"Annotated image saved at '{output_path}'.")
-    return image
\ No newline at end of file
+    return image
@@ -0,0 +1,188 @@
+import json
+import tempfile
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Optional, Dict, Any, List, Callable
+
+from utils.file_poller import get_file_poller
+from utils.media import Segment, plan_segments, probe_duration, save_upload, split_media
+from utils.response_cache import generate_text, get_response_cache, request_key
+from utils.scheduler import BATCH, in_lane
+from utils.tracing import trace
+from utils.upload_index import hash_file, upload_path
+
+# Defaults for windowed video analysis
+WINDOW_SECONDS = 300
+ANALYSIS_WORKERS = 4
+
+WINDOW_PROMPT = (
+    "This clip is the part from {start} to {end} of a longer video. "
+    "Provide the details based on provided response schema, describing this clip only."
+)
+
+REDUCE_PROMPT = """
+The following are summaries of consecutive parts of one video, in order.
+Write a single short summary (two or three sentences) of the whole video.
+Return only the summary text.
+
+{summaries}
+"""
+
+
+def _timestamp(seconds: float) -> str:
+    minutes, seconds = divmod(int(seconds), 60)
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours:d}:{minutes:02d}:{seconds:02d}" if hours else f"{minutes:d}:{seconds:02d}"
+
+
+def _window_key(model, source_sha256: str, start: float, end: float) -> str:
+    """Cache key of one window, independent of how ffmpeg encodes the cut."""
+    prompt = WINDOW_PROMPT.format(start=_timestamp(start), end=_timestamp(end))
+    return request_key(model, [f"window:{source_sha256}:{start:.3f}:{end:.3f}", prompt])
+
+
+def _analyze_window(model, segment: Segment, key: str) -> Dict[str, Any]:
+    remote_file = upload_path(segment.path)
+    remote_file = get_file_poller().watch(remote_file).result()
+    if remote_file.state.name != "ACTIVE":
+        raise RuntimeError(f"Window {segment.index} failed processing ({remote_file.state.name}).")
+    prompt = WINDOW_PROMPT.format(start=_timestamp(segment.start), end=_timestamp(segment.end))
+    result_text = generate_text(model, [remote_file, prompt], use_cache=False)
+    with trace('parse'):
+        metadata = json.loads(result_text)
+    get_response_cache().put(key, result_text)
+    return metadata
+
+
+def merge_window_results(windows: List[Dict[str, Any]], starts: List[float], total_duration: float,
+                         reduce_model=None) -> Dict[str, Any]:
+    """
+    Reduces per-window VideoAnalysis results into one VideoAnalysis.
+
+    Args:
+        windows (list of dict): Window results in playback order.
+        starts (list of float): Start time of each window in seconds.
+        total_duration (float): Duration of the full video in seconds.
+        reduce_model (GenerativeModel, optional): Text model used to condense
+            the window summaries into ``small_summary``.
+
+    Returns:
+        dict: The merged VideoAnalysis.
+    """
+    if not windows:
+        return {}
+
+    titles = Counter(w.get('title') for w in windows if w.get('title'))
+    names = Counter(w.get('name') for w in windows if w.get('name'))
+
+    # Tags ranked by how many windows mention them, ties in first-seen order
+    tag_counts = Counter()
+    first_seen = {}
+    spelling = {}
+    for w in windows:
+        for tag in w.get('tags') or []:
+            key = tag.strip().lower()
+            if not key:
+                continue
+            tag_counts[key] += 1
+            first_seen.setdefault(key, len(first_seen))
+            spelling.setdefault(key, tag.strip())
+    tags = [spelling[key] for key in sorted(tag_counts, key=lambda k: (-tag_counts[k], first_seen[k]))]
+
+    summary = "\n\n".join(
+        f"[{_timestamp(start)}] {w['summary']}" for w, start in zip(windows, starts) if w.get('summary')
+    )
+    small_summaries = [w['small_summary'] for w in windows if w.get('small_summary')]
+    small_summary = " ".join(small_summaries)
+    if reduce_model is not None and len(small_summaries) > 1:
+        try:
+            small_summary = generate_text(
+                reduce_model, [REDUCE_PROMPT.format(summaries="\n".join(small_summaries))]
+            ).strip() or small_summary
+        except Exception:
+            pass
+
+    return {
+        'name': names.most_common(1)[0][0] if names else windows[0].get('name', ''),
+        'title': titles.most_common(1)[0][0] if titles else windows[0].get('title', ''),
+        'total_duration': round(total_duration, 2),
+        'summary': summary,
+        'small_summary': small_summary,
+        'tags': tags,
+    }
+
+
+def analyze_video_windows(model, video_file, window_seconds: float = WINDOW_SECONDS,
+                          max_workers: int = ANALYSIS_WORKERS, use_cache: bool = True, reduce_model=None,
+                          progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+    """
+    Analyses a video as time windows processed concurrently and merges the results.
+
+    Each window result is cached under the hash of the source video and the
+    window bounds, so a rerun after a partial failure only cuts, uploads and
+    analyses the windows that are still missing.
+
+    Args:
+        model (GenerativeModel): Model configured with the VideoAnalysis schema.
+        video_file (UploadedFile): The Streamlit upload.
+        window_seconds (float): Length of each window.
+        max_workers (int): Maximum number of windows in flight.
+        use_cache (bool): Whether cached window results may be reused.
+        reduce_model (GenerativeModel, optional): Text model for the combined short summary.
+        progress_callback (callable, optional): Called as ``(done, total)``.
+
+    Returns:
+        dict: ``metadata`` with the merged VideoAnalysis (None if every
+        window failed), ``windows`` with the window count, ``cached`` with how
+        many came from the cache and ``failed`` with ``(index, error)`` pairs.
+    """
+    cache = get_response_cache()
+    source_sha256 = hash_file(video_file)
+
+    with tempfile.TemporaryDirectory(prefix="video-windows-") as work_dir:
+        source = save_upload(video_file, work_dir)
+        duration = probe_duration(source)
+        bounds = plan_segments(duration, window_seconds)
+        keys = [_window_key(model, source_sha256, start, end) for start, end in bounds]
+
+        results: List[Optional[Dict[str, Any]]] = [None] * len(bounds)
+        if use_cache:
+            for index, key in enumerate(keys):
+                cached = cache.get(key)
+                if cached is not None:
+                    results[index] = json.loads(cached)
+        cached_count = sum(result is not None for result in results)
+
+        missing = [index for index, result in enumerate(results) if result is None]
+        failed = []
+        done = cached_count
+        if progress_callback is not None:
+            progress_callback(done, len(bounds))
+
+        if missing:
+            segments = split_media(source, window_seconds, out_dir=work_dir, kind="video", only=missing)
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                futures = {
+                    executor.submit(in_lane(BATCH, _analyze_window), model, segments[index], keys[index]): index
+                    for index in missing
+                }
+                for future in as_completed(futures):
+                    index = futures[future]
+                    try:
+                        results[index] = future.result()
+                    except Exception as e:
+                        failed.append((index, str(e)))
+                    done += 1
+                    if progress_callback is not None:
+                        progress_callback(done, len(bounds))
+
+    completed = [(result, bounds[index][0]) for index, result in enumerate(results) if result is not None]
+    metadata = None
+    if completed:
+        metadata = merge_window_results(
+            [result for result, _ in completed],
+            [start for _, start in completed],
+            duration,
+            reduce_model=reduce_model
+        )
+    return {'metadata': metadata, 'windows': len(bounds), 'cached': cached_count, 'failed': sorted(failed)}
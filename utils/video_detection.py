@@ -0,0 +1,282 @@
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Optional, Dict, Any, List, Callable
+
+import cv2
+import numpy as np
+from PIL import Image
+
+from utils.detection import DETECTION_WORKERS, detect_objects
+from utils.renderer import BOX_COLOR, LABEL_BACKGROUND, LABEL_TEXT
+from utils.scheduler import BATCH, in_lane
+
+# Histogram distance (0-1) between consecutive frames that counts as a scene change
+SCENE_CHANGE_THRESHOLD = float(os.getenv('SCENE_CHANGE_THRESHOLD', '0.35'))
+# Keyframes closer than this are merged, so fast motion does not cause bursts of calls
+MIN_KEYFRAME_GAP_SECONDS = 0.5
+# Frames are scored at this size and tracked at most at this longest edge
+SCENE_SCORE_SIZE = (160, 90)
+TRACK_MAX_EDGE = 640
+# Boxes whose tracked points fall below this count are dropped until the next keyframe
+MIN_TRACK_POINTS = 3
+
+_LK_PARAMS = dict(winSize=(21, 21), maxLevel=3, criteria=(cv2.TERM_CRITERIA_EPS | cv2.TERM_CRITERIA_COUNT, 20, 0.03))
+
+
+def _bgr(color) -> tuple:
+    return int(color[2]), int(color[1]), int(color[0])
+
+
+def scene_histogram(frame: np.ndarray) -> np.ndarray:
+    """Returns the normalized hue/saturation histogram used for scene-change scoring."""
+    small = cv2.resize(frame, SCENE_SCORE_SIZE, interpolation=cv2.INTER_AREA)
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    histogram = cv2.calcHist([hsv], [0, 1], None, [16, 8], [0, 180, 0, 256])
+    return cv2.normalize(histogram, histogram).flatten()
+
+
+def scene_change_score(previous: np.ndarray, current: np.ndarray) -> float:
+    """Bhattacharyya distance between two scene histograms: 0 for identical, 1 for disjoint."""
+    return float(cv2.compareHist(previous, current, cv2.HISTCMP_BHATTACHARYYA))
+
+
+class BoxTracker:
+    """
+    Carries boxes from a keyframe to later frames with Lucas-Kanade optical flow.
+
+    Corner features are picked inside every box; on each frame all points are
+    tracked in one ``calcOpticalFlowPyrLK`` call and a box follows the median
+    motion and scale change of its points. Boxes without trackable texture
+    stay in place, boxes that lose their points are dropped.
+    """
+
+    def __init__(self, frame: np.ndarray, boxes: List[Dict[str, Any]]):
+        height, width = frame.shape[:2]
+        self.scale = min(1.0, TRACK_MAX_EDGE / max(width, height))
+        self.size = (width, height)
+        # Coordinates stay fractional between frames so rounding does not accumulate
+        self.boxes = [dict(box) for box in boxes]
+        self._previous = self._gray(frame)
+        self._points: List[Optional[np.ndarray]] = [self._features(box) for box in self.boxes]
+
+    def _gray(self, frame: np.ndarray) -> np.ndarray:
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        if self.scale < 1.0:
+            gray = cv2.resize(gray, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA)
+        return gray
+
+    def _features(self, box: Dict[str, Any]) -> Optional[np.ndarray]:
+        mask = np.zeros_like(self._previous)
+        x0, y0 = int(box['xmin'] * self.scale), int(box['ymin'] * self.scale)
+        x1, y1 = int(box['xmax'] * self.scale), int(box['ymax'] * self.scale)
+        mask[y0:y1, x0:x1] = 255
+        points = cv2.goodFeaturesToTrack(self._previous, maxCorners=30, qualityLevel=0.01, minDistance=3, mask=mask)
+        return points if points is not None and len(points) >= MIN_TRACK_POINTS else None
+
+    def update(self, frame: np.ndarray) -> List[Dict[str, Any]]:
+        """Moves the boxes onto ``frame`` and returns them in pixel coordinates."""
+        gray = self._gray(frame)
+        tracked = [index for index, points in enumerate(self._points) if points is not None]
+        if tracked:
+            previous_points = np.concatenate([self._points[index] for index in tracked])
+            next_points, status, _ = cv2.calcOpticalFlowPyrLK(self._previous, gray, previous_points, None, **_LK_PARAMS)
+            status = status.reshape(-1).astype(bool)
+            offset = 0
+            lost = []
+            for index in tracked:
+                count = len(self._points[index])
+                ok = status[offset:offset + count]
+                before = previous_points[offset:offset + count][ok].reshape(-1, 2)
+                after = next_points[offset:offset + count][ok].reshape(-1, 2)
+                offset += count
+                if len(after) < MIN_TRACK_POINTS:
+                    lost.append(index)
+                    continue
+                self._move(self.boxes[index], before, after)
+                self._points[index] = after.reshape(-1, 1, 2)
+            for index in sorted(lost, reverse=True):
+                del self.boxes[index]
+                del self._points[index]
+        self._previous = gray
+        return [
+            dict(box, xmin=int(box['xmin']), ymin=int(box['ymin']), xmax=int(box['xmax']), ymax=int(box['ymax']),
+                 tracked=True)
+            for box in self.boxes
+        ]
+
+    def _move(self, box: Dict[str, Any], before: np.ndarray, after: np.ndarray):
+        dx, dy = np.median(after - before, axis=0) / self.scale
+        spread_before = np.linalg.norm(before - before.mean(axis=0), axis=1)
+        spread_after = np.linalg.norm(after - after.mean(axis=0), axis=1)
+        valid = spread_before > 1e-3
+        zoom = float(np.median(spread_after[valid] / spread_before[valid])) if valid.any() else 1.0
+
+        width, height = self.size
+        center_x = (box['xmin'] + box['xmax']) / 2 + dx
+        center_y = (box['ymin'] + box['ymax']) / 2 + dy
+        half_width = (box['xmax'] - box['xmin']) * zoom / 2
+        half_height = (box['ymax'] - box['ymin']) * zoom / 2
+        box['xmin'] = min(max(0.0, center_x - half_width), width)
+        box['xmax'] = min(max(0.0, center_x + half_width), width)
+        box['ymin'] = min(max(0.0, center_y - half_height), height)
+        box['ymax'] = min(max(0.0, center_y + half_height), height)
+
+
+def annotate_frame(frame: np.ndarray, boxes: List[Dict[str, Any]]) -> np.ndarray:
+    """Draws boxes and labels onto a BGR frame in place, in the colors of ``utils.renderer``."""
+    height, width = frame.shape[:2]
+    line_width = max(1, round(min(width, height) / 400))
+    font_scale = max(0.4, min(width, height) / 1200)
+    for box in boxes:
+        cv2.rectangle(frame, (box['xmin'], box['ymin']), (box['xmax'], box['ymax']), _bgr(BOX_COLOR), line_width)
+        label = str(box['name'])
+        (text_width, text_height), baseline = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, font_scale, 1)
+        top = max(0, box['ymin'] - text_height - baseline - 4)
+        cv2.rectangle(frame, (box['xmin'], top), (box['xmin'] + text_width + 4, top + text_height + baseline + 4),
+                      _bgr(LABEL_BACKGROUND), -1)
+        cv2.putText(frame, label, (box['xmin'] + 2, top + text_height + 2), cv2.FONT_HERSHEY_SIMPLEX, font_scale,
+                    _bgr(LABEL_TEXT), 1, cv2.LINE_AA)
+    return frame
+
+
+def _open(path) -> cv2.VideoCapture:
+    capture = cv2.VideoCapture(str(path))
+    if not capture.isOpened():
+        raise ValueError(f"Cannot open video: {path}")
+    return capture
+
+
+def _open_writer(path, fps: float, size) -> cv2.VideoWriter:
+    # H.264 plays in browsers but is not in every OpenCV build; mp4v always is
+    for codec in ("avc1", "mp4v"):
+        writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*codec), fps, size)
+        if writer.isOpened():
+            return writer
+    raise ValueError(f"Cannot write video: {path}")
+
+
+def detect_video(model, path, object_name: str, scene_threshold: float = SCENE_CHANGE_THRESHOLD,
+                 max_keyframe_interval: float = 0.0, max_workers: int = DETECTION_WORKERS, use_cache: bool = True,
+                 preprocess: Optional[Dict[str, Any]] = None, output_video=None, output_json=None,
+                 progress_callback: Optional[Callable[[int, int], None]] = None) -> Dict[str, Any]:
+    """
+    Detects objects in a video, asking the model only about keyframes.
+
+    The first pass decodes the video, scores every frame against the previous
+    one and sends frames that start a new scene to ``detect_objects`` in the
+    background. The second pass decodes it again and carries the keyframe
+    boxes forward with a ``BoxTracker``, so the number of model calls follows
+    the number of scene changes rather than the frame count.
+
+    Args:
+        model (GenerativeModel): The detection model.
+        path (str or pathlib.Path): The local video file.
+        object_name (str): What to detect, or ``"all"``.
+        scene_threshold (float): Minimum scene-change score of a keyframe.
+        max_keyframe_interval (float): Seconds after which a keyframe is forced
+            even without a scene change; 0 disables it.
+        max_workers (int): Maximum number of detection requests in flight.
+        use_cache (bool): Whether detections may come from the caches.
+        preprocess (dict, optional): Keyword arguments for ``prepare_image``.
+        output_video (str, optional): Where to write the annotated video.
+        output_json (str, optional): Where to write the per-frame boxes.
+        progress_callback (callable, optional): Called as ``(steps done, total)``
+            over both passes.
+
+    Returns:
+        dict: ``frames`` with ``{'frame', 'time', 'keyframe', 'boxes'}`` per
+        frame, ``keyframes`` (frame indices), ``failed`` with ``(frame, error)``
+        pairs, ``fps``, ``frame_count`` and ``elapsed`` in seconds.
+
+    Raises:
+        ValueError: If the video cannot be read or the output cannot be written.
+    """
+    started = time.perf_counter()
+    capture = _open(path)
+    fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+    estimated_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT)) or 1
+    min_gap = max(1, int(MIN_KEYFRAME_GAP_SECONDS * fps))
+    max_gap = int(max_keyframe_interval * fps) if max_keyframe_interval > 0 else 0
+
+    futures = {}
+    frame_count = 0
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+        previous_histogram = None
+        last_keyframe = None
+        try:
+            while True:
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                histogram = scene_histogram(frame)
+                since_last = None if last_keyframe is None else frame_count - last_keyframe
+                is_keyframe = (
+                    since_last is None
+                    or (since_last >= min_gap and scene_change_score(previous_histogram, histogram) >= scene_threshold)
+                    or (max_gap and since_last >= max_gap)
+                )
+                if is_keyframe:
+                    image = Image.fromarray(cv2.cvtColor(frame, cv2.COLOR_BGR2RGB))
+                    futures[frame_count] = executor.submit(
+                        in_lane(BATCH, detect_objects), model, image, object_name, use_cache=use_cache, preprocess=preprocess
+                    )
+                    last_keyframe = frame_count
+                previous_histogram = histogram
+                frame_count += 1
+                if progress_callback is not None:
+                    progress_callback(frame_count, 2 * max(estimated_frames, frame_count))
+        finally:
+            capture.release()
+
+        if frame_count == 0:
+            raise ValueError(f"No frames could be decoded from {path}")
+
+        capture = _open(path)
+        writer = None
+        frames = []
+        failed = []
+        tracker = None
+        try:
+            for index in range(frame_count):
+                ok, frame = capture.read()
+                if not ok:
+                    break
+                future = futures.get(index)
+                keyframe = future is not None
+                if keyframe:
+                    try:
+                        boxes = future.result()
+                        tracker = BoxTracker(frame, boxes)
+                    except Exception as e:
+                        # Keep following the previous boxes rather than losing them
+                        failed.append((index, str(e)))
+                        boxes = tracker.update(frame) if tracker is not None else []
+                else:
+                    boxes = tracker.update(frame) if tracker is not None else []
+
+                frames.append({'frame': index, 'time': index / fps, 'keyframe': keyframe, 'boxes': boxes})
+                if output_video is not None:
+                    if writer is None:
+                        writer = _open_writer(output_video, fps, (frame.shape[1], frame.shape[0]))
+                    writer.write(annotate_frame(frame, boxes))
+                if progress_callback is not None:
+                    progress_callback(frame_count + index + 1, 2 * frame_count)
+        finally:
+            capture.release()
+            if writer is not None:
+                writer.release()
+
+    if output_json is not None:
+        with open(output_json, 'w') as f:
+            json.dump(frames, f)
+
+    return {
+        'frames': frames,
+        'keyframes': sorted(futures),
+        'failed': failed,
+        'fps': fps,
+        'frame_count': frame_count,
+        'elapsed': time.perf_counter() - started,
+    }